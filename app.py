@@ -1,17 +1,109 @@
-from flask import Flask, request, send_file, render_template
+from flask import Flask, Request, Response, request, send_file, render_template, url_for
 import os
-from src.doc_parser import DocParser
-from src.doc_rebuilder import DocRebuilder
+import io
+import hashlib
 import tempfile
 import logging
 from src.chord_transposer import ChordTransposer
+from src.pipeline import MODES, ConversionPool, QueueFullError, convert_bytes, convert_many, iter_zip, parse_keys
+from src.result_cache import ResultCache, digest_key
+from src.job_queue import JobQueue
+from src.metrics import Metrics
+from src.trace_hooks import logging_hook
+
+# 上傳文件不超過 DOCOP_SPILL_MB 時保留在內存中，超過時才寫入臨時文件
+SPILL_BYTES = int(float(os.environ.get('DOCOP_SPILL_MB', '16')) * 1024 * 1024)
+
+class SpooledUpload:
+    """上傳文件的存放位置，寫入時同時計算 SHA-256，緩存鍵不必再讀一遍上傳內容
+
+    請求不超過 SPILL_BYTES 時用內存，超過（或長度未知）時直接寫入具名臨時文件，關閉時刪除。
+    """
+
+    def __init__(self, total_content_length):
+        if total_content_length is not None and total_content_length <= SPILL_BYTES:
+            self.file = io.BytesIO()
+        else:
+            self.file = tempfile.NamedTemporaryFile(prefix='docop_upload_', suffix='.docx')
+        self.sha256 = hashlib.sha256()
+        self._closing_later = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def source(self):
+        """交給轉換的上傳內容：內存中的返回字節，已寫入磁盤的返回路徑，由工作進程直接讀取，不再讀回內存"""
+        if isinstance(self.file, io.BytesIO):
+            return self.file.getvalue()
+        self.file.flush()
+        return self.file.name
+
+    def digest(self) -> str:
+        """上傳內容的 SHA-256，與 content_digest 相同"""
+        return self.sha256.hexdigest()
+
+    def close_after(self, response):
+        """請求結束時不關閉，等響應發送完畢再關閉：流式響應在請求結束後才讀取上傳文件"""
+        self._closing_later = True
+        response.call_on_close(self.file.close)
+        return response
+
+    def close(self):
+        if not self._closing_later:
+            self.file.close()
+
+def spill_stream(total_content_length):
+    """上傳文件的存放位置，見 SpooledUpload"""
+    return SpooledUpload(total_content_length)
+
+class SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spill_stream(total_content_length)
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 設置 DOCOP_TRACE 環境變量時開啟調試追踪，否則熱點路徑上不做任何輸出
+TRACE_HOOK = logging_hook(logger, logging.INFO) if os.environ.get('DOCOP_TRACE') else None
+ChordTransposer.set_trace_hook(TRACE_HOOK)
+
+# 各階段耗時與計數，工作進程中的記錄由進程池合併，見 /metrics
+METRICS = Metrics()
+
+# 轉換進程池：DOCOP_POOL_WORKERS（0 表示在請求線程中執行）、DOCOP_QUEUE_SIZE、DOCOP_MAX_JOBS_PER_WORKER
+POOL = ConversionPool.from_env(trace=TRACE_HOOK is not None, metrics_sink=METRICS)
+# 隊列已滿時建議客戶端重試的等待秒數
+RETRY_AFTER = int(os.environ.get('DOCOP_RETRY_AFTER', '2'))
+
+# 轉換結果緩存：DOCOP_CACHE_DIR、DOCOP_CACHE_MEMORY_MB、DOCOP_CACHE_DISK_MB（0 表示只用內存）
+CACHE = ResultCache.from_env()
+# 解析結果緩存目錄：同一文件轉調到新調號時跳過解析，DOCOP_IR_CACHE_DIR 設為空字符串時關閉
+IR_CACHE_DIR = os.environ.get('DOCOP_IR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'docop_ir_cache')) or None
+
+# 異步轉換任務：DOCOP_JOB_DIR、DOCOP_JOB_WORKERS（0 表示不在本進程執行任務）、DOCOP_JOB_TTL、DOCOP_JOB_QUEUE_SIZE
+# 導入時不啟動工作線程（進程池的子進程也會導入本模塊），由入口調用 JOBS.start()：
+# 直接運行本文件時見文件末尾，gunicorn 見 gunicorn.conf.py，ASGI 見 asgi.lifespan
+JOBS = JobQueue.from_env(POOL, CACHE, IR_CACHE_DIR)
+
+def send_docx(output: bytes, cache_status: str):
+    """返回轉換後的文檔，X-Cache 標明是否命中緩存"""
+    response = send_file(
+        io.BytesIO(output),
+        as_attachment=True,
+        download_name='converted.docx',
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    )
+    response.headers['X-Cache'] = cache_status
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -20,61 +112,174 @@ def index():
 def convert():
     try:
         # 獲取上傳的文件和轉調參數
-        file = request.files['file']
+        with METRICS.time('upload'):
+            stream = request.files['file'].stream
+            upload = stream.source()
         from_key = request.form['fromKey']
         to_key = request.form['toKey']
+        # 轉換方式：rebuild 重建文檔，patch 直接在原文檔上改寫和弦
+        mode = request.form.get('mode', 'rebuild')
+        if mode not in MODES:
+            return {'error': f'不支持的轉換方式: {mode}'}, 400
         
-        # 創建臨時文件
-        with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_input:
-            file.save(temp_input.name)
-            
-        # 創建臨時 JSON 文件
-        temp_json = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
-        temp_output = tempfile.NamedTemporaryFile(suffix='.docx', delete=False)
+        # 相同文件與相同轉調的結果直接從緩存返回，不再解析
+        cache_key = digest_key(stream.digest(), from_key, to_key, mode)
+        output = CACHE.get(cache_key)
+        if output is not None:
+            return send_docx(output, 'HIT')
         
         try:
-            # 解析文檔
-            parser = DocParser()
-            data = parser.parse_docx(temp_input.name)
-            
-            # 轉調處理
-            transposer = ChordTransposer()
-            
-            # 遍歷所有段落和運行，處理和弦
-            for paragraph in data.get('paragraphs', []):
-                for run in paragraph.get('runs', []):
-                    if 'text' in run:
-                        run['text'] = transposer.transpose_text(
-                            run['text'],
-                            from_key=from_key,
-                            to_key=to_key,
-                            preserve_spaces=True
-                        )
-            
-            # 保存處理後的數據
-            parser.save_to_json(data, temp_json.name)
-            
-            # 重建文檔
-            rebuilder = DocRebuilder()
-            rebuilder.rebuild_docx(data, temp_output.name)
+            # 解析、轉調、重建在進程池中執行（文檔以字節傳遞，不經過臨時文件），等待中的任務已滿時立即返回 503
+            output = POOL.run(convert_bytes, upload, from_key, to_key, mode, IR_CACHE_DIR)
+            CACHE.put(cache_key, output)
             
             # 返回處理後的文件
-            return send_file(
-                temp_output.name,
-                as_attachment=True,
-                download_name='converted.docx',
-                mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            )
+            return send_docx(output, 'MISS')
             
-        finally:
-            # 清理臨時文件
-            os.unlink(temp_input.name)
-            os.unlink(temp_json.name)
-            os.unlink(temp_output.name)
+        except QueueFullError as e:
+            logger.warning(f"轉換隊列已滿: {str(e)}")
+            return {'error': '伺服器忙碌，請稍後再試'}, 503, {'Retry-After': str(RETRY_AFTER)}
             
     except Exception as e:
         logger.error(f"轉換失敗: {str(e)}")
         return {'error': str(e)}, 500
 
+@app.route('/api/convert/multi', methods=['POST'])
+def convert_multi():
+    """一次上傳轉調到多個調號，解析一次後並行重建，以 zip 流式返回"""
+    try:
+        with METRICS.time('upload'):
+            stream = request.files['file'].stream
+            upload = stream.source()
+        from_key = request.form['fromKey']
+        # 目標調號以逗號分隔，為空或 all 時轉出全部 12 個調
+        to_keys = parse_keys(request.form.get('toKeys'))
+        mode = request.form.get('mode', 'rebuild')
+        if mode not in MODES:
+            return {'error': f'不支持的轉換方式: {mode}'}, 400
+        
+        digest = stream.digest()
+        cache_keys = {to_key: digest_key(digest, from_key, to_key, mode) for to_key in to_keys}
+        cached = []
+        missing = []
+        for to_key in to_keys:
+            output = CACHE.get(cache_keys[to_key])
+            if output is not None:
+                cached.append((to_key, output))
+            else:
+                missing.append(to_key)
+        
+        results = iter(())
+        if missing:
+            try:
+                # 解析立即執行，之後的轉調與重建在返回響應時逐個完成
+                results = convert_many(POOL, upload, from_key, missing, mode, IR_CACHE_DIR)
+            except QueueFullError as e:
+                logger.warning(f"轉換隊列已滿: {str(e)}")
+                return {'error': '伺服器忙碌，請稍後再試'}, 503, {'Retry-After': str(RETRY_AFTER)}
+        
+        def entries():
+            errors = []
+            for to_key, output in cached:
+                yield f'converted_{to_key}.docx', output
+            for to_key, output in results:
+                if isinstance(output, Exception):
+                    logger.error(f"轉換到 {to_key} 失敗: {str(output)}")
+                    errors.append(f'{to_key}: {str(output)}')
+                    continue
+                CACHE.put(cache_keys[to_key], output)
+                yield f'converted_{to_key}.docx', output
+            if errors:
+                yield 'errors.txt', '\n'.join(errors).encode('utf-8')
+        
+        response = Response(
+            iter_zip(entries()),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=converted.zip'}
+        )
+        if mode == 'patch' and missing:
+            # patch 在返回響應時才逐個讀取上傳文件，臨時文件保留到響應發送完畢
+            stream.close_after(response)
+        return response
+            
+    except Exception as e:
+        logger.error(f"轉換失敗: {str(e)}")
+        return {'error': str(e)}, 500
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """提交異步轉換任務，立即返回任務 id；toKeys 轉出多個調號並打包為 zip，否則按 toKey 轉出單個文檔"""
+    try:
+        with METRICS.time('upload'):
+            stream = request.files['file'].stream
+            upload = stream.source()
+        from_key = request.form['fromKey']
+        mode = request.form.get('mode', 'rebuild')
+        if mode not in MODES:
+            return {'error': f'不支持的轉換方式: {mode}'}, 400
+        archive = 'toKeys' in request.form
+        to_keys = parse_keys(request.form['toKeys']) if archive else [request.form['toKey']]
+        
+        try:
+            job_id = JOBS.submit(upload, from_key, to_keys, mode, archive, digest=stream.digest())
+        except QueueFullError as e:
+            logger.warning(f"任務隊列已滿: {str(e)}")
+            return {'error': '伺服器忙碌，請稍後再試'}, 503, {'Retry-After': str(RETRY_AFTER)}
+        
+        location = url_for('job_status', job_id=job_id)
+        return {'id': job_id, 'status': 'queued', 'url': location}, 202, {'Location': location}
+        
+    except Exception as e:
+        logger.error(f"提交任務失敗: {str(e)}")
+        return {'error': str(e)}, 500
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """任務狀態與進度（已完成的調號數/總數），完成後 result 為下載地址"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return {'error': '任務不存在或已過期'}, 404
+    if job['status'] == 'done':
+        job['result'] = url_for('job_result', job_id=job_id)
+    return job
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return {'error': '任務不存在或已過期'}, 404
+    path = JOBS.result_path(job_id)
+    if path is None:
+        return {'error': f"任務尚未完成: {job['status']}"}, 409
+    if job['archive']:
+        return send_file(path, as_attachment=True, download_name='converted.zip', mimetype='application/zip')
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name='converted.docx',
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    )
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return CACHE.stats()
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的階段耗時直方圖、處理計數與結果緩存命中數"""
+    stats = CACHE.stats()
+    lines = [
+        '# TYPE docop_result_cache_hits_total counter',
+        f'docop_result_cache_hits_total{{tier="memory"}} {stats["memory_hits"]}',
+        f'docop_result_cache_hits_total{{tier="disk"}} {stats["disk_hits"]}',
+        '# TYPE docop_result_cache_misses_total counter',
+        f'docop_result_cache_misses_total {stats["misses"]}',
+    ]
+    body = METRICS.render_prometheus() + '\n'.join(lines) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # 調試模式下重載器的父進程只監視文件，由處理請求的子進程執行異步任務
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        JOBS.start()
     app.run(debug=True, host='0.0.0.0', port=5418) 
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+ASGI 入口：提供與 app.py 相同的 / 和 /api/convert
+
+上傳按塊接收並交給流式 multipart 解析器，文件與 app.py 相同：不超過 DOCOP_SPILL_MB 時保留在內存中，
+超過時直接寫入臨時文件並把路徑交給轉換，
+轉換交給 app.POOL 執行，結果按塊返回。慢速客戶端上傳或下載時只佔用一個協程，不佔用工作線程，
+因此單個進程可以同時服務大量慢速連接。進程池、緩存和統計與 app.py 共用同一套配置，
+異步任務的工作線程在 lifespan 啟動時開始、關閉時停止。
+
+運行：uvicorn asgi:app --host 0.0.0.0 --port 5418
+"""
+import os
+import json
+import asyncio
+from functools import partial
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+import app as wsgi
+from src.pipeline import MODES, QueueFullError, convert_bytes
+from src.result_cache import digest_key
+
+logger = wsgi.logger
+
+# 響應體每次發送的字節數
+CHUNK_SIZE = 64 * 1024
+# 關閉時等待異步任務工作線程退出的秒數
+JOB_STOP_TIMEOUT = 30
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html'), 'rb') as f:
+    INDEX_HTML = f.read()
+
+
+class HTTPError(Exception):
+    """直接以 JSON 錯誤返回的請求錯誤"""
+
+    def __init__(self, status: int, message: str, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    if path == '/' and method in ('GET', 'HEAD'):
+        await send_body(send, 200, [(b'content-type', b'text/html; charset=utf-8')], INDEX_HTML)
+    elif path == '/api/convert':
+        if method != 'POST':
+            await send_json(send, 405, {'error': 'Method Not Allowed'})
+        else:
+            await convert(scope, receive, send)
+    else:
+        await send_json(send, 404, {'error': 'Not Found'})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            wsgi.JOBS.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # 等待正在執行的異步任務完成，超時未完成的任務在租約過期後由其他進程重新執行
+            await asyncio.get_running_loop().run_in_executor(None, wsgi.JOBS.stop, JOB_STOP_TIMEOUT)
+            wsgi.POOL.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def convert(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    files = {}
+    try:
+        with wsgi.METRICS.time('upload'):
+            fields, files = await read_form(scope, receive)
+        content = files['file'].source()
+        from_key = fields['fromKey']
+        to_key = fields['toKey']
+        # 轉換方式：rebuild 重建文檔，patch 直接在原文檔上改寫和弦
+        mode = fields.get('mode', 'rebuild')
+        if mode not in MODES:
+            raise HTTPError(400, f'不支持的轉換方式: {mode}')
+
+        # 哈希在接收上傳時已經算好；讀取磁盤緩存不在事件循環中執行
+        cache_key = digest_key(files['file'].digest(), from_key, to_key, mode)
+        output = await loop.run_in_executor(None, wsgi.CACHE.get, cache_key)
+        cache_status = 'HIT'
+        if output is None:
+            cache_status = 'MISS'
+            try:
+                output = await run_conversion(loop, content, from_key, to_key, mode)
+            except QueueFullError as e:
+                logger.warning(f"轉換隊列已滿: {str(e)}")
+                raise HTTPError(503, '伺服器忙碌，請稍後再試', [(b'retry-after', str(wsgi.RETRY_AFTER).encode())])
+            await loop.run_in_executor(None, wsgi.CACHE.put, cache_key, output)
+    except HTTPError as e:
+        await send_json(send, e.status, {'error': str(e)}, e.headers)
+        return
+    except Exception as e:
+        logger.error(f"轉換失敗: {str(e)}")
+        await send_json(send, 500, {'error': str(e)})
+        return
+    finally:
+        # 寫入磁盤的上傳在轉換完成後刪除
+        for upload in files.values():
+            upload.close()
+
+    await send_body(send, 200, [
+        (b'content-type', DOCX_MIMETYPE.encode()),
+        (b'content-disposition', b'attachment; filename=converted.docx'),
+        (b'x-cache', cache_status.encode()),
+    ], output)
+
+
+async def run_conversion(loop, content: bytes, from_key: str, to_key: str, mode: str) -> bytes:
+    """在進程池中轉換；進程池在調用線程中執行任務時改用線程池，避免阻塞事件循環"""
+    if wsgi.POOL.workers == 0:
+        return await loop.run_in_executor(
+            None, partial(wsgi.POOL.run, convert_bytes, content, from_key, to_key, mode, wsgi.IR_CACHE_DIR))
+    return await asyncio.wrap_future(
+        wsgi.POOL.submit(convert_bytes, content, from_key, to_key, mode, wsgi.IR_CACHE_DIR))
+
+
+async def read_form(scope, receive):
+    """逐塊讀取 multipart 請求體，返回 (表單字段, 上傳文件)；請求超過 SPILL_BYTES 時文件寫入臨時文件"""
+    headers = dict(scope['headers'])
+    content_length = headers.get(b'content-length')
+    total_content_length = int(content_length) if content_length else None
+    content_type, options = parse_options_header(headers.get(b'content-type', b'').decode('latin-1'))
+    if content_type != 'multipart/form-data' or 'boundary' not in options:
+        raise HTTPError(400, '請求必須是 multipart/form-data')
+
+    decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+    fields, files = {}, {}
+    current = None
+    field_data = []
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise HTTPError(400, '客戶端已斷開連接')
+                decoder.receive_data(message.get('body', b''))
+                if not message.get('more_body', False):
+                    decoder.receive_data(None)
+            elif isinstance(event, File):
+                current = files[event.name] = wsgi.spill_stream(total_content_length)
+            elif isinstance(event, Field):
+                current = event.name
+                field_data = []
+            elif isinstance(event, Data):
+                if isinstance(current, str):
+                    field_data.append(event.data)
+                    if not event.more_data:
+                        fields[current] = b''.join(field_data).decode('utf-8')
+                else:
+                    current.write(event.data)
+            elif isinstance(event, Epilogue):
+                break
+    except ValueError as e:
+        for upload in files.values():
+            upload.close()
+        raise HTTPError(400, f'無法解析上傳內容: {str(e)}')
+
+    for upload in files.values():
+        upload.seek(0)
+    return fields, files
+
+
+async def send_body(send, status: int, headers, body: bytes) -> None:
+    """分塊發送響應體，每塊發送後讓出事件循環"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers + [(b'content-length', str(len(body)).encode())],
+    })
+    view = memoryview(body)
+    for start in range(0, len(body), CHUNK_SIZE):
+        await send({
+            'type': 'http.response.body',
+            'body': bytes(view[start:start + CHUNK_SIZE]),
+            'more_body': start + CHUNK_SIZE < len(body),
+        })
+    if not body:
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def send_json(send, status: int, data, headers=()) -> None:
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send_body(send, status, [(b'content-type', b'application/json')] + list(headers), body)
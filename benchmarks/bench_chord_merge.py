@@ -0,0 +1,97 @@
+"""
+比较单次遍历的和弦 run 合并与原来的两次合并（加入时合并 + merge_chord_runs 复制后再遍历）
+
+用法：python benchmarks/bench_chord_merge.py [段落数（默认 2000）] [重复次数]
+"""
+import os
+import sys
+import copy
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.doc_parser import DocParser
+
+FORMAT = {'bold': None, 'italic': None, 'underline': None, 'font_size': 12.0, 'font_name': 'Calibri',
+          'style': 'Default Paragraph Font', 'hyperlink': None, 'subscript': False, 'superscript': False}
+
+
+def synthetic_paragraphs(count):
+    """每段 16 个 run：根音、上标升降号、修饰符和歌词交替出现"""
+    paragraphs = []
+    for i in range(count):
+        runs = []
+        for root in ('G', 'D', 'E', 'C'):
+            runs.append(dict(FORMAT, text=root))
+            runs.append(dict(FORMAT, text='#' if i % 2 else 'b', superscript=True, font_size=8.0))
+            runs.append(dict(FORMAT, text='m7'))
+            runs.append(dict(FORMAT, text='   lyric '))
+        paragraphs.append(runs)
+    return paragraphs
+
+
+def legacy_merge(runs):
+    """原实现：逐个加入时合并单独的升降号，之后 merge_chord_runs 再复制并遍历一次"""
+    merged = []
+    for run in runs:
+        merged.append(run)
+        if len(merged) >= 2:
+            prev_text = merged[-2].get('text', '').strip()
+            text = run.get('text', '').strip()
+            if prev_text and len(prev_text) == 1 and prev_text[0].isupper() and text in ['#', 'b']:
+                prev = merged[-2]
+                prev['text'] += text
+                prev.setdefault('accidentals', []).append({
+                    'text': text, 'superscript': run.get('superscript', False),
+                    'font_size': run.get('font_size'), 'font_ascii': run.get('font_ascii'),
+                    'font_east_asia': run.get('font_east_asia'), 'font_h_ansi': run.get('font_h_ansi'),
+                    'font_cs': run.get('font_cs'), 'font_hint': run.get('font_hint')})
+                merged.pop()
+    result = []
+    for i, run in enumerate(merged):
+        current = run.copy()
+        text = current.get('text', '').strip()
+        if text and text[0].isupper() and len(current['text']) == 1:
+            if i + 1 < len(merged):
+                next_text = merged[i + 1].get('text', '').strip()
+                if next_text.find('#') > -1 or next_text.find('b') > -1:
+                    current['text'] += next_text[0]
+                    current.setdefault('accidentals', []).append({'text': next_text})
+        elif text and current['text'][0] in ['#', 'b']:
+            current['text'] = current['text'][1:]
+        result.append(current)
+    return result
+
+
+def best_of(fn, prepare, repeat):
+    """返回多次运行中的最短耗时（毫秒），prepare 的耗时不计入"""
+    best = float('inf')
+    for _ in range(repeat):
+        data = prepare()
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    source = synthetic_paragraphs(count)
+    parser = DocParser()
+    # 两种实现都会修改输入的 run，每次运行前重新复制
+    prepare = lambda: copy.deepcopy(source)
+
+    legacy_ms = best_of(lambda paragraphs: [legacy_merge(runs) for runs in paragraphs], prepare, repeat)
+    single_ms = best_of(lambda paragraphs: [parser.merge_chord_runs(runs) for runs in paragraphs], prepare, repeat)
+    assert ([[r['text'] for r in legacy_merge(runs)] for runs in prepare()] ==
+            [[r['text'] for r in parser.merge_chord_runs(runs)] for runs in prepare()])
+
+    print(f"{count} 段，{count * 16} 个 run")
+    print(f"{'两次合并':<12}{legacy_ms:>10.2f} ms")
+    print(f"{'单次遍历':<12}{single_ms:>10.2f} ms  ({legacy_ms / single_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+比较 JSON 与二进制 IR 的保存、加载耗时和文件大小
+
+用法：python benchmarks/bench_ir_format.py [IR 文件（默认 output.json）] [重复次数]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.doc_parser import DocParser
+from src.compact_ir import compact_ir, expand_ir
+
+
+def best_of(fn, repeat):
+    """返回多次运行中的最短耗时（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '..', 'output.json')
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    logging.disable(logging.INFO)
+    parser = DocParser()
+    data = parser.load_ir(source)
+
+    print(f"{'格式':<16}{'大小 (KB)':>12}{'保存 (ms)':>12}{'加载 (ms)':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, ir in (('完整', expand_ir(data)), ('紧凑', compact_ir(data))):
+            compact = label == '紧凑'
+            json_path = os.path.join(tmpdir, 'ir.json')
+            binary_path = os.path.join(tmpdir, 'ir.docir')
+            cases = [
+                ('JSON', json_path,
+                 lambda: parser.save_to_json(ir, json_path, compact=compact),
+                 lambda: parser.load_from_json(json_path)),
+                ('二进制', binary_path,
+                 lambda: parser.save_ir(ir, binary_path, compact=compact),
+                 lambda: parser.load_ir(binary_path)),
+            ]
+            for name, path, save, load in cases:
+                save_ms = best_of(save, repeat)
+                load_ms = best_of(load, repeat)
+                assert load() == parser.load_from_json(json_path)
+                size = os.path.getsize(path) / 1024
+                print(f"{label + ' ' + name:<16}{size:>12.1f}{save_ms:>12.2f}{load_ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
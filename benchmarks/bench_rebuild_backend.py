@@ -0,0 +1,46 @@
+"""
+比较 docx 与 xml 两种重建后端的耗时，并检查生成的 document.xml 完全相同
+
+用法：python benchmarks/bench_rebuild_backend.py [IR 文件（默认 output.json）] [重复次数]
+"""
+import os
+import sys
+import logging
+import zipfile
+import io
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+from src import metrics
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '..', 'output.json')
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    logging.disable(logging.INFO)
+    data = DocParser().load_ir(source)
+    runs = sum(len(paragraph.get('runs', [])) for paragraph in data.get('paragraphs', []))
+    print(f"{len(data.get('paragraphs', []))} 段，{runs} 个 run")
+
+    documents = {}
+    best = {}
+    for backend in DocRebuilder.BACKENDS:
+        rebuilder = DocRebuilder(backend=backend)
+        with metrics.recording() as record:
+            for _ in range(repeat):
+                output = rebuilder.rebuild_docx(data)
+        documents[backend] = zipfile.ZipFile(io.BytesIO(output)).read('word/document.xml')
+        best[backend] = {name: min(values) * 1000 for name, values in record.stages.items()}
+
+    assert documents['xml'] == documents['docx'], "两种后端生成的 document.xml 不一致"
+    print(f"{'后端':<8}{'重建 (ms)':>12}{'保存 (ms)':>12}")
+    for backend, stages in best.items():
+        print(f"{backend:<8}{stages['rebuild']:>12.2f}{stages['save']:>12.2f}")
+    print(f"重建加速 {best['docx']['rebuild'] / best['xml']['rebuild']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
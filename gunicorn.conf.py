@@ -0,0 +1,16 @@
+"""
+gunicorn 配置：在每個工作進程加載應用後啟動異步任務的工作線程
+
+gunicorn 默認讀取當前目錄下的 gunicorn.conf.py，運行：gunicorn app:app
+"""
+
+
+def post_worker_init(worker):
+    import app
+    app.JOBS.start()
+
+
+def worker_exit(server, worker):
+    # 等待正在執行的任務完成，超時未完成的任務在租約過期後重新執行
+    import app
+    app.JOBS.stop(30)
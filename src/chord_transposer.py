@@ -1,3 +1,21 @@
+import re
+from functools import lru_cache
+from typing import Callable, Iterator, Tuple
+
+# 转调器版本：和弦识别或转调结果变化时递增，转换结果缓存随之失效
+TRANSPOSER_VERSION = '2'
+
+# 和弦语法：根音（可叠加升降号）+ 和弦性质/延伸音 + 可选的斜杠低音，前后必须是空白或文本边界
+# 斜杠后是数字时属于延伸音（例如 G6/9），是音名时才是低音
+CHORD_PATTERN = re.compile(r"""
+    (?<!\S)
+    (?P<root>[A-G][#b]*)
+    (?P<quality>(?:maj|min|dim|aug|sus|add|alt|no|m|M|/\d+|\d|[-#b+°øΔ^(),])*)
+    (?:/(?P<bass>[A-G][#b]*))?
+    (?!\S)
+""", re.VERBOSE)
+
+
 class ChordTransposer:
     # 所有可能的调性
     KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -13,6 +31,14 @@ class ChordTransposer:
         'B': 11
     }
     
+    # 调试追踪回调，默认 None 表示不追踪（见 src/trace_hooks.py）
+    trace_hook = None
+
+    @classmethod
+    def set_trace_hook(cls, hook) -> None:
+        """设置追踪回调，传入 None 关闭追踪"""
+        cls.trace_hook = hook
+
     @classmethod
     def normalize_note(cls, note: str) -> str:
         """规范化音符名称，处理多重升降号"""
@@ -23,10 +49,6 @@ class ChordTransposer:
         base_note = note[0]  # 第一个字符一定是基本音符
         accidentals = note[1:]  # 剩余部分是升降号
         
-        print(f"[normalize_note] 输入音符: {note}")
-        print(f"[normalize_note] 基本音符: {base_note}")
-        print(f"[normalize_note] 升降号: {accidentals}")
-        
         # 计算升降号的总效果
         semitones = 0
         for acc in accidentals:
@@ -35,38 +57,69 @@ class ChordTransposer:
             elif acc == 'b':
                 semitones -= 1
         
-        print(f"[normalize_note] 升降半音数: {semitones}")
-        
         # 计算最终音高
         base_num = cls.CHORD_NOTES.get(base_note, 0)
         final_num = (base_num + semitones) % 12
         
         result = cls.KEYS[final_num]
-        print(f"[normalize_note] 基本音符数值: {base_num}")
-        print(f"[normalize_note] 最终音符数值: {final_num}")
-        print(f"[normalize_note] 规范化结果: {result}")
+        if cls.trace_hook is not None:
+            cls.trace_hook('normalize_note', note=note, semitones=semitones,
+                           base_num=base_num, final_num=final_num, result=result)
         
         return result
     
     @classmethod
     def get_key_number(cls, key: str) -> int:
         """获取调号的数字表示"""
-        print(f"[get_key_number] 输入调号: {key}")
         # 首先规范化音符
         normalized_key = cls.normalize_note(key)
         result = cls.CHORD_NOTES.get(normalized_key, 0)
-        print(f"[get_key_number] 规范化后: {normalized_key}")
-        print(f"[get_key_number] 调号数值: {result}")
+        if cls.trace_hook is not None:
+            cls.trace_hook('get_key_number', key=key, normalized=normalized_key, result=result)
         return result
     
+    @classmethod
+    def is_chord(cls, word: str) -> bool:
+        """判断单词是否为和弦（完整匹配和弦语法）"""
+        return CHORD_PATTERN.fullmatch(word) is not None
+
+    @classmethod
+    def split_chord(cls, chord: str) -> Tuple[str, str, str]:
+        """将和弦拆分为 (根音, 修饰符, 低音)，例如 'Bbm7/F' -> ('Bb', 'm7', 'F')，不是和弦时根音为空"""
+        match = CHORD_PATTERN.fullmatch(chord)
+        if match is None:
+            return '', '', ''
+        return match.group('root'), match.group('quality'), match.group('bass') or ''
+
+    @classmethod
+    def iter_chords(cls, text: str) -> Iterator[Tuple[int, int, str]]:
+        """单次扫描文本，逐个产出和弦的 (起始位置, 结束位置, 和弦)"""
+        for match in CHORD_PATTERN.finditer(text):
+            yield match.start(), match.end(), match.group()
+
+    @classmethod
+    def rewrite_chords(cls, text: str, transpose: Callable[[str], str], preserve_spaces: bool = True) -> str:
+        """单次扫描替换文本中的和弦，transpose 为单个和弦的转调函数
+
+        preserve_spaces 为 False 时与原行为一致：合并连续空白并去掉首尾空白。
+        """
+        if not preserve_spaces:
+            text = ' '.join(text.split())
+        pieces = []
+        pos = 0
+        for match in CHORD_PATTERN.finditer(text):
+            pieces.append(text[pos:match.start()])
+            pieces.append(transpose(match.group()))
+            pos = match.end()
+        if not pieces:
+            return text
+        pieces.append(text[pos:])
+        return ''.join(pieces)
+
     @classmethod
     def transpose_chord(cls, chord: str, from_key: str, to_key: str) -> str:
         """转调单个和弦"""
-        print(f"\n[transpose_chord] 开始转调和弦: {chord}")
-        print(f"[transpose_chord] 从调号: {from_key} 到调号: {to_key}")
-        
         if not chord or len(chord) < 1:
-            print("[transpose_chord] 空和弦，直接返回")
             return chord
             
         # 计算调号差
@@ -78,41 +131,13 @@ class ChordTransposer:
         if semitones < 0:
             semitones += 12
         
-        print(f"[transpose_chord] 从 {from_num} 到 {to_num}")
-        print(f"[transpose_chord] 需要升高的半音数: {semitones}")
-        
-        # 分离和弦的根音和修饰符
-        root = ''
-        modifier = ''
-        bass = ''
-        
-        # 处理带有低音的和弦（例如 C/G）
-        if '/' in chord:
-            main_chord, bass = chord.split('/')
-            print(f"[transpose_chord] 带低音和弦 - 主和弦: {main_chord}, 低音: {bass}")
-        else:
-            main_chord = chord
-            print(f"[transpose_chord] 普通和弦: {main_chord}")
-            
-        # 提取和弦根音和修饰符
-        i = 0
-        while i < len(main_chord):
-            if main_chord[i].isalpha():
-                root += main_chord[i]
-                i += 1
-                # 收集所有的升降号
-                while i < len(main_chord) and main_chord[i] in ['#', 'b']:
-                    root += main_chord[i]
-                    i += 1
-                modifier = main_chord[i:] if i < len(main_chord) else ''
-                break
-            i += 1
-                
-        print(f"[transpose_chord] 解析结果 - 根音: {root}, 修饰符: {modifier}")
+        # 分离和弦的根音、修饰符和低音
+        root, modifier, bass = cls.split_chord(chord)
         
         # 如果无法识别和弦，返回原始字符串
         if not root:
-            print("[transpose_chord] 无法识别和弦，返回原始字符串")
+            if cls.trace_hook is not None:
+                cls.trace_hook('transpose_chord', chord=chord, result=chord, reason='无法识别和弦')
             return chord
             
         # 规范化并转调根音
@@ -121,8 +146,6 @@ class ChordTransposer:
         new_root_num = (root_num + semitones) % 12
         new_root = cls.KEYS[new_root_num]
         
-        print(f"[transpose_chord] 根音转调 - 规范化: {normalized_root}, 新根音: {new_root}")
-        
         # 转调低音（如果存在）
         if bass:
             normalized_bass = cls.normalize_note(bass)
@@ -130,11 +153,12 @@ class ChordTransposer:
             new_bass_num = (bass_num + semitones) % 12
             new_bass = cls.KEYS[new_bass_num]
             result = f"{new_root}{modifier}/{new_bass}"
-            print(f"[transpose_chord] 最终带低音和弦: {result}")
-            return result
-            
-        result = f"{new_root}{modifier}"
-        print(f"[transpose_chord] 最终和弦: {result}")
+        else:
+            result = f"{new_root}{modifier}"
+
+        if cls.trace_hook is not None:
+            cls.trace_hook('transpose_chord', chord=chord, from_key=from_key, to_key=to_key,
+                           semitones=semitones, root=root, modifier=modifier, bass=bass, result=result)
         return result
     
     @classmethod
@@ -148,41 +172,74 @@ class ChordTransposer:
             to_key: 目标调号
             preserve_spaces: 是否保留原始空格，默认为True
         """
-        print(f"\n[transpose_text] 开始转调文本")
-        print(f"[transpose_text] 原始文本: {text}")
-        print(f"[transpose_text] 从调号: {from_key} 到调号: {to_key}")
-        print(f"[transpose_text] 保留空格: {preserve_spaces}")
-        
         if not text or not from_key or not to_key:
-            print("[transpose_text] 空文本或缺少调号信息，直接返回")
             return text
             
-        if preserve_spaces:
-            # 保留所有空格，包括连续空格
-            # 使用split(' ')而不是split()以保留连续空格
-            words = text.split(' ')
-            # 如果文本以空格开头或结尾，split会产生空字符串，我们需要保留这些
-            new_words = []
-            for i, word in enumerate(words):
-                if word == '':
-                    new_words.append('')
-                elif word and word[0].isupper() and any(note in word for note in cls.CHORD_NOTES.keys()):
-                    new_words.append(cls.transpose_chord(word, from_key, to_key))
-                else:
-                    new_words.append(word)
-            # 使用' '.join以保留原始空格
-            result = ' '.join(new_words)
-            print(f"[transpose_text] 转调后文本: {result}")
-            return result
+        result = cls.rewrite_chords(
+            text,
+            lambda chord: cls.transpose_chord(chord, from_key, to_key),
+            preserve_spaces=preserve_spaces
+        )
+        if cls.trace_hook is not None:
+            cls.trace_hook('transpose_text', text=text, from_key=from_key, to_key=to_key,
+                           preserve_spaces=preserve_spaces, result=result)
+        return result
+
+
+class Transposition:
+    """预编译的转调：from_key 与 to_key 固定，12 个音高的映射只计算一次
+
+    重复出现的和弦（如 G、D/F#、Em7）由有界 LRU 缓存直接返回。
+    """
+
+    def __init__(self, from_key: str, to_key: str, cache_size: int = 1024, trace_hook=None):
+        self.from_key = from_key
+        self.to_key = to_key
+        # 未指定时沿用 ChordTransposer 的追踪回调
+        self.trace_hook = trace_hook if trace_hook is not None else ChordTransposer.trace_hook
+        self.semitones = (ChordTransposer.get_key_number(to_key) - ChordTransposer.get_key_number(from_key)) % 12
+        # 原音高 -> 转调后的音名
+        self.pitch_map = [ChordTransposer.KEYS[(pitch + self.semitones) % 12] for pitch in range(12)]
+        self.transpose_chord = lru_cache(maxsize=cache_size)(self._transpose_chord)
+
+    @staticmethod
+    def note_pitch(note: str) -> int:
+        """计算音名（可带多个升降号）的音高数值，与 ChordTransposer.normalize_note 一致"""
+        accidentals = note[1:]
+        semitones = accidentals.count('#') - accidentals.count('b')
+        return (ChordTransposer.CHORD_NOTES.get(note[0], 0) + semitones) % 12
+
+    def transpose_note(self, note: str) -> str:
+        """转调单个音名"""
+        return self.pitch_map[self.note_pitch(note)]
+
+    def _transpose_chord(self, chord: str) -> str:
+        """转调单个和弦（未缓存版本）"""
+        if not chord:
+            return chord
+        root, modifier, bass = ChordTransposer.split_chord(chord)
+        if not root:
+            return chord
+        if bass:
+            result = f"{self.transpose_note(root)}{modifier}/{self.transpose_note(bass)}"
         else:
-            # 不保留连续空格的原始行为
-            words = text.split()
-            new_words = []
-            for word in words:
-                if word and word[0].isupper() and any(note in word for note in cls.CHORD_NOTES.keys()):
-                    new_words.append(cls.transpose_chord(word, from_key, to_key))
-                else:
-                    new_words.append(word)
-            result = ' '.join(new_words)
-            print(f"[transpose_text] 转调后文本: {result}")
-            return result 
\ No newline at end of file
+            result = f"{self.transpose_note(root)}{modifier}"
+        if self.trace_hook is not None:
+            self.trace_hook('transpose_chord', chord=chord, from_key=self.from_key, to_key=self.to_key,
+                            semitones=self.semitones, root=root, modifier=modifier, bass=bass, result=result)
+        return result
+
+    def transpose_text(self, text: str, preserve_spaces: bool = True) -> str:
+        """转调文本中的所有和弦，空格处理与 ChordTransposer.transpose_text 相同"""
+        if not text or not self.from_key or not self.to_key:
+            return text
+        return ChordTransposer.rewrite_chords(text, self.transpose_chord, preserve_spaces=preserve_spaces)
+
+    def cache_info(self):
+        """返回和弦缓存的命中统计"""
+        return self.transpose_chord.cache_info()
+
+    def chord_count(self) -> int:
+        """返回已转调的和弦数量（含缓存命中）"""
+        info = self.cache_info()
+        return info.hits + info.misses
@@ -0,0 +1,98 @@
+from typing import Dict, Any, List
+
+# 紧凑 IR：相同的 run 格式只在顶层 formats 表中存一次，run 只保留文本和格式索引
+FORMATS_KEY = 'formats'
+FORMAT_ID_KEY = 'format_id'
+
+# 不属于格式信息、需要保留在 run 上的字段
+RUN_OWN_KEYS = ('text', 'accidentals')
+
+
+def _freeze(value):
+    """将格式值转换为可哈希的形式"""
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class FormatTable:
+    """run 格式驻留表，相同格式只保存一份"""
+
+    def __init__(self, formats: List[Dict[str, Any]] = None):
+        self.formats = []
+        self._index = {}
+        for run_format in formats or []:
+            self.intern(run_format)
+
+    def intern(self, run_format: Dict[str, Any]) -> int:
+        """返回格式在表中的索引，不存在时加入"""
+        # 类型一并作为键，避免 True 与 1 之类的值被视为相同格式
+        key = tuple((k, v.__class__, _freeze(v)) for k, v in run_format.items())
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.formats)
+            self.formats.append(run_format)
+            self._index[key] = index
+        return index
+
+    def compact_run(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """将完整的 run 转换为紧凑形式"""
+        if FORMAT_ID_KEY in run:
+            return run
+        run_format = {k: v for k, v in run.items() if k not in RUN_OWN_KEYS}
+        compact = {'text': run.get('text', ''), FORMAT_ID_KEY: self.intern(run_format)}
+        if 'accidentals' in run:
+            compact['accidentals'] = run['accidentals']
+        return compact
+
+
+def is_compact(data: Dict[str, Any]) -> bool:
+    """判断 IR 是否为紧凑形式"""
+    return FORMATS_KEY in data
+
+
+def compact_ir(data: Dict[str, Any], table: FormatTable = None) -> Dict[str, Any]:
+    """将完整 IR 转换为紧凑 IR，返回新的顶层字典，不修改传入的数据"""
+    if is_compact(data):
+        return data
+    table = table or FormatTable()
+    result = dict(data)
+    result['paragraphs'] = [
+        dict(paragraph, runs=[table.compact_run(run) for run in paragraph.get('runs', [])])
+        for paragraph in data.get('paragraphs', [])
+    ]
+    result[FORMATS_KEY] = table.formats
+    return result
+
+
+def expand_ir(data: Dict[str, Any]) -> Dict[str, Any]:
+    """将紧凑 IR 还原为每个 run 带完整格式的 IR，返回新的顶层字典"""
+    if not is_compact(data):
+        return data
+    result = dict(data)
+    formats = result.pop(FORMATS_KEY)
+    result['paragraphs'] = [
+        dict(paragraph, runs=[resolve_run(run, formats) for run in paragraph.get('runs', [])])
+        for paragraph in data.get('paragraphs', [])
+    ]
+    return result
+
+
+def resolve_run(run: Dict[str, Any], formats: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """返回 run 的完整格式信息，非紧凑 run 原样返回"""
+    if not formats or FORMAT_ID_KEY not in run:
+        return run
+    resolved = {'text': run.get('text', '')}
+    resolved.update(formats[run[FORMAT_ID_KEY]])
+    if 'accidentals' in run:
+        resolved['accidentals'] = run['accidentals']
+    return resolved
+
+
+def run_format(run: Dict[str, Any], formats: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """返回 run 的格式字典（紧凑 run 直接返回格式表中的共享字典，不复制）"""
+    if formats and FORMAT_ID_KEY in run:
+        return formats[run[FORMAT_ID_KEY]]
+    return run
@@ -0,0 +1,71 @@
+"""
+按最近使用淘汰的磁盘缓存目录
+
+读取命中时更新文件修改时间，淘汰时按修改时间删除最久未使用的文件。
+写入后只在内存中累计总大小，估计值超出上限或距上次扫描超过 RESCAN_INTERVAL 秒时才扫描目录，
+不在每次写入时遍历整个目录。多个进程共享目录时各自只累计本进程的写入，定期扫描会把其他进程的写入计算在内。
+"""
+import os
+import time
+import threading
+
+# 两次扫描目录的最长间隔（秒）
+RESCAN_INTERVAL = 60
+
+
+class DiskLRU:
+    """directory 中以 suffix 结尾的文件总大小不超过 max_bytes"""
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._total = None  # 尚未扫描
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """更新修改时间，淘汰时按最近使用排序"""
+        os.utime(path)
+
+    def added(self, size: int) -> None:
+        """记录新写入的文件大小，需要时扫描目录并淘汰"""
+        with self._lock:
+            now = time.monotonic()
+            if (self._total is not None and self._total + size <= self.max_bytes
+                    and now - self._scanned_at < RESCAN_INTERVAL):
+                self._total += size
+                return
+            self._scanned_at = now
+        total = self.evict()
+        with self._lock:
+            self._total = total
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(self.suffix):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self) -> int:
+        """扫描目录，超出大小限制时删除最久未使用的文件，返回剩余总大小"""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in sorted(entries):
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return total
@@ -1,73 +1,79 @@
 from docx import Document
+import io
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 import logging
 from pathlib import Path
 from docx.shared import Pt, Twips, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_COLOR_INDEX
 from docx.oxml import parse_xml
 from docx.oxml.ns import nsdecls, qn
+from src.stream_parser import StreamParser
+from src.compact_ir import compact_ir, expand_ir, is_compact
+from src.ir_cache import IRCache
+from src.docx_package import open_document
+from src import ir_binary
+from src import metrics
+
+# 解析器版本：IR 结构或解析逻辑变化时递增，IR 缓存随之失效
+PARSER_VERSION = '2'
+
+def _describe(source) -> str:
+    """日志中显示的输入来源：路径原样显示，内存中的文档只显示大小"""
+    if isinstance(source, (str, os.PathLike)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    return getattr(source, 'name', None) or '<stream>'
+
+# 升降号 run 的文本，以及合并时记录到 accidentals 中的格式字段
+ACCIDENTALS = ('#', 'b')
+ACCIDENTAL_FORMAT_KEYS = ('superscript', 'font_size', 'font_ascii', 'font_east_asia', 'font_h_ansi',
+                          'font_cs', 'font_hint')
 
 def merge_chord_runs(handler, runs):
-    """合并和弦相关的 runs，例如将 C 和 # 合并为 C#，而数字作为单独的修饰符"""
-    if not runs:
-        return runs
-        
+    """合并和弦相关的 runs，例如将 C 和 # 合并为 C#，而数字作为单独的修饰符
+
+    单次遍历的状态机：root 是最近一个可以接收升降号的根音 run（单个大写字母），
+    紧随其后的升降号 run 直接并入 root（修改 root 本身，不复制 run），随后任何其他 run 都会结束这个状态。
+    升降号的格式只记录 run 中存在的字段。返回新的 runs 列表。
+    """
+    trace = getattr(handler, 'trace_hook', None)
     merged_runs = []
-    i = 0
-    while i < len(runs):
-        current_run = runs[i].copy()  # 复制当前 run
-        
-        # 检查是否是可能的和弦开始（大写字母）
-        if (current_run.get('text', '').strip() and 
-            current_run['text'][0].isupper() and 
-            len(current_run['text']) == 1):
-            
-            # 只检查下一个 run 是否是升降号
-            next_idx = i + 1
-            # print('i', i)
-            if next_idx < len(runs):
-                next_run = runs[next_idx]
-                next_text = next_run.get('text', '').strip()
-                
-                # 如果是升降号，合并到当前 run
-                # if next_text in ['#', 'b']:
-                print('next_text', next_text)
-                if next_text.find('#')>-1 or next_text.find('b')>-1:
-                    # 合并文本
-                    current_run['text'] += next_text[0]
-                    # 记录升降号的格式信息
-                    if not 'accidentals' in current_run:
-                        current_run['accidentals'] = []
-                    current_run['accidentals'].append({
-                        'text': next_text,
-                        'superscript': next_run.get('superscript', False),
-                        'font_size': next_run.get('font_size')
-                    })
-                    print('current_run', current_run['text'])
-                    # i = next_idx + 1  # 跳过已合并的升降号
-                # else:
-                    # i += 1
-            #     i += 1
-            # else:
-            #     i += 1
-            i += 1
-        elif(current_run.get('text', '').strip() and 
-             current_run['text'][0] in ['#','b']):
-            current_run['text'] = current_run['text'][1:]
-            i += 1
-        else:
-            i += 1
-            
-        merged_runs.append(current_run)
-        
-    return merged_runs 
+    root = None
+    for run in runs:
+        text = run.get('text', '').strip()
+        if root is not None and text in ACCIDENTALS:
+            root['text'] += text
+            accidental = {'text': text}
+            for key in ACCIDENTAL_FORMAT_KEYS:
+                if key in run:
+                    accidental[key] = run[key]
+            root.setdefault('accidentals', []).append(accidental)
+            if trace is not None:
+                trace('merge_accidental', text=root['text'], accidentals=root['accidentals'])
+            continue
+        merged_runs.append(run)
+        root = run if len(text) == 1 and text.isupper() else None
+    return merged_runs
 
 class DocParser:
-    def __init__(self, logger=None):
+    # 可选的解析引擎：docx 使用 python-docx 对象模型，stream 使用 lxml iterparse 流式解析
+    ENGINES = ('docx', 'stream')
+
+    def __init__(self, logger=None, engine: str = 'docx', compact: bool = False, trace_hook=None,
+                 cache_dir: str = None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"不支持的解析引擎: {engine}，可选值: {', '.join(self.ENGINES)}")
         self.logger = logger or logging.getLogger(__name__)
-        self._current_paragraph_runs = []  # 用于临时存储当前段落的所有 runs
+        self.engine = engine
+        self.compact = compact  # 为 True 时输出紧凑 IR（顶层 formats 表 + run 格式索引）
+        self.trace_hook = trace_hook  # 调试追踪回调，None 表示不追踪（见 src/trace_hooks.py）
+        self._stream_parser = StreamParser(self) if engine == 'stream' else None
+        # 指定 cache_dir 时按文件内容缓存解析结果
+        self.ir_cache = IRCache(cache_dir, PARSER_VERSION) if cache_dir else None
+        # 解析状态都是每个段落的局部变量，同一个实例可以在多个线程中同时使用
         
     def _should_merge_with_next(self, current_run, next_run) -> bool:
         """判断当前 run 是否应该与下一个 run 合并"""
@@ -80,8 +86,9 @@ class DocParser:
                          current_text[0].isupper())
         is_accidental = next_text in ['#', 'b']
         
-        print(f"检查是否需要合并: current='{current_text}', next='{next_text}'")
-        print(f"is_chord_start={is_chord_start}, is_accidental={is_accidental}")
+        if self.trace_hook is not None:
+            self.trace_hook('should_merge_with_next', current=current_text, next=next_text,
+                            is_chord_start=is_chord_start, is_accidental=is_accidental)
         
         return is_chord_start and is_accidental
 
@@ -96,8 +103,8 @@ class DocParser:
             "font_name": run.font.name,
             "style": run.style.name if run.style else None,
             "hyperlink": self._extract_hyperlink(run),
-            "subscript": run._element.rPr.vertAlign is not None and run._element.rPr.vertAlign.val == 'subscript',
-            "superscript": run._element.rPr.vertAlign is not None and run._element.rPr.vertAlign.val == 'superscript'
+            "subscript": run.font.subscript is True,
+            "superscript": run.font.superscript is True
         }
 
         # 提取字体详细信息
@@ -112,54 +119,15 @@ class DocParser:
                 run_format["font_cs"] = rFonts.get(qn('w:cs'))
                 run_format["font_hint"] = rFonts.get(qn('w:hint'))
 
-        # 提取颜色信息
-        if run.font.color.rgb:
-            run_format["color"] = run.font.color.rgb
-        elif run._element.rPr.color is not None:
-            run_format["color"] = run._element.rPr.color.val
+            # 提取颜色信息
+            if run.font.color.rgb:
+                run_format["color"] = run.font.color.rgb
+            elif rPr.color is not None:
+                run_format["color"] = rPr.color.val
 
-        # 提取突出显示颜色
-        if run._element.rPr.highlight is not None:
-            run_format["highlight_color"] = run._element.rPr.highlight.val
-
-        # 存储当前 run 的格式信息
-        self._current_paragraph_runs.append(run_format)
-        
-        # 检查是否需要与前一个 run 合并
-        if len(self._current_paragraph_runs) >= 2:
-            prev_run = self._current_paragraph_runs[-2]
-            current_run = self._current_paragraph_runs[-1]
-            
-            # 检查是否是和弦情况（大写字母后跟升降号）
-            prev_text = prev_run.get('text', '').strip()
-            current_text = current_run.get('text', '').strip()
-            
-            # 检查是否是大写字母后跟升降号
-            is_chord_start = (prev_text and 
-                            len(prev_text) == 1 and 
-                            prev_text[0].isupper())
-            is_accidental = current_text in ['#', 'b']
-            
-            if is_chord_start and is_accidental:
-                # 合并文本
-                prev_run['text'] += current_text
-                # 记录升降号的格式信息
-                if not 'accidentals' in prev_run:
-                    prev_run['accidentals'] = []
-                prev_run['accidentals'].append({
-                    'text': current_text,
-                    'superscript': current_run.get('superscript', False),
-                    'font_size': current_run.get('font_size'),
-                    'font_ascii': current_run.get('font_ascii'),
-                    'font_east_asia': current_run.get('font_east_asia'),
-                    'font_h_ansi': current_run.get('font_h_ansi'),
-                    'font_cs': current_run.get('font_cs'),
-                    'font_hint': current_run.get('font_hint')
-                })
-                # 移除当前 run（因为已经合并到前一个 run 中）
-                self._current_paragraph_runs.pop()
-                print(f"合并和弦: {prev_run['text']}, 升降号格式: {prev_run.get('accidentals')}")
-                return None  # 返回 None 表示这个 run 已经被合并
+            # 提取突出显示颜色
+            if rPr.highlight is not None:
+                run_format["highlight_color"] = rPr.highlight.val
 
         return run_format
 
@@ -180,17 +148,8 @@ class DocParser:
         if paragraph.paragraph_format.first_line_indent:
             para_format['first_line_indent'] = paragraph.paragraph_format.first_line_indent
             
-        # 重置当前段落的 runs 列表
-        self._current_paragraph_runs = []
-        
-        # 提取 runs 信息
-        runs = []
-        for run in paragraph.runs:
-            run_info = self._extract_run_formatting(run)
-            if run_info is not None:  # 只添加未被合并的 run
-                runs.append(run_info)
-        # 合并和弦相关的 runs
-        runs = self.merge_chord_runs(runs)
+        # 提取 runs 信息，并将升降号合并到前面的根音
+        runs = self.merge_chord_runs([self._extract_run_formatting(run) for run in paragraph.runs])
         return {
             'text': paragraph.text,
             'style': paragraph.style.name,
@@ -198,26 +157,96 @@ class DocParser:
             'runs': runs
         }
 
-    def parse_docx(self, file_path: str) -> Dict[str, Any]:
+    def parse_docx(self, file_path) -> Dict[str, Any]:
         """
         解析docx文件並返回結構化數據
+
+        file_path 可以是文件路徑、文檔字節或可讀的文件對象。
         """
+        with metrics.stage('parse'):
+            result = self._parse_docx(file_path)
+        paragraphs = result.get('paragraphs', [])
+        metrics.count('documents')
+        metrics.count('paragraphs', len(paragraphs))
+        metrics.count('runs', sum(len(para.get('runs', [])) for para in paragraphs))
+        return result
+
+    def _parse_docx(self, file_path) -> Dict[str, Any]:
         try:
-            doc = Document(file_path)
-            result = {
-                "metadata": self._extract_metadata(doc),
-                "sections": self._extract_section_properties(doc),
-                "paragraphs": self._extract_paragraphs(doc),
-                "tables": self._extract_tables(doc),
-                "images": self._extract_images(doc),
-                "styles": self._extract_styles(doc)
-            }
-            self.logger.info(f"Successfully parsed document: {file_path}")
+            source = file_path
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(source)
+            if self.ir_cache is not None:
+                if hasattr(source, 'read'):
+                    content = source.read()
+                else:
+                    with open(source, 'rb') as f:
+                        content = f.read()
+                cache_key = self.ir_cache.make_key(content, self.engine)
+                cached = self.ir_cache.get(cache_key)
+                if cached is not None:
+                    self.logger.info(f"Loaded parsed document from cache: {_describe(file_path)}")
+                    return cached if self.compact else expand_ir(cached)
+                source = io.BytesIO(content)
+
+            if self._stream_parser is not None:
+                result = self._stream_parser.parse(source)
+            else:
+                # 只加载正文、样式和文档属性，不读入图片等部件
+                doc = open_document(source)
+                result = {
+                    "metadata": self._extract_metadata(doc),
+                    "sections": self._extract_section_properties(doc),
+                    "paragraphs": self._extract_paragraphs(doc),
+                    "tables": self._extract_tables(doc),
+                    "images": self._extract_images(doc),
+                    "styles": self._extract_styles(doc)
+                }
+            if self.compact:
+                result = compact_ir(result)
+            if self.ir_cache is not None:
+                self.ir_cache.put(cache_key, compact_ir(result))
+            self.logger.info(f"Successfully parsed document: {_describe(file_path)}")
             return result
         except Exception as e:
             self.logger.error(f"Error parsing document: {str(e)}")
             raise
 
+    def iter_paragraphs(self, file_path, tables: list = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐个产出段落（run 为完整格式），不构建整个文档的段落列表
+
+        stream 引擎边读边解析，内存占用基本不随文档大小增长；docx 引擎仍会加载整个文档树。
+        传入 tables 列表时，正文中的表格会在遍历过程中追加到其中。
+        """
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            file_path = io.BytesIO(file_path)
+        if self._stream_parser is not None:
+            paragraphs = self._stream_parser.iter_paragraphs(file_path, tables)
+        else:
+            doc = open_document(file_path)
+            paragraphs = (self.parse_paragraph(para) for para in doc.paragraphs)
+        metrics.count('documents')
+        for paragraph in paragraphs:
+            metrics.count('paragraphs')
+            metrics.count('runs', len(paragraph['runs']))
+            yield paragraph
+        if self._stream_parser is None and tables is not None:
+            tables.extend(self._extract_tables(doc))
+
+    def parse_properties(self, file_path) -> Dict[str, Any]:
+        """只解析元数据、图片和样式，与 iter_paragraphs 配合使用"""
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            file_path = io.BytesIO(file_path)
+        if self._stream_parser is not None:
+            return self._stream_parser.parse_properties(file_path)
+        doc = open_document(file_path)
+        return {
+            "metadata": self._extract_metadata(doc),
+            "images": self._extract_images(doc),
+            "styles": self._extract_styles(doc)
+        }
+
     def _extract_styles(self, doc: Document) -> Dict[str, Any]:
         """提取文档样式信息"""
         styles = {}
@@ -317,7 +346,7 @@ class DocParser:
         return tables
 
     def _extract_images(self, doc: Document) -> list:
-        """提取图片信息"""
+        """提取图片信息，只读取关系，不读取图片内容"""
         images = []
         for rel in doc.part.rels.values():
             if "image" in rel.target_ref:
@@ -359,25 +388,63 @@ class DocParser:
             sections.append(section_props)
         return sections
 
-    def save_to_json(self, data: Dict[str, Any], output_path: str) -> None:
-        """将解析结果保存为JSON文件"""
+    def save_to_json(self, data: Dict[str, Any], output_path: str, compact: bool = None) -> None:
+        """将解析结果保存为JSON文件
+
+        compact 为 None 时跟随数据本身的形式；紧凑 IR 不做缩进输出。
+        """
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            if compact is None:
+                compact = is_compact(data)
+            data = compact_ir(data) if compact else expand_ir(data)
+            with metrics.stage('serialize'), open(output_path, 'w', encoding='utf-8') as f:
+                if compact:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                else:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
             self.logger.info(f"Successfully saved JSON to: {output_path}")
         except Exception as e:
             self.logger.error(f"Error saving JSON: {str(e)}")
             raise
 
-    def load_from_json(self, json_path: str) -> Dict[str, Any]:
-        """从JSON文件加载数据"""
+    def load_from_json(self, json_path: str, expand: bool = False) -> Dict[str, Any]:
+        """从JSON文件加载数据，expand 为 True 时将紧凑 IR 还原为完整格式"""
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
+            return expand_ir(data) if expand else data
         except Exception as e:
             self.logger.error(f"Error loading JSON: {str(e)}")
             raise
 
+    def save_ir(self, data: Dict[str, Any], output_path: str, compact: bool = None) -> None:
+        """将解析结果保存为二进制 IR（见 src/ir_binary.py），compact 的含义与 save_to_json 相同"""
+        try:
+            if compact is None:
+                compact = is_compact(data)
+            data = compact_ir(data) if compact else expand_ir(data)
+            with metrics.stage('serialize'):
+                encoded = ir_binary.dumps(data)
+                with open(output_path, 'wb') as f:
+                    f.write(encoded)
+            self.logger.info(f"Successfully saved IR to: {output_path}")
+        except Exception as e:
+            self.logger.error(f"Error saving IR: {str(e)}")
+            raise
+
+    def load_ir(self, ir_path: str, expand: bool = False) -> Dict[str, Any]:
+        """加载二进制 IR；文件是 JSON 时按 JSON 读取，expand 的含义与 load_from_json 相同"""
+        try:
+            with open(ir_path, 'rb') as f:
+                content = f.read()
+            if ir_binary.is_binary_ir(content):
+                data = ir_binary.loads(content)
+            else:
+                data = json.loads(content.decode('utf-8'))
+            return expand_ir(data) if expand else data
+        except Exception as e:
+            self.logger.error(f"Error loading IR: {str(e)}")
+            raise
+
     def merge_chord_runs(self, runs):
-        merged_runs = merge_chord_runs(self, runs)
-        return merged_runs 
\ No newline at end of file
+        return merge_chord_runs(self, runs) 
\ No newline at end of file
@@ -0,0 +1,160 @@
+import re
+import logging
+from typing import List, Tuple
+from lxml import etree
+from docx.oxml.ns import qn
+from src.chord_transposer import ChordTransposer, Transposition
+from src.docx_package import DocxPackage, PackageWriter
+from src import metrics
+
+W_P = qn('w:p')
+W_T = qn('w:t')
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# 改写器版本：输出的文档内容变化时递增，转换结果缓存随之失效
+PATCHER_VERSION = '1'
+
+# 需要改写和弦的部件：正文、页眉和页脚
+PATCHABLE_PART = re.compile(r'^word/(document|header\d*|footer\d*)\.xml$')
+
+# 在 run 内表示空白的元素，用作和弦切分的分隔符
+_SEPARATORS = {
+    qn('w:tab'): '\t',
+    qn('w:ptab'): '\t',
+    qn('w:br'): '\n',
+    qn('w:cr'): '\n',
+}
+
+
+class DocPatcher:
+    """在原始 docx 上直接改写和弦
+
+    只修改包含和弦的 w:t 文本节点，其余 zip 部件按压缩字节原样复制，
+    因此章节、页眉页脚、图片等都不会丢失，耗时与和弦数量成正比。
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+
+    def patch_docx(self, input_path, output_path, from_key: str, to_key: str) -> int:
+        """转调 input_path 中的和弦并写出到 output_path，返回改写的和弦数量"""
+        try:
+            with metrics.stage('patch'):
+                changed = self._patch_docx(input_path, output_path, from_key, to_key)
+            metrics.count('documents')
+            metrics.count('chords', changed)
+            self.logger.info(f"Successfully patched document: {output_path} ({changed} chords)")
+            return changed
+        except Exception as e:
+            self.logger.error(f"Error patching document: {str(e)}")
+            raise
+
+    def _patch_docx(self, input_path, output_path, from_key: str, to_key: str) -> int:
+        changed = 0
+        transposition = Transposition(from_key, to_key) if from_key and to_key else None
+        with DocxPackage(input_path) as package, PackageWriter(output_path) as writer:
+            for info in package.infolist():
+                if transposition is not None and PATCHABLE_PART.match(info.filename):
+                    patched, count = self.patch_part(package.read(info), transposition)
+                    if count:
+                        writer.write(info.filename, patched)
+                        changed += count
+                        continue
+                # 未修改的部件直接复制压缩后的字节
+                writer.copy(package, info)
+        return changed
+
+    def patch_part(self, xml: bytes, transposition: Transposition) -> Tuple[bytes, int]:
+        """改写单个 XML 部件中的和弦，返回 (新内容, 改写数量)"""
+        root = etree.fromstring(xml)
+        changed = 0
+        for p in root.iter(W_P):
+            changed += self._patch_paragraph(p, transposition)
+        if not changed:
+            return xml, 0
+        return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True), changed
+
+    def _patch_paragraph(self, p, transposition: Transposition) -> int:
+        """改写段落中的和弦，和弦可以跨越多个 w:t 节点"""
+        nodes, char_nodes, text = self._collect_text(p)
+        if not nodes:
+            return 0
+
+        replacements = []
+        for start, end, chord in ChordTransposer.iter_chords(text):
+            new_chord = transposition.transpose_chord(chord)
+            if new_chord != chord:
+                replacements.append((start, end, self._place_chord(chord, new_chord, char_nodes[start:end])))
+        if not replacements:
+            return 0
+
+        # 按字符所属节点重新分配文本，新和弦的各部分写入原对应部分所在的节点
+        pieces = [[] for _ in nodes]
+        pos = 0
+        for start, end, placed in replacements:
+            for i in range(pos, start):
+                if char_nodes[i] is not None:
+                    pieces[char_nodes[i]].append(text[i])
+            for node_index, char in placed:
+                pieces[node_index].append(char)
+            pos = end
+        for i in range(pos, len(text)):
+            if char_nodes[i] is not None:
+                pieces[char_nodes[i]].append(text[i])
+
+        for t, piece in zip(nodes, pieces):
+            new_text = ''.join(piece)
+            if new_text != (t.text or ''):
+                t.text = new_text
+                if new_text != new_text.strip():
+                    t.set(XML_SPACE, 'preserve')
+        return len(replacements)
+
+    def _collect_text(self, p) -> Tuple[list, List[int], str]:
+        """收集段落自身的 w:t 节点，返回 (节点列表, 每个字符所属节点, 段落文本)"""
+        nodes = []
+        char_nodes = []
+        parts = []
+        for elem in p.iter(W_T, *_SEPARATORS):
+            # 跳过嵌套在文本框等内部段落中的文本
+            if next(elem.iterancestors(W_P), None) is not p:
+                continue
+            if elem.tag == W_T:
+                content = elem.text or ''
+                char_nodes.extend([len(nodes)] * len(content))
+                nodes.append(elem)
+            else:
+                content = _SEPARATORS[elem.tag]
+                char_nodes.append(None)
+            parts.append(content)
+        return nodes, char_nodes, ''.join(parts)
+
+    def _place_chord(self, chord: str, new_chord: str, chord_nodes: List[int]) -> List[Tuple[int, str]]:
+        """为新和弦的每个字符选择所在节点
+
+        根音字母和升降号分别沿用原根音字母和原升降号所在的节点（例如上标的升降号），
+        修饰符和斜杠保持原位，低音同理。
+        """
+        root, modifier, bass = ChordTransposer.split_chord(chord)
+        new_root, _, new_bass = ChordTransposer.split_chord(new_chord)
+        if not root or not new_chord.startswith(new_root + modifier):
+            # 无法对应各部分时整体写入和弦起始节点
+            return [(chord_nodes[0], char) for char in new_chord]
+
+        placed = self._place_note(new_root, chord_nodes[:len(root)])
+        offset = len(root)
+        placed.extend(zip(chord_nodes[offset:offset + len(modifier)], modifier))
+        offset += len(modifier)
+        if new_bass or bass:
+            placed.append((chord_nodes[offset], '/'))
+            bass_nodes = chord_nodes[offset + 1:] or [chord_nodes[offset]]
+            placed.extend(self._place_note(new_bass, bass_nodes))
+        return placed
+
+    @staticmethod
+    def _place_note(note: str, note_nodes: List[int]) -> List[Tuple[int, str]]:
+        """音名字母写入原字母节点，升降号写入原升降号节点（没有则跟随字母）"""
+        if not note:
+            return []
+        accidental_node = note_nodes[1] if len(note_nodes) > 1 else note_nodes[0]
+        return [(note_nodes[0], note[0])] + [(accidental_node, char) for char in note[1:]]
@@ -2,53 +2,95 @@ from docx import Document
 from docx.shared import Pt, Inches, Twips, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_COLOR_INDEX
 from docx.enum.style import WD_STYLE_TYPE
-from docx.oxml import parse_xml
+from docx.oxml import OxmlElement, parse_xml
 from docx.oxml.ns import nsdecls, qn
-from typing import Dict, Any
+from docx.text.run import Run
+from typing import Dict, Any, Iterable, Optional
+from copy import deepcopy
+from lxml import etree
+import io
 import logging
+import weakref
 import docx.opc.constants
+from src.compact_ir import FORMATS_KEY, run_format
+from src.doc_template import new_document
+from src.docx_package import save_document
+from src import ir_binary, metrics
+
+# 决定 run 的 rPr 的格式字段（超链接除外），作为 rPr 模板缓存的签名
+RUN_PROPERTY_KEYS = ('bold', 'italic', 'underline', 'font_size', 'font_ascii', 'font_east_asia', 'font_h_ansi',
+                     'font_cs', 'font_hint', 'subscript', 'superscript', 'color', 'highlight_color')
+RPR_CACHE_SIZE = 4096
+W_R = qn('w:r')
+
+# 重建器版本：输出的文档内容变化时递增，转换结果缓存随之失效
+REBUILDER_VERSION = '1'
+
+
+def _hashable(value):
+    """JSON 中的列表（如 RGB 颜色）转为元组，以便作为签名"""
+    return tuple(value) if isinstance(value, list) else value
+
 
 class DocRebuilder:
-    def __init__(self, logger=None):
+    # 可选的重建后端：docx 通过 python-docx 的 add_run 逐个添加 run，xml 直接生成 w:r 元素（输出相同，更快）
+    BACKENDS = ('docx', 'xml')
+
+    def __init__(self, logger=None, trace_hook=None, backend: str = 'docx'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"不支持的重建后端: {backend}，可选值: {', '.join(self.BACKENDS)}")
         self.logger = logger or logging.getLogger(__name__)
+        self.backend = backend
+        self.trace_hook = trace_hook  # 调试追踪回调，None 表示不追踪（见 src/trace_hooks.py）
+        self._rpr_templates = {}  # 格式签名 -> rPr 模板
+        self._style_ids = weakref.WeakKeyDictionary()  # 文档 part -> {段落样式名: 样式 ID}，xml 后端使用
         
-    def rebuild_docx(self, data: Dict[str, Any], output_path: str) -> None:
+    def rebuild_docx(self, data, output_path=None) -> Optional[bytes]:
         """
         从JSON数据重建docx文件
+
+        data 也可以是二进制 IR 的字节（见 src/ir_binary.py）。data["paragraphs"] 可以是迭代器，
+        边生成边重建；表格在段落之后重建，因此 data["tables"] 可以在遍历段落的过程中填充。
+        output_path 可以是文件路径或可写的文件对象；为 None 时在内存中生成并返回文档字节。
         """
         try:
-            doc = Document()
-            
-            # 設置默認字體為 Calibri
-            default_font = doc.styles['Normal'].font
-            default_font.name = 'Calibri'
-            
-            # 添加超連結樣式
-            if 'Hyperlink' not in doc.styles:
-                hyperlink_style = doc.styles.add_style('Hyperlink', WD_STYLE_TYPE.CHARACTER)
-                hyperlink_style.base_style = doc.styles['Default Paragraph Font']
-                hyperlink_style.font.color.rgb = RGBColor(0, 0, 255)
-                hyperlink_style.font.underline = True
-            
-            # 重建樣式
-            self._rebuild_styles(doc, data.get("styles", {}))
-            
-            # 重建元数据
-            self._rebuild_metadata(doc, data.get("metadata", {}))
-            
-            # 重建段落
-            self._rebuild_paragraphs(doc, data.get("paragraphs", []))
-            
-            # 重建表格
-            self._rebuild_tables(doc, data.get("tables", []))
+            if isinstance(data, (bytes, bytearray)):
+                data = ir_binary.loads(data)
+            with metrics.stage('rebuild'):
+                doc = self._build_document(data)
             
             # 保存文档
-            doc.save(output_path)
+            target = io.BytesIO() if output_path is None else output_path
+            with metrics.stage('save'):
+                save_document(doc, target)
+            if output_path is None:
+                self.logger.info(f"Successfully rebuilt document in memory ({target.tell()} bytes)")
+                return target.getvalue()
             self.logger.info(f"Successfully rebuilt document: {output_path}")
+            return None
         except Exception as e:
             self.logger.error(f"Error rebuilding document: {str(e)}")
             raise
 
+    def _build_document(self, data: Dict[str, Any]) -> Document:
+        """根据数据构建文档对象"""
+        # 基础文档（默认模板 + Calibri + Hyperlink 样式）每个进程只构建一次，这里取一份副本
+        doc = new_document()
+        
+        # 重建樣式
+        self._rebuild_styles(doc, data.get("styles", {}))
+        
+        # 重建元数据
+        self._rebuild_metadata(doc, data.get("metadata", {}))
+        
+        # 重建段落（紧凑 IR 的 run 格式从 formats 表中查找）
+        self._rebuild_paragraphs(doc, data.get("paragraphs", []), data.get(FORMATS_KEY))
+        
+        # 重建表格
+        self._rebuild_tables(doc, data.get("tables", []))
+        
+        return doc
+
     def _rebuild_styles(self, doc: Document, styles: Dict[str, Any]) -> None:
         """重建文档样式"""
         for style_name, style_data in styles.items():
@@ -132,10 +174,33 @@ class DocRebuilder:
                 setattr(pf, control, format_data[control])
 
     def _apply_run_format(self, run, format_data):
-        """应用文本运行的格式"""
+        """应用文本运行的格式
+
+        相同格式的 rPr 只构建一次（见 _run_properties），之后每个 run 只需附加一份深拷贝。
+        """
         if not format_data:
             return
 
+        run._element._insert_rPr(deepcopy(self._run_properties(format_data)))
+
+        # 处理超链接（需要在文档中创建关系，不能缓存）
+        if format_data.get('hyperlink'):
+            self._apply_hyperlink(run, format_data['hyperlink'])
+
+    def _run_properties(self, format_data):
+        """返回与格式对应的 rPr 模板，按格式签名缓存"""
+        signature = tuple(_hashable(format_data.get(key)) for key in RUN_PROPERTY_KEYS)
+        template = self._rpr_templates.get(signature)
+        if template is None:
+            if len(self._rpr_templates) >= RPR_CACHE_SIZE:
+                self._rpr_templates.clear()
+            template = self._rpr_templates[signature] = self._build_run_properties(format_data)
+        return template
+
+    def _build_run_properties(self, format_data):
+        """在独立的 w:r 上应用格式，返回构建好的 rPr"""
+        run = Run(OxmlElement('w:r'), None)
+
         # 处理基本格式
         if format_data.get('bold') is not None:
             run.bold = format_data['bold']
@@ -150,9 +215,7 @@ class DocRebuilder:
             run.font.size = Pt(float(format_data['font_size']))
             
         # 处理字体设置
-        rPr = run._element.rPr
-        if rPr is None:
-            rPr = run._element.get_or_add_rPr()
+        rPr = run._element.get_or_add_rPr()
             
         # 确保 rFonts 元素存在
         rFonts = rPr.rFonts
@@ -191,15 +254,16 @@ class DocRebuilder:
                 except ValueError:
                     pass
 
-        # 处理突出显示
-        if format_data.get('highlight_color'):
-            run._element.rPr.highlight = parse_xml(
-                f'<w:highlight {nsdecls("w")} w:val="{format_data["highlight_color"]}"/>'
-            )
+        # 处理突出显示（内存中的 IR 是 WD_COLOR_INDEX，JSON 中是它的整数值）
+        highlight = format_data.get('highlight_color')
+        if highlight:
+            try:
+                run.font.highlight_color = (WD_COLOR_INDEX.from_xml(highlight) if isinstance(highlight, str)
+                                            else WD_COLOR_INDEX(highlight))
+            except ValueError:
+                pass
 
-        # 处理超链接
-        if format_data.get('hyperlink'):
-            self._apply_hyperlink(run, format_data['hyperlink'])
+        return rPr
 
     def _apply_hyperlink(self, run, hyperlink_data):
         """應用超連結格式"""
@@ -215,7 +279,7 @@ class DocRebuilder:
                               is_external=True)
         
         # 創建超連結元素
-        hyperlink = parse_xml(f'<w:hyperlink {nsdecls("w")} r:id="{rel_id}"/>')
+        hyperlink = parse_xml(f'<w:hyperlink {nsdecls("w", "r")} r:id="{rel_id}"/>')
         
         # 將 run 元素包裝在超連結中
         run._element.getparent().replace(run._element, hyperlink)
@@ -226,49 +290,71 @@ class DocRebuilder:
         rStyle = parse_xml(f'<w:rStyle {nsdecls("w")} w:val="Hyperlink"/>')
         rPr.append(rStyle)
 
-    def _rebuild_run(self, paragraph, run_data):
+    def _rebuild_run(self, paragraph, run_data, formats=None):
         """重建文本运行"""
         text = run_data.get('text', '')
-        
+        format_data = run_format(run_data, formats)
+        if self.trace_hook is not None:
+            self.trace_hook('rebuild_run', text=text, format=format_data)
+
+        for piece, piece_format in self._split_chord(text, format_data):
+            if self.backend == 'xml':
+                self._emit_run(paragraph, piece, piece_format)
+            else:
+                run = paragraph.add_run(piece)
+                self._apply_run_format(run, piece_format)
+
+    def _split_chord(self, text, format_data):
+        """将和弦拆分为 (文本, 格式)：基本音符、上标的升降号和其余修饰符；非和弦文本原样返回"""
         # 检查是否是和弦（包含升降号的情况）
-        if text and text[0].isupper() and any(acc in text for acc in ['#', 'b']):
-            # 分离和弦的基本音符和升降号
-            base_note = text[0]  # 第一个字符是基本音符
-            accidentals = text[1:]  # 剩余部分可能包含升降号和其他修饰符
-            
-            # 添加基本音符
-            main_run = paragraph.add_run(base_note)
-            self._apply_run_format(main_run, run_data)
-            
-            # 处理剩余部分
-            i = 0
-            while i < len(accidentals):
-                if accidentals[i] in ['#', 'b']:
-                    # 升降号只使用上标，保持原始格式
-                    acc_run = paragraph.add_run(accidentals[i])
-                    acc_format = run_data.copy()  # 复制原始格式
-                    acc_format['superscript'] = True  # 只添加上标属性
-                    self._apply_run_format(acc_run, acc_format)
-                    i += 1
-                else:
-                    # 其他修饰符（如 m7）使用原始格式
-                    modifier = accidentals[i:]
-                    mod_run = paragraph.add_run(modifier)
-                    self._apply_run_format(mod_run, run_data)
-                    break
-        else:
+        if not (text and text[0].isupper() and any(acc in text for acc in ['#', 'b'])):
             # 非和弦文本，直接使用原始格式
-            run = paragraph.add_run(text)
-            self._apply_run_format(run, run_data)
+            return [(text, format_data)]
 
-    def rebuild_paragraph(self, doc, para_data):
+        # 第一个字符是基本音符，剩余部分可能包含升降号和其他修饰符
+        pieces = [(text[0], format_data)]
+        accidentals = text[1:]
+        i = 0
+        while i < len(accidentals):
+            if accidentals[i] in ['#', 'b']:
+                # 升降号只使用上标，保持原始格式
+                acc_format = dict(format_data)  # 复制原始格式
+                acc_format['superscript'] = True  # 只添加上标属性
+                pieces.append((accidentals[i], acc_format))
+                i += 1
+            else:
+                # 其他修饰符（如 m7）使用原始格式
+                pieces.append((accidentals[i:], format_data))
+                break
+        return pieces
+
+    def _emit_run(self, paragraph, text, format_data):
+        """xml 后端：直接在段落元素下生成 w:r，不经过 python-docx 的 Run 对象
+
+        生成的 XML 与 paragraph.add_run + _apply_run_format 相同。
+        """
+        r = etree.SubElement(paragraph._p, W_R)
+        if format_data:
+            r.append(deepcopy(self._run_properties(format_data)))
+        if text:
+            # CT_R.text 与 Run.text 一样处理制表符、换行和首尾空格
+            r.text = text
+        if format_data and format_data.get('hyperlink'):
+            self._apply_hyperlink(Run(r, paragraph), format_data['hyperlink'])
+
+    def rebuild_paragraph(self, doc, para_data, formats=None):
         """重建段落"""
         # 创建新段落
         paragraph = doc.add_paragraph()
+        if self.trace_hook is not None:
+            self.trace_hook('rebuild_paragraph', style=para_data.get('style'), runs=len(para_data.get('runs', [])))
         
         # 应用段落样式
         if para_data.get('style'):
-            paragraph.style = para_data['style']
+            if self.backend == 'xml':
+                paragraph._p.style = self._paragraph_style_id(doc, para_data['style'])
+            else:
+                paragraph.style = para_data['style']
             
         # 应用段落格式
         if para_data.get('format'):
@@ -276,14 +362,23 @@ class DocRebuilder:
             
         # 重建所有的文本运行
         for run_data in para_data.get('runs', []):
-            self._rebuild_run(paragraph, run_data)
+            self._rebuild_run(paragraph, run_data, formats)
             
         return paragraph
 
-    def _rebuild_paragraphs(self, doc: Document, paragraphs: list) -> None:
-        """重建段落内容"""
+    def _paragraph_style_id(self, doc, name):
+        """段落样式名对应的样式 ID，按文档缓存（python-docx 每次设置样式都会遍历全部样式）"""
+        style_ids = self._style_ids.get(doc.part)
+        if style_ids is None:
+            style_ids = self._style_ids[doc.part] = {}
+        if name not in style_ids:
+            style_ids[name] = doc.part.get_style_id(name, WD_STYLE_TYPE.PARAGRAPH)
+        return style_ids[name]
+
+    def _rebuild_paragraphs(self, doc: Document, paragraphs: Iterable[Dict[str, Any]], formats: list = None) -> None:
+        """重建段落内容，paragraphs 可以是生成器，逐个消费"""
         for para_data in paragraphs:
-            paragraph = self.rebuild_paragraph(doc, para_data)
+            paragraph = self.rebuild_paragraph(doc, para_data, formats)
 
     def _rebuild_tables(self, doc: Document, tables: list) -> None:
         """重建表格内容"""
@@ -0,0 +1,78 @@
+"""
+重建用的基础文档模板
+
+每次 Document() 都要解压并解析 python-docx 自带的 default.docx，再设置 Normal 字体、添加 Hyperlink 样式，
+每个文档都是同样的工作。这里每个进程只准备一次基础文档，之后复制它的 XML 部件得到新文档：
+XML 部件（document.xml、styles.xml 等）深拷贝元素树，二进制部件（主题、缩略图等）直接共用不可变的字节，
+其压缩结果也只计算一次（见 src/docx_package.py）。
+"""
+import threading
+from copy import deepcopy
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.part import XmlPart
+from docx.package import Package
+from docx.shared import RGBColor
+
+from src.docx_package import share_blob
+
+_lock = threading.Lock()
+_base = None
+
+
+def build_base_document():
+    """构建基础文档：默认模板 + Calibri 正文字体 + Hyperlink 字符样式"""
+    doc = Document()
+
+    # 設置默認字體為 Calibri
+    default_font = doc.styles['Normal'].font
+    default_font.name = 'Calibri'
+
+    # 添加超連結樣式
+    if 'Hyperlink' not in doc.styles:
+        hyperlink_style = doc.styles.add_style('Hyperlink', WD_STYLE_TYPE.CHARACTER)
+        hyperlink_style.base_style = doc.styles['Default Paragraph Font']
+        hyperlink_style.font.color.rgb = RGBColor(0, 0, 255)
+        hyperlink_style.font.underline = True
+    return doc
+
+
+def clone_document(doc):
+    """复制文档：XML 部件深拷贝，二进制部件共用，关系按原来的 rId 重建"""
+    source = doc.part.package
+    package = Package()
+    clones = {}
+    for part in source.iter_parts():
+        if isinstance(part, XmlPart):
+            clones[part] = type(part)(part.partname, part.content_type, deepcopy(part.element), package)
+        else:
+            # 与打开文档时相同经由 load 构造，各部件类型的构造参数不同（ImagePart 的第四个参数是 image）
+            clones[part] = type(part).load(part.partname, part.content_type, part.blob, package)
+
+    def copy_rels(rels, target_rels):
+        for rId, rel in rels.items():
+            target = rel.target_ref if rel.is_external else clones[rel.target_part]
+            target_rels.add_relationship(rel.reltype, target, rId, rel.is_external)
+
+    copy_rels(source.rels, package.rels)
+    for part, clone in clones.items():
+        copy_rels(part.rels, clone.rels)
+    # 与打开文档时相同登记已有图片，再次插入同一图片时复用，新图片不会与已有部件重名
+    package.after_unmarshal()
+    return package.main_document_part.document
+
+
+def new_document():
+    """返回基础文档的一份副本，基础文档在第一次调用时构建"""
+    global _base
+    if _base is None:
+        with _lock:
+            if _base is None:
+                base = build_base_document()
+                # 二进制部件在所有副本间共用，预先压缩一次，保存时原样写出
+                for part in base.part.package.iter_parts():
+                    if not isinstance(part, XmlPart):
+                        share_blob(part.blob)
+                _base = base
+    return clone_document(_base)
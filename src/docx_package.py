@@ -0,0 +1,267 @@
+"""
+docx 包（zip）的底层读写
+
+open_document 只加载解析需要的部件（正文、样式、文档属性及其关系），图片等其他部件只记录在关系中，不读取内容。
+未修改的部件（图片、字体、主题、settings.xml 等）按 zip 中的压缩字节原样复制，不解压也不重新压缩；
+只有修改过的部件重新压缩，输出耗时因此与嵌入图片的大小无关。
+PackageWriter 在写出每个条目前就已知 CRC 和大小，只顺序写入，目标可以是不支持 seek 的流。
+"""
+import io
+import os
+import time
+import zlib
+import struct
+import zipfile
+from typing import Dict, List, Tuple
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.part import Part, PartFactory
+from docx.opc.pkgreader import _ContentTypeMap, _SerializedRelationships
+from docx.opc.pkgwriter import PackageWriter as _OpcPackageWriter
+from docx.package import Package
+
+# zip 结构（见 APPNOTE.TXT 4.3）
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+LOCAL_SIGNATURE = 0x04034b50
+CENTRAL_SIGNATURE = 0x02014b50
+END_SIGNATURE = 0x06054b50
+
+VERSION = 20                        # 2.0：deflate
+CREATE_VERSION = (3 << 8) | VERSION  # 与 zipfile 相同：Unix
+EXTERNAL_ATTR = 0o600 << 16
+FLAG_ENCRYPTED = 0x01
+FLAG_UTF8 = 0x800
+ZIP32_LIMIT = 0xFFFFFFFF
+
+# open_document 解析的部件：正文、样式和文档属性，其余部件按需读取
+DOCUMENT_RELTYPES = frozenset((RT.OFFICE_DOCUMENT, RT.STYLES, RT.CORE_PROPERTIES))
+
+# 进程内共用、内容不变的部件（例如基础模板中的主题），按对象身份缓存其压缩结果
+_precompressed: Dict[int, Tuple[bytes, 'Entry']] = {}
+
+
+class Entry:
+    """一个待写出的 zip 条目：压缩后的字节与元数据"""
+
+    __slots__ = ('name', 'raw', 'crc', 'size', 'method', 'date_time')
+
+    def __init__(self, name: str, raw: bytes, crc: int, size: int, method: int, date_time: tuple):
+        self.name = name
+        self.raw = raw
+        self.crc = crc
+        self.size = size
+        self.method = method
+        self.date_time = date_time
+
+    @classmethod
+    def compress(cls, name: str, data: bytes, date_time: tuple = None) -> 'Entry':
+        """以 deflate 压缩数据，压缩参数与 zipfile 默认相同"""
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        raw = compressor.compress(data) + compressor.flush()
+        return cls(name, raw, zlib.crc32(data), len(data), zipfile.ZIP_DEFLATED,
+                   date_time or time.localtime(time.time())[:6])
+
+
+def share_blob(blob: bytes) -> None:
+    """登记一个会被多个文档共用的部件内容，写出时直接使用缓存的压缩结果
+
+    按对象身份查找，因此只适用于被原样共享（而不是复制）的 bytes 对象。
+    """
+    if id(blob) not in _precompressed:
+        _precompressed[id(blob)] = (blob, Entry.compress('', blob))
+
+
+class DocxPackage:
+    """docx 包的只读访问，source 可以是路径、字节或文件对象"""
+
+    def __init__(self, source):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        self._owns_file = isinstance(source, (str, os.PathLike))
+        self._file = open(source, 'rb') if self._owns_file else source
+        self._zip = zipfile.ZipFile(self._file)
+
+    def __enter__(self) -> 'DocxPackage':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+        if self._owns_file:
+            self._file.close()
+
+    def infolist(self) -> List[zipfile.ZipInfo]:
+        return self._zip.infolist()
+
+    def read(self, name) -> bytes:
+        """读取并解压部件"""
+        return self._zip.read(name)
+
+    def read_optional(self, name: str):
+        """读取部件，不存在时返回 None"""
+        try:
+            return self._zip.read(name)
+        except KeyError:
+            return None
+
+    def read_raw(self, info: zipfile.ZipInfo) -> bytes:
+        """读取部件压缩后的原始字节，不解压"""
+        if info.flag_bits & FLAG_ENCRYPTED:
+            raise ValueError(f"不支持加密的部件: {info.filename}")
+        self._file.seek(info.header_offset)
+        header = LOCAL_HEADER.unpack(self._file.read(LOCAL_HEADER.size))
+        if header[0] != LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile(f"部件 {info.filename} 的本地文件头损坏")
+        name_length, extra_length = header[9], header[10]
+        self._file.seek(name_length + extra_length, io.SEEK_CUR)
+        raw = self._file.read(info.compress_size)
+        if len(raw) != info.compress_size:
+            raise zipfile.BadZipFile(f"部件 {info.filename} 数据不完整")
+        return raw
+
+    def entry(self, info: zipfile.ZipInfo) -> Entry:
+        """返回可以原样写出的条目"""
+        return Entry(info.filename, self.read_raw(info), info.CRC, info.file_size, info.compress_type,
+                     info.date_time)
+
+
+class _DeferredPart(Part):
+    """未加载的部件：只有访问 blob 时才从源文件中读取"""
+
+    def __init__(self, partname, content_type, package, source):
+        super().__init__(partname, content_type, package=package)
+        self._source = source
+
+    @property
+    def blob(self) -> bytes:
+        if self._blob is None:
+            with DocxPackage(self._source) as package:
+                self._blob = package.read(self.partname.membername)
+        return self._blob
+
+
+def open_document(source):
+    """打开 docx 供读取，只解析 DOCUMENT_RELTYPES 中的部件
+
+    与 docx.Document(source) 不同，图片、主题、字体等部件不会被读入内存：
+    它们仍出现在关系中（rel.target_ref 可用），内容只在访问 blob 时读取。
+    source 可以是路径、字节或文件对象；返回的文档只用于读取，不应再保存。
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    package = Package()
+    parts = {}
+    with DocxPackage(source) as reader:
+        content_types = _ContentTypeMap.from_xml(reader.read(CONTENT_TYPES_URI.membername))
+
+        def load_rels(source_part, source_uri):
+            rels_xml = reader.read_optional(source_uri.rels_uri.membername)
+            for srel in _SerializedRelationships.load_from_xml(source_uri.baseURI, rels_xml):
+                if srel.is_external:
+                    source_part.load_rel(srel.reltype, srel.target_ref, srel.rId, True)
+                    continue
+                partname = srel.target_partname
+                target = parts.get(partname)
+                if target is None:
+                    content_type = content_types[partname]
+                    if srel.reltype in DOCUMENT_RELTYPES:
+                        blob = reader.read(partname.membername)
+                        target = parts[partname] = PartFactory(partname, content_type, srel.reltype, blob, package)
+                        load_rels(target, partname)
+                    else:
+                        target = parts[partname] = _DeferredPart(partname, content_type, package, source)
+                source_part.load_rel(srel.reltype, target, srel.rId)
+
+        load_rels(package, PACKAGE_URI)
+    package.after_unmarshal()
+    return package.main_document_part.document
+
+
+class PackageWriter:
+    """顺序写出 zip，target 可以是路径或可写的文件对象"""
+
+    def __init__(self, target):
+        self._owns_file = isinstance(target, (str, os.PathLike))
+        self._file = open(target, 'wb') if self._owns_file else target
+        self._offset = 0
+        self._central: List[bytes] = []
+
+    def __enter__(self) -> 'PackageWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._owns_file:
+            self._file.close()
+
+    def write(self, name: str, data: bytes) -> None:
+        """压缩并写出部件；已用 share_blob 登记的内容直接使用缓存的压缩结果"""
+        shared = _precompressed.get(id(data))
+        if shared is not None and shared[0] is data:
+            cached = shared[1]
+            self.write_entry(Entry(name, cached.raw, cached.crc, cached.size, cached.method, cached.date_time))
+        else:
+            self.write_entry(Entry.compress(name, data))
+
+    def copy(self, package: DocxPackage, info: zipfile.ZipInfo) -> None:
+        """从 package 原样复制部件的压缩字节"""
+        self.write_entry(package.entry(info))
+
+    def write_entry(self, entry: Entry) -> None:
+        if max(entry.size, len(entry.raw), self._offset) > ZIP32_LIMIT:
+            raise ValueError(f"部件过大，不支持 zip64: {entry.name}")
+        name = entry.name.encode('utf-8')
+        flags = FLAG_UTF8 if not entry.name.isascii() else 0
+        dos_time, dos_date = _dos_date_time(entry.date_time)
+        self._file.write(LOCAL_HEADER.pack(
+            LOCAL_SIGNATURE, VERSION, flags, entry.method, dos_time, dos_date,
+            entry.crc, len(entry.raw), entry.size, len(name), 0) + name)
+        self._file.write(entry.raw)
+        self._central.append(CENTRAL_HEADER.pack(
+            CENTRAL_SIGNATURE, CREATE_VERSION, VERSION, flags, entry.method, dos_time, dos_date,
+            entry.crc, len(entry.raw), entry.size, len(name), 0, 0, 0, 0, EXTERNAL_ATTR, self._offset) + name)
+        self._offset += LOCAL_HEADER.size + len(name) + len(entry.raw)
+
+    def close(self) -> None:
+        """写出中央目录"""
+        directory = b''.join(self._central)
+        self._file.write(directory)
+        self._file.write(END_RECORD.pack(
+            END_SIGNATURE, 0, 0, len(self._central), len(self._central), len(directory), self._offset, 0))
+        if self._owns_file:
+            self._file.close()
+
+
+class _PartWriter:
+    """python-docx PhysPkgWriter 接口，写入 PackageWriter"""
+
+    def __init__(self, writer: PackageWriter):
+        self._writer = writer
+
+    def write(self, pack_uri, blob: bytes) -> None:
+        self._writer.write(pack_uri.membername, blob)
+
+
+def save_document(doc, target) -> None:
+    """保存 python-docx 文档，与 Document.save 写出相同的部件，共用部件不重新压缩"""
+    package = doc.part.package
+    parts = package.parts
+    for part in parts:
+        part.before_marshal()
+    with PackageWriter(target) as writer:
+        part_writer = _PartWriter(writer)
+        _OpcPackageWriter._write_content_types_stream(part_writer, parts)
+        _OpcPackageWriter._write_pkg_rels(part_writer, package.rels)
+        _OpcPackageWriter._write_parts(part_writer, parts)
+
+
+def _dos_date_time(date_time: tuple) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    year = max(year, 1980)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
@@ -0,0 +1,210 @@
+"""
+二进制 IR 格式
+
+与 save_to_json 输出相同的数据结构，但更小、读写更快：
+字符串只在第一次出现时写出，之后用索引引用；键序列相同的字典（run 格式、段落等）
+只写一次键，之后只写值；整数使用变长编码；
+可以表示为 1/20 磅（twip）整数倍的浮点数（字号、缩进、间距等）按整数写出。
+
+文件结构：MAGIC(5 字节) + 格式版本(1 字节) + 正文长度(4 字节，小端) + 正文。
+正文是单个值的递归编码，每个值以 1 字节标签开头，字符串、列表和字典先写长度或元素个数。
+"""
+import struct
+from typing import Any
+
+MAGIC = b'DOCIR'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<5sBI')
+
+# 值标签
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3           # zigzag 变长整数
+T_FLOAT = 4         # 8 字节双精度
+T_TWENTIETHS = 5    # 值 * 20 的 zigzag 变长整数
+T_STR = 6           # 新字符串：长度 + UTF-8 字节，按出现顺序编号
+T_REF = 7           # 已出现过的字符串编号
+T_LIST = 8          # 元素个数 + 元素
+T_DICT = 9          # 新的键序列：键个数 + 各个键（字符串编码），随后是各键的值，按出现顺序编号
+T_SHAPED = 10       # 已出现过的键序列编号 + 各键的值
+
+_DOUBLE = struct.Struct('<d')
+
+
+class IRFormatError(ValueError):
+    """二进制 IR 格式错误或版本不支持"""
+
+
+def is_binary_ir(head: bytes) -> bool:
+    """根据文件开头判断是否为二进制 IR"""
+    return head[:len(MAGIC)] == MAGIC
+
+
+def dumps(data: Any) -> bytes:
+    """将 IR 编码为二进制"""
+    body = bytearray()
+    _Encoder(body).encode(data)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, len(body)) + body
+
+
+def loads(buffer: bytes) -> Any:
+    """从二进制解码 IR"""
+    if len(buffer) < HEADER.size or not is_binary_ir(buffer):
+        raise IRFormatError("不是二进制 IR 数据")
+    _, version, length = HEADER.unpack_from(buffer)
+    if version != FORMAT_VERSION:
+        raise IRFormatError(f"不支持的二进制 IR 版本: {version}")
+    if len(buffer) - HEADER.size != length:
+        raise IRFormatError("二进制 IR 长度不符，文件可能已损坏")
+    decode, end = _decoder(buffer, HEADER.size)
+    try:
+        value = decode()
+    except IndexError:
+        raise IRFormatError("二进制 IR 数据不完整") from None
+    if end() != len(buffer):
+        raise IRFormatError("二进制 IR 末尾有多余数据")
+    return value
+
+
+class _Encoder:
+    def __init__(self, out: bytearray):
+        self.out = out
+        self.strings = {}
+        self.shapes = {}
+
+    def varint(self, n: int) -> None:
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def string(self, value: str) -> None:
+        index = self.strings.get(value)
+        if index is not None:
+            self.out.append(T_REF)
+            self.varint(index)
+            return
+        self.strings[value] = len(self.strings)
+        encoded = value.encode('utf-8')
+        self.out.append(T_STR)
+        self.varint(len(encoded))
+        self.out += encoded
+
+    def encode(self, value: Any) -> None:
+        out = self.out
+        if value is None:
+            out.append(T_NONE)
+        elif value is True:
+            out.append(T_TRUE)
+        elif value is False:
+            out.append(T_FALSE)
+        elif isinstance(value, str):
+            self.string(value)
+        elif isinstance(value, int):
+            out.append(T_INT)
+            self.varint(value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            scaled = value * 20
+            if scaled.is_integer() and int(scaled) / 20 == value:
+                scaled = int(scaled)
+                out.append(T_TWENTIETHS)
+                self.varint(scaled * 2 if scaled >= 0 else -scaled * 2 - 1)
+            else:
+                out.append(T_FLOAT)
+                out += _DOUBLE.pack(value)
+        elif isinstance(value, dict):
+            shape = tuple(value)
+            index = self.shapes.get(shape)
+            if index is None:
+                self.shapes[shape] = len(self.shapes)
+                out.append(T_DICT)
+                self.varint(len(shape))
+                for key in shape:
+                    if not isinstance(key, str):
+                        raise TypeError(f"字典的键必须是字符串: {key!r}")
+                    self.string(key)
+            else:
+                out.append(T_SHAPED)
+                self.varint(index)
+            for item in value.values():
+                self.encode(item)
+        elif isinstance(value, (list, tuple)):
+            out.append(T_LIST)
+            self.varint(len(value))
+            for item in value:
+                self.encode(item)
+        else:
+            raise TypeError(f"无法编码为二进制 IR 的类型: {type(value).__name__}")
+
+
+def _decoder(buffer: bytes, pos: int):
+    """返回 (decode, end)：decode() 从 pos 开始解码一个值，end() 返回当前位置
+
+    解码是热点，使用闭包局部变量而不是实例属性。
+    """
+    strings = []
+    shapes = []
+    unpack_double = _DOUBLE.unpack_from
+
+    def varint() -> int:
+        nonlocal pos
+        byte = buffer[pos]
+        pos += 1
+        if byte < 0x80:
+            return byte
+        result = byte & 0x7F
+        shift = 7
+        while True:
+            byte = buffer[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def decode() -> Any:
+        nonlocal pos
+        tag = buffer[pos]
+        pos += 1
+        if tag == T_REF:
+            return strings[varint()]
+        if tag == T_SHAPED:
+            keys = shapes[varint()]
+            return {key: decode() for key in keys}
+        if tag == T_NONE:
+            return None
+        if tag == T_FALSE:
+            return False
+        if tag == T_TRUE:
+            return True
+        if tag == T_STR:
+            length = varint()
+            end = pos + length
+            value = buffer[pos:end].decode('utf-8')
+            pos = end
+            strings.append(value)
+            return value
+        if tag == T_INT:
+            n = varint()
+            return n >> 1 if not n & 1 else -(n >> 1) - 1
+        if tag == T_TWENTIETHS:
+            n = varint()
+            return (n >> 1 if not n & 1 else -(n >> 1) - 1) / 20
+        if tag == T_LIST:
+            return [decode() for _ in range(varint())]
+        if tag == T_DICT:
+            keys = [decode() for _ in range(varint())]
+            shapes.append(keys)
+            return {key: decode() for key in keys}
+        if tag == T_FLOAT:
+            value, = unpack_double(buffer, pos)
+            pos += _DOUBLE.size
+            return value
+        raise IRFormatError(f"未知的二进制 IR 标签: {tag}")
+
+    def end() -> int:
+        return pos
+
+    return decode, end
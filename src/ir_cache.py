@@ -0,0 +1,92 @@
+"""
+解析结果（IR）缓存
+
+同一个 .docx 的解析结果与目标调号无关，按文件内容的 SHA-256 和解析引擎缓存紧凑 IR，
+再次转调时直接读取缓存跳过解析。缓存放在 directory 下自有的 docop-ir 子目录中，按解析器版本再分子目录，
+版本变化后只删除该子目录中旧版本的目录，不触碰 directory 中的其他文件；总大小超过 max_bytes 时删除最久未使用的条目。
+缓存只是加速，读写失败时当作未命中，不影响解析结果。
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+
+from src.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+SUBDIR = 'docop-ir'
+VERSION_PREFIX = 'v'
+VERSION_DIR = re.compile(r'^v\d+$')
+CACHE_SUFFIX = '.json'
+# 缓存总大小上限，可通过 DOCOP_IR_CACHE_MB 覆盖（工作进程继承环境变量）
+DEFAULT_MAX_BYTES = int(float(os.environ.get('DOCOP_IR_CACHE_MB', '256')) * 1024 * 1024)
+
+
+class IRCache:
+    """磁盘 IR 缓存，directory/docop-ir/v<version>/<key>.json"""
+
+    def __init__(self, directory: str, version: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.version = str(version)
+        self.max_bytes = max_bytes
+        self.base = os.path.join(directory, SUBDIR)
+        self.root = os.path.join(self.base, VERSION_PREFIX + self.version)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # 同一个解析器可能被多个线程共享，保护命中计数
+        self._disk = DiskLRU(self.root, max_bytes, CACHE_SUFFIX)
+        os.makedirs(self.root, exist_ok=True)
+        self._prune_versions()
+
+    def _prune_versions(self) -> None:
+        """删除其他解析器版本留下的缓存，只处理 docop-ir 中形如 v<数字> 的目录"""
+        for name in os.listdir(self.base):
+            path = os.path.join(self.base, name)
+            if VERSION_DIR.match(name) and path != self.root and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def make_key(content: bytes, engine: str) -> str:
+        """计算缓存键"""
+        return f"{hashlib.sha256(content).hexdigest()}-{engine}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的 IR，未命中或文件损坏时返回 None"""
+        try:
+            path = self._path(key)
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._disk.touch(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """写入 IR，先写临时文件再原子替换；写入失败只记录日志"""
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        except OSError as e:
+            logger.warning(f"Failed to write IR cache: {str(e)}")
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_path, self._path(key))
+            self._disk.added(os.path.getsize(self._path(key)))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write IR cache: {str(e)}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
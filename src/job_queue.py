@@ -0,0 +1,388 @@
+"""
+異步轉換任務隊列
+
+大型歌本或一次轉出多個調號時，同步的 /api/convert 容易超過代理的超時時間。
+任務記錄保存在本地 SQLite 數據庫中，上傳的文檔與轉換結果保存在同一目錄下；
+本進程的工作線程從表中領取任務，CPU 密集的解析與重建仍交給 ConversionPool 執行。
+
+領取任務時寫入租約（lease_until），轉換過程中由心跳線程每隔 lease/3 秒續約一次，
+因此單個調號的轉換時間超過租約也不會被其他線程重複領取。
+進程重啟或崩潰後，租約過期的 running 任務會被重新領取，因此任務不會因重啟而丟失；
+多個進程共用同一目錄時，領取在 BEGIN IMMEDIATE 事務中完成，同一任務只會被一個進程執行。
+完成（或失敗）的任務在 ttl 秒後過期，工作線程每隔 PURGE_INTERVAL 秒（無論是否空閒）刪除過期的記錄與文件。
+"""
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from src.pipeline import MODES, ConversionPool, QueueFullError, convert_many, iter_zip
+from src.result_cache import ResultCache, content_digest, digest_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_TTL = 3600
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_LEASE = 600
+# 同一任務被領取多少次仍未完成（例如每次都讓進程崩潰）後標記為失敗
+MAX_ATTEMPTS = 3
+# 空閒時檢查其他進程提交的任務與過期任務的間隔秒數
+POLL_INTERVAL = 1.0
+# 刪除過期任務的間隔秒數
+PURGE_INTERVAL = 60.0
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    from_key TEXT NOT NULL,
+    to_keys TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    archive INTEGER NOT NULL,
+    digest TEXT,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    lease_until REAL,
+    finished REAL,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+'''
+
+
+class JobQueue:
+    """以 SQLite 持久化的轉換任務隊列
+
+    workers 為 0 時不啟動工作線程，任務只在調用 run_next 時執行。
+    queue_size 是等待中（queued）任務的上限，超出時 submit 拋出 QueueFullError。
+    """
+
+    def __init__(self, directory: str, pool: ConversionPool, workers: int = DEFAULT_WORKERS,
+                 ttl: float = DEFAULT_TTL, queue_size: int = DEFAULT_QUEUE_SIZE, lease: float = DEFAULT_LEASE,
+                 cache: ResultCache = None, ir_cache_dir: str = None):
+        self.directory = directory
+        self.pool = pool
+        self.workers = workers
+        self.ttl = ttl
+        self.queue_size = queue_size
+        self.lease = lease
+        self.cache = cache
+        self.ir_cache_dir = ir_cache_dir
+        self.db_path = os.path.join(directory, 'jobs.sqlite3')
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            self._migrate(db)
+
+    @staticmethod
+    def _migrate(db: sqlite3.Connection) -> None:
+        """為舊版本創建的數據庫補上新增的列"""
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(jobs)')}
+        if 'digest' not in columns:
+            try:
+                db.execute('ALTER TABLE jobs ADD COLUMN digest TEXT')
+            except sqlite3.OperationalError:
+                # 其他進程同時完成了遷移
+                pass
+
+    @classmethod
+    def from_env(cls, pool: ConversionPool, cache: ResultCache = None, ir_cache_dir: str = None) -> 'JobQueue':
+        """從 DOCOP_JOB_DIR、DOCOP_JOB_WORKERS、DOCOP_JOB_TTL、DOCOP_JOB_QUEUE_SIZE 讀取配置"""
+        directory = os.environ.get('DOCOP_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'docop_jobs')
+        return cls(
+            directory, pool,
+            workers=int(os.environ.get('DOCOP_JOB_WORKERS', DEFAULT_WORKERS)),
+            ttl=float(os.environ.get('DOCOP_JOB_TTL', DEFAULT_TTL)),
+            queue_size=int(os.environ.get('DOCOP_JOB_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+            cache=cache,
+            ir_cache_dir=ir_cache_dir
+        )
+
+    @contextmanager
+    def _connect(self):
+        """每次操作使用獨立連接（自動提交），工作線程與請求線程互不共用連接"""
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _path(self, job_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.{kind}')
+
+    def submit(self, content, from_key: str, to_keys: List[str], mode: str = 'rebuild',
+               archive: bool = False, digest: str = None) -> str:
+        """提交任務並返回任務 id；content 是文檔字節或文件路徑（按文件複製，不讀入內存）
+
+        archive 為 True 時結果是包含各調號文檔的 zip，否則只轉換第一個調號。
+        digest 是上傳時已算好的內容哈希，執行任務時用作緩存鍵，不再讀一遍文件。
+        """
+        if mode not in MODES:
+            raise ValueError(f"不支持的轉換方式: {mode}")
+        if not to_keys:
+            raise ValueError("缺少目標調號")
+        if not archive:
+            to_keys = to_keys[:1]
+        job_id = uuid.uuid4().hex
+        # 先寫入上傳文件，記錄可見時文件一定已經存在
+        _write_atomic(self._path(job_id, 'input'), content)
+        try:
+            with self._connect() as db:
+                db.execute('BEGIN IMMEDIATE')
+                queued = db.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+                if queued >= self.queue_size:
+                    db.execute('ROLLBACK')
+                    raise QueueFullError(f"等待中的任務已達上限 ({self.queue_size})")
+                db.execute(
+                    'INSERT INTO jobs (id, status, from_key, to_keys, mode, archive, digest, total, created) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, QUEUED, from_key, ','.join(to_keys), mode, int(archive), digest, len(to_keys),
+                     time.time()))
+                db.execute('COMMIT')
+        except BaseException:
+            _remove(self._path(job_id, 'input'))
+            raise
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """返回任務狀態，任務不存在或已過期時返回 None"""
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None or (row['expires'] is not None and row['expires'] <= time.time()):
+            return None
+        return {
+            'id': row['id'],
+            'status': row['status'],
+            'archive': bool(row['archive']),
+            'progress': {'done': row['done'], 'total': row['total']},
+            'error': row['error'],
+            'created': row['created'],
+            'expires': row['expires'],
+        }
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        """返回已完成任務的結果文件路徑，未完成或已過期時返回 None"""
+        job = self.get(job_id)
+        if job is None or job['status'] != DONE:
+            return None
+        return self._path(job_id, 'result')
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """領取最早的等待中任務或租約已過期的執行中任務"""
+        with self._connect() as db:
+            while True:
+                now = time.time()
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute(
+                    'SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) '
+                    'ORDER BY created LIMIT 1', (QUEUED, RUNNING, now)).fetchone()
+                if row is None:
+                    db.execute('COMMIT')
+                    return None
+                if row['attempts'] >= MAX_ATTEMPTS:
+                    db.execute(
+                        'UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished = ?, expires = ? '
+                        'WHERE id = ?', (FAILED, '任務多次中斷，已放棄', now, now + self.ttl, row['id']))
+                    db.execute('COMMIT')
+                    _remove(self._path(row['id'], 'input'))
+                    continue
+                db.execute('UPDATE jobs SET status = ?, attempts = attempts + 1, done = 0, lease_until = ? '
+                           'WHERE id = ?', (RUNNING, now + self.lease, row['id']))
+                db.execute('COMMIT')
+                return row
+
+    def _renew(self, job_id: str) -> None:
+        """續約，不改變進度"""
+        with self._connect() as db:
+            db.execute('UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?',
+                       (time.time() + self.lease, job_id, RUNNING))
+
+    @contextmanager
+    def _heartbeat(self, job_id: str):
+        """任務執行期間在後台定期續約"""
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(self.lease / 3):
+                try:
+                    self._renew(job_id)
+                except Exception as e:
+                    logger.warning(f"任務 {job_id} 續約失敗: {str(e)}")
+
+        thread = threading.Thread(target=beat, name=f'docop-job-heartbeat-{job_id[:8]}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def _progress(self, job_id: str, done: int) -> None:
+        """更新進度並續約"""
+        with self._connect() as db:
+            db.execute('UPDATE jobs SET done = ?, lease_until = ? WHERE id = ? AND status = ?',
+                       (done, time.time() + self.lease, job_id, RUNNING))
+
+    def _finish(self, job_id: str, status: str, error: str = None) -> None:
+        now = time.time()
+        with self._connect() as db:
+            db.execute('UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished = ?, expires = ? '
+                       'WHERE id = ?', (status, error, now, now + self.ttl, job_id))
+        _remove(self._path(job_id, 'input'))
+
+    def run_next(self) -> bool:
+        """領取並執行一個任務，沒有可執行的任務時返回 False"""
+        job = self._claim()
+        if job is None:
+            return False
+        job_id = job['id']
+        try:
+            with self._heartbeat(job_id):
+                error = self._convert(job, self._path(job_id, 'input'))
+        except Exception as e:
+            logger.error(f"任務 {job_id} 失敗: {str(e)}")
+            self._finish(job_id, FAILED, str(e))
+            return True
+        if error is not None:
+            self._finish(job_id, FAILED, error)
+        else:
+            self._finish(job_id, DONE)
+        return True
+
+    def _convert(self, job: sqlite3.Row, input_path: str) -> Optional[str]:
+        """轉換任務中的各個調號並寫出結果，全部失敗時返回錯誤信息"""
+        job_id, from_key, mode = job['id'], job['from_key'], job['mode']
+        to_keys = job['to_keys'].split(',')
+        digest = (job['digest'] or content_digest(input_path)) if self.cache else None
+        outputs = {}
+        missing = []
+        for to_key in to_keys:
+            output = self.cache.get(digest_key(digest, from_key, to_key, mode)) if self.cache else None
+            if output is not None:
+                outputs[to_key] = output
+            else:
+                missing.append(to_key)
+        if outputs:
+            self._progress(job_id, len(outputs))
+
+        if missing:
+            results = convert_many(self.pool, input_path, from_key, missing, mode, self.ir_cache_dir, waiting=True)
+            for to_key, output in results:
+                outputs[to_key] = output
+                if self.cache and not isinstance(output, Exception):
+                    self.cache.put(digest_key(digest, from_key, to_key, mode), output)
+                self._progress(job_id, len(outputs))
+
+        errors = [f'{to_key}: {str(outputs[to_key])}' for to_key in to_keys if isinstance(outputs[to_key], Exception)]
+        if len(errors) == len(to_keys):
+            return '\n'.join(errors)
+        if job['archive']:
+            entries = [(f'converted_{to_key}.docx', outputs[to_key]) for to_key in to_keys
+                       if not isinstance(outputs[to_key], Exception)]
+            if errors:
+                entries.append(('errors.txt', '\n'.join(errors).encode('utf-8')))
+            result = b''.join(iter_zip(entries))
+        else:
+            result = outputs[to_keys[0]]
+        _write_atomic(self._path(job_id, 'result'), result)
+        return None
+
+    def purge(self) -> int:
+        """刪除已過期的任務記錄與結果文件，返回刪除的任務數"""
+        with self._connect() as db:
+            expired = [row['id'] for row in db.execute(
+                'SELECT id FROM jobs WHERE expires <= ?', (time.time(),))]
+            for job_id in expired:
+                _remove(self._path(job_id, 'input'))
+                _remove(self._path(job_id, 'result'))
+                db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        return len(expired)
+
+    def start(self) -> None:
+        """啟動工作線程（重複調用無效），先前未完成的任務會被繼續執行"""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'docop-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = None) -> None:
+        """停止工作線程，正在執行的任務完成後退出"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _purge_due(self) -> bool:
+        """是否到了刪除過期任務的時間，同一進程中只有一個工作線程執行"""
+        with self._lock:
+            now = time.time()
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + PURGE_INTERVAL
+            return True
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                # 持續有任務時同樣按時清理，過期的結果文件不會堆積
+                if self._purge_due():
+                    self.purge()
+                if self.run_next():
+                    continue
+            except Exception as e:
+                logger.error(f"任務隊列出錯: {str(e)}")
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+
+
+def _write_atomic(path: str, data) -> None:
+    """先寫臨時文件再原子替換，data 是字節或要複製的文件路徑"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                with open(data, 'rb') as source:
+                    shutil.copyfileobj(source, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -2,24 +2,62 @@ import argparse
 import logging
 import os
 from pathlib import Path
-from doc_parser import DocParser
-from doc_rebuilder import DocRebuilder
-from chord_transposer import ChordTransposer
-import json
+import glob
 import sys
+import time
+import zipfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+from src.doc_patcher import DocPatcher
+from src.chord_transposer import ChordTransposer, Transposition
+from src.pipeline import MODES, ConversionPool, convert_file, convert_many, convert_streaming, iter_jobs, parse_keys
+from src.trace_hooks import print_hook
+from src.metrics import Metrics
+from src import metrics
 
 class LOGger:
     @staticmethod
     def myparser():
         parser = argparse.ArgumentParser(description='文档处理工具')
-        parser.add_argument('--input', type=str, required=True, help='输入文件路径')
-        parser.add_argument('--output', type=str, required=True, help='输出文件路径')
-        parser.add_argument('--mode', type=str, choices=['parse', 'rebuild'], required=True,
-                          help='操作模式：parse-解析文档，rebuild-重建文档')
+        parser.add_argument('--input', type=str, required=True,
+                          help='输入文件路径（batch 模式为目录或通配符，例如 "charts/**/*.docx"）')
+        parser.add_argument('--output', type=str, required=True, help='输出文件路径（batch 模式为输出目录）')
+        parser.add_argument('--mode', type=str, choices=['parse', 'rebuild', 'convert', 'patch', 'multi', 'batch'],
+                          required=True,
+                          help='操作模式：parse-解析文档，rebuild-重建文档，convert-在内存中解析、转调并重建，'
+                               'patch-直接在原文档上改写和弦，multi-解析一次并转调到多个调号，输出 zip，'
+                               'batch-并行转调目录中的所有文档')
         parser.add_argument('--from-key', type=str, help='原始调号（例如：C, D, E#, Bb等）')
         parser.add_argument('--to-key', type=str, help='目标调号（例如：C, D, E#, Bb等）')
+        parser.add_argument('--to-keys', type=str, default='all',
+                          help='multi 模式的目标调号，以逗号分隔（默认：all，即全部 12 个调）')
+        parser.add_argument('--convert-mode', '--multi-mode', dest='convert_mode', type=str, choices=MODES,
+                          default='rebuild', help='multi 和 batch 模式下的转换方式（默认：rebuild）')
+        parser.add_argument('--jobs', type=int, default=None,
+                          help='multi 和 batch 模式的并行进程数（默认：CPU 核数）')
         parser.add_argument('--preserve-spaces', type=bool, default=True,
                           help='是否保留原始空格（默认：True）')
+        parser.add_argument('--engine', type=str, choices=DocParser.ENGINES, default='docx',
+                          help='解析引擎：docx-python-docx 对象模型，stream-流式解析（默认：docx）')
+        parser.add_argument('--compact', action='store_true',
+                          help='输出紧凑 IR：相同的 run 格式只在 formats 表中保存一次')
+        parser.add_argument('--ir-format', type=str, choices=['json', 'binary'], default='json',
+                          help='parse 模式和 --dump-ir 输出的 IR 格式：json 或二进制（默认：json）；'
+                               'rebuild 模式自动识别')
+        parser.add_argument('--backend', type=str, choices=DocRebuilder.BACKENDS, default='docx',
+                          help='重建后端：docx（python-docx 逐个添加 run）或 xml（直接生成 XML，更快，输出相同）（默认：docx）')
+        parser.add_argument('--streaming', action='store_true',
+                          help='convert 模式下以生成器逐段解析、转调并重建，内存占用不随文档大小增长（建议配合 --engine stream）')
+        parser.add_argument('--dump-ir', type=str, default=None,
+                          help='convert 模式下将转调后的 IR 另存为 JSON，便于调试')
+        parser.add_argument('--ir-cache', type=str, default=None,
+                          help='解析结果缓存目录：同一文件再次解析时直接读取缓存')
+        parser.add_argument('--trace', action='store_true',
+                          help='输出解析、转调和重建过程的调试追踪信息')
         return parser
 
 def setup_logging():
@@ -47,43 +85,160 @@ def transpose_data(data: dict, from_key: str, to_key: str, preserve_spaces: bool
         return data
         
     # 转调段落中的和弦
-    for para in data.get("paragraphs", []):
-        for run in para.get("runs", []):
-            run["text"] = ChordTransposer.transpose_text(
-                run["text"], 
-                from_key, 
-                to_key, 
-                preserve_spaces=preserve_spaces
-            )
+    with metrics.stage('transpose'):
+        transposition = Transposition(from_key, to_key)
+        for para in data.get("paragraphs", []):
+            for run in para.get("runs", []):
+                run["text"] = transposition.transpose_text(run["text"], preserve_spaces=preserve_spaces)
+    metrics.count('chords', transposition.chord_count())
             
     return data
 
+def save_ir(doc_parser: DocParser, data: dict, output_path: str, ir_format: str, compact: bool = None) -> None:
+    """按指定格式保存 IR"""
+    if ir_format == 'binary':
+        doc_parser.save_ir(data, output_path, compact=compact)
+    else:
+        doc_parser.save_to_json(data, output_path, compact=compact)
+
+def run_mode(args, trace_hook, stats: Metrics) -> int:
+    """執行指定的操作模式，返回退出碼"""
+    if args.mode == 'parse':
+        # 解析文檔
+        doc_parser = DocParser(engine=args.engine, compact=args.compact, trace_hook=trace_hook,
+                               cache_dir=args.ir_cache)
+        data = doc_parser.parse_docx(args.input)
+        save_ir(doc_parser, data, args.output, args.ir_format)
+        print(f"文檔解析完成，結果保存到: {args.output}")
+        
+    elif args.mode == 'rebuild':
+        # 讀取 IR 數據（JSON 或二進制格式）
+        data = DocParser().load_ir(args.input)
+            
+        # 如果指定了調號，進行轉調
+        if args.from_key and args.to_key:
+            data = transpose_data(data, args.from_key, args.to_key, args.preserve_spaces)
+            
+        # 重建文檔
+        rebuilder = DocRebuilder(trace_hook=trace_hook, backend=args.backend)
+        rebuilder.rebuild_docx(data, args.output)
+        print(f"文檔重建完成，保存到: {args.output}")
+
+    elif args.mode == 'convert' and args.streaming:
+        # 段落逐個從解析器經過轉調流向重建器，不保留整個文檔的 IR
+        if args.dump_ir or args.ir_cache:
+            print("--streaming 不保留完整 IR，不能與 --dump-ir 或 --ir-cache 同時使用")
+            return 1
+        convert_streaming(args.input, args.output, args.from_key, args.to_key, engine=args.engine,
+                          backend=args.backend, preserve_spaces=args.preserve_spaces, trace_hook=trace_hook)
+        print(f"文檔轉換完成，保存到: {args.output}")
+
+    elif args.mode == 'convert':
+        # 解析、轉調、重建都在內存中完成，不經過 JSON 文件
+        doc_parser = DocParser(engine=args.engine, compact=True, trace_hook=trace_hook, cache_dir=args.ir_cache)
+        data = doc_parser.parse_docx(args.input)
+        data = transpose_data(data, args.from_key, args.to_key, args.preserve_spaces)
+        if args.dump_ir:
+            save_ir(doc_parser, data, args.dump_ir, args.ir_format, compact=args.compact)
+            print(f"IR 已保存到: {args.dump_ir}")
+        DocRebuilder(trace_hook=trace_hook, backend=args.backend).rebuild_docx(data, args.output)
+        print(f"文檔轉換完成，保存到: {args.output}")
+
+    elif args.mode == 'patch':
+        # 直接改寫原文檔中的和弦
+        patcher = DocPatcher()
+        count = patcher.patch_docx(args.input, args.output, args.from_key, args.to_key)
+        print(f"和弦改寫完成（{count} 處），保存到: {args.output}")
+
+    elif args.mode == 'multi':
+        # 解析一次，在进程池中并行转调到各个调号
+        pool = ConversionPool(workers=args.jobs, trace=args.trace, metrics_sink=stats)
+        try:
+            results = convert_many(pool, args.input, args.from_key, parse_keys(args.to_keys),
+                                   args.convert_mode, args.ir_cache)
+            failed = []
+            with zipfile.ZipFile(args.output, 'w', zipfile.ZIP_STORED) as archive:
+                for to_key, output in results:
+                    if isinstance(output, Exception):
+                        failed.append(to_key)
+                        print(f"轉調到 {to_key} 失敗: {str(output)}")
+                        continue
+                    archive.writestr(f'converted_{to_key}.docx', output)
+        finally:
+            pool.shutdown()
+        print(f"多調號轉換完成，保存到: {args.output}")
+        if failed:
+            return 1
+
+    elif args.mode == 'batch':
+        return run_batch(args, stats)
+    return 0
+
+def collect_inputs(pattern: str) -> list:
+    """收集目录下的 .docx 或通配符匹配的文件，跳过 Word 的临时锁文件（~$ 开头）"""
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(pattern, '*.docx'))
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path) and not os.path.basename(path).startswith('~$'))
+
+def run_batch(args, stats: Metrics) -> int:
+    """在进程池中转调多个文档，单个文件失败不影响其余文件，返回退出码"""
+    inputs = collect_inputs(args.input)
+    if not inputs:
+        print(f"沒有找到要處理的文檔: {args.input}")
+        return 1
+    
+    # 输出目录中保留输入文件的相对路径
+    base = args.input if os.path.isdir(args.input) else os.path.commonpath([os.path.dirname(path) for path in inputs])
+    if os.path.abspath(base) == os.path.abspath(args.output):
+        print("輸出目錄不能與輸入目錄相同")
+        return 1
+    jobs = []
+    for path in inputs:
+        output_path = os.path.join(args.output, os.path.relpath(path, base))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        jobs.append((path, (path, output_path, args.from_key, args.to_key, args.convert_mode, args.ir_cache,
+                              args.preserve_spaces)))
+    
+    total = len(jobs)
+    failed = []
+    start = time.perf_counter()
+    pool = ConversionPool(workers=args.jobs, trace=args.trace, metrics_sink=stats)
+    try:
+        for done, (path, result) in enumerate(iter_jobs(pool, convert_file, jobs), 1):
+            if isinstance(result, Exception):
+                failed.append((path, result))
+                print(f"[{done}/{total}] 失敗: {path}: {str(result)}")
+            else:
+                print(f"[{done}/{total}] 完成: {path}")
+    finally:
+        pool.shutdown()
+    elapsed = time.perf_counter() - start
+    
+    print(f"\n批量轉換完成: 成功 {total - len(failed)} 個，失敗 {len(failed)} 個，"
+          f"耗時 {elapsed:.1f} 秒（{total / elapsed:.2f} 個/秒，{pool.workers} 個進程）")
+    for path, error in failed:
+        print(f"  {path}: {str(error)}")
+    return 1 if failed else 0
+
 def main():
     """主函數"""
     parser = LOGger.myparser()
     args = parser.parse_args()
+    trace_hook = print_hook if args.trace else None
+    ChordTransposer.set_trace_hook(trace_hook)
     
     try:
-        if args.mode == 'parse':
-            # 解析文檔
-            doc_parser = DocParser()
-            data = doc_parser.parse_docx(args.input)
-            doc_parser.save_to_json(data, args.output)
-            print(f"文檔解析完成，結果保存到: {args.output}")
-            
-        elif args.mode == 'rebuild':
-            # 讀取 JSON 數據
-            with open(args.input, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # 如果指定了調號，進行轉調
-            if args.from_key and args.to_key:
-                data = transpose_data(data, args.from_key, args.to_key, args.preserve_spaces)
-                
-            # 重建文檔
-            rebuilder = DocRebuilder()
-            rebuilder.rebuild_docx(data, args.output)
-            print(f"文檔重建完成，保存到: {args.output}")
+        # 記錄各階段耗時與計數，結束時輸出摘要（進程池中的任務由 stats 直接合併）
+        stats = Metrics()
+        with metrics.recording() as record:
+            exit_code = run_mode(args, trace_hook, stats)
+        stats.merge(record)
+        print("\n處理統計：")
+        print(stats.summary())
+        if exit_code:
+            sys.exit(exit_code)
             
     except Exception as e:
         print(f"錯誤: {str(e)}")
@@ -0,0 +1,172 @@
+"""
+轉換耗時與計數統計
+
+各階段（上傳、解析、轉調、序列化、重建、保存，以及直接改寫原文檔的 patch）的耗時記入直方圖，另有文檔、段落、run、和弦的計數。
+代碼中用 stage() / count() 記錄到當前線程的 JobRecord；沒有開啟記錄時兩者都不做任何事。
+JobRecord 是普通字典結構，可以從工作進程返回後再合併到父進程的 Metrics。
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+STAGES = ('upload', 'parse', 'transpose', 'serialize', 'rebuild', 'save', 'patch')
+COUNTERS = ('documents', 'paragraphs', 'runs', 'chords')
+
+# 直方圖桶的上界（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = 'docop'
+
+_local = threading.local()
+
+
+class JobRecord:
+    """單個任務的階段耗時與計數"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages.setdefault(name, []).append(seconds)
+
+    def add_count(self, name: str, value: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+
+def current_record() -> Optional[JobRecord]:
+    """返回當前線程正在記錄的 JobRecord"""
+    return getattr(_local, 'record', None)
+
+
+@contextmanager
+def recording(record: JobRecord = None) -> Iterator[JobRecord]:
+    """在當前線程開啟記錄，結束後恢復之前的記錄"""
+    previous = current_record()
+    _local.record = record if record is not None else JobRecord()
+    try:
+        yield _local.record
+    finally:
+        _local.record = previous
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """記錄一個階段的耗時"""
+    record = current_record()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add_stage(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int = 1) -> None:
+    """累加計數"""
+    record = current_record()
+    if record is not None:
+        record.add_count(name, value)
+
+
+def run_recorded(fn, args, kwargs):
+    """執行任務並返回 (結果, JobRecord)，供進程池在工作進程中調用"""
+    with recording() as record:
+        result = fn(*args, **kwargs)
+    return result, record
+
+
+class Histogram:
+    """累計直方圖"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """進程內彙總的直方圖與計數，線程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {name: Histogram() for name in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, stage_name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(stage_name)
+            if histogram is None:
+                histogram = self.histograms[stage_name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, record: JobRecord) -> None:
+        """合併一個任務的記錄"""
+        for name, values in record.stages.items():
+            for seconds in values:
+                self.observe(name, seconds)
+        for name, value in record.counts.items():
+            self.inc(name, value)
+
+    @contextmanager
+    def time(self, stage_name: str) -> Iterator[None]:
+        """直接記錄一個階段的耗時（不經過 JobRecord）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage_name, time.perf_counter() - start)
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus 文本格式"""
+        lines = [
+            f'# HELP {METRIC_PREFIX}_stage_duration_seconds Duration of each conversion stage.',
+            f'# TYPE {METRIC_PREFIX}_stage_duration_seconds histogram',
+        ]
+        with self._lock:
+            for name, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_sum{{stage="{name}"}} {histogram.sum}')
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_count{{stage="{name}"}} {histogram.count}')
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE {METRIC_PREFIX}_{name}_total counter')
+                lines.append(f'{METRIC_PREFIX}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """輸出給命令行閱讀的摘要"""
+        lines = []
+        with self._lock:
+            for name, histogram in self.histograms.items():
+                if not histogram.count:
+                    continue
+                average = histogram.sum / histogram.count * 1000
+                lines.append(f'{name:<10} {histogram.count:>6} 次  總計 {histogram.sum * 1000:10.1f} ms  平均 {average:8.1f} ms')
+            lines.append('  '.join(f'{name}: {value}' for name, value in self.counters.items()))
+        return '\n'.join(lines)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """返回各階段次數、總耗時與計數"""
+        with self._lock:
+            return {
+                'stages': {name: {'count': h.count, 'sum': h.sum} for name, h in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
@@ -0,0 +1,375 @@
+"""
+轉換流水線
+
+解析、轉調、重建都是 CPU 密集且持有 GIL 的操作，放在 Flask 請求線程中執行會讓併發上傳互相排隊。
+ConversionPool 把這些任務交給進程池執行，等待中的任務數有上限，滿了直接拋出 QueueFullError，
+由調用方快速回應 503；工作進程處理固定數量的任務後會被替換，避免 python-docx 的內存持續增長。
+"""
+import io
+import os
+import re
+import sys
+import logging
+import zipfile
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+from src.doc_patcher import DocPatcher
+from src.chord_transposer import ChordTransposer, Transposition
+from src.trace_hooks import logging_hook
+from src import metrics
+
+MODES = ('rebuild', 'patch')
+
+# 進程池的默認配置，可通過環境變量覆蓋
+DEFAULT_MAX_JOBS_PER_WORKER = 50
+# ProcessPoolExecutor 的 max_tasks_per_child 需要 Python 3.11 及以上，更早的版本由 ConversionPool 整體替換進程池
+NATIVE_RECYCLING = sys.version_info >= (3, 11)
+
+# 重建後端：默認 docx；設置 DOCOP_REBUILD_BACKEND=xml 時直接生成 run 元素，更快，輸出與 docx 後端逐字節相同
+REBUILD_BACKEND = os.environ.get('DOCOP_REBUILD_BACKEND') or 'docx'
+if REBUILD_BACKEND not in DocRebuilder.BACKENDS:
+    raise ValueError(f"不支持的重建後端: {REBUILD_BACKEND}")
+
+_trace_hook = None
+
+
+class QueueFullError(Exception):
+    """等待中的轉換任務已達上限"""
+
+
+def _init_worker(trace: bool = False) -> None:
+    """工作進程初始化：配置日誌與追踪回調"""
+    global _trace_hook
+    logging.basicConfig(level=logging.INFO)
+    _trace_hook = logging_hook(logging.getLogger('docOperation.trace'), logging.INFO) if trace else None
+    ChordTransposer.set_trace_hook(_trace_hook)
+
+
+def convert_file(input_path, output_path, from_key: str, to_key: str, mode: str = 'rebuild',
+                 ir_cache_dir: str = None, preserve_spaces: bool = True):
+    """轉調 input_path 並寫出到 output_path（模塊級函數，可在工作進程中執行）
+
+    指定 ir_cache_dir 時，同一文件轉調到其他調號會直接讀取緩存的解析結果。
+    preserve_spaces 只影響 rebuild；patch 只替換和弦文本，空白總是保留。
+    """
+    if mode not in MODES:
+        raise ValueError(f"不支持的轉換方式: {mode}")
+
+    if mode == 'patch':
+        # 只改寫包含和弦的文本節點，其餘部件原樣保留
+        return DocPatcher().patch_docx(input_path, output_path, from_key, to_key)
+
+    # 解析文檔（使用緊湊 IR，相同的 run 格式只保存一份）
+    data = parse_file(input_path, ir_cache_dir)
+
+    # 轉調並重建文檔
+    rebuild_transposed(data, from_key, to_key, output_path, preserve_spaces)
+    return None
+
+
+def convert_bytes(content, from_key: str, to_key: str, mode: str = 'rebuild',
+                  ir_cache_dir: str = None) -> bytes:
+    """轉調文檔並返回新文檔字節，不寫臨時文件
+
+    content 通常是文檔字節；超過內存上限、已經寫入磁盤的上傳直接傳文件路徑，由工作進程讀取。
+    """
+    if mode not in MODES:
+        raise ValueError(f"不支持的轉換方式: {mode}")
+    if mode == 'patch':
+        return patch_bytes(content, from_key, to_key)
+    return rebuild_transposed(parse_file(content, ir_cache_dir), from_key, to_key)
+
+
+@lru_cache(maxsize=None)
+def _shared_parser(ir_cache_dir: str, trace_hook) -> DocParser:
+    """進程內共享的解析器：DocParser 不保存解析狀態，可以被多個線程同時使用"""
+    return DocParser(compact=True, trace_hook=trace_hook, cache_dir=ir_cache_dir)
+
+
+def parse_file(input_path, ir_cache_dir: str = None) -> Dict[str, Any]:
+    """解析文檔為緊湊 IR，input_path 也可以是文檔字節"""
+    return _shared_parser(ir_cache_dir, _trace_hook).parse_docx(input_path)
+
+
+def transpose_ir(data: Dict[str, Any], from_key: str, to_key: str, preserve_spaces: bool = True) -> Dict[str, Any]:
+    """轉調 IR 中段落的和弦，返回新的 IR，不修改傳入的數據（多個調號共用同一份解析結果）"""
+    with metrics.stage('transpose'):
+        # 調號差與音高映射只計算一次，重複的和弦直接命中緩存
+        transposition = Transposition(from_key, to_key)
+        paragraphs = list(iter_transposed(data.get('paragraphs', []), transposition, preserve_spaces))
+    metrics.count('chords', transposition.chord_count())
+    return dict(data, paragraphs=paragraphs)
+
+
+def iter_transposed(paragraphs: Iterable[Dict[str, Any]], transposition: Transposition,
+                    preserve_spaces: bool = True) -> Iterator[Dict[str, Any]]:
+    """轉調生成器：逐個產出轉調後的段落副本，可以串接在 iter_paragraphs 與重建之間"""
+    for paragraph in paragraphs:
+        runs = []
+        for run in paragraph.get('runs', []):
+            if 'text' in run:
+                run = dict(run, text=transposition.transpose_text(run['text'], preserve_spaces=preserve_spaces))
+            runs.append(run)
+        yield dict(paragraph, runs=runs)
+
+
+def convert_streaming(input_path, output, from_key: str, to_key: str, engine: str = 'stream',
+                      backend: str = None, preserve_spaces: bool = True, trace_hook=None):
+    """以生成器串接解析、轉調和重建，不保留整個文檔的 IR
+
+    段落逐個從解析器流向重建器，內存峰值基本不隨文檔大小增長；
+    各階段交錯執行，因此只記錄整體的 rebuild 與 save 耗時。未指定 output 時返回文檔字節。
+    backend 與 trace_hook 未指定時使用 DOCOP_REBUILD_BACKEND 與進程的追踪配置。
+    """
+    trace_hook = trace_hook or _trace_hook
+    parser = DocParser(engine=engine, trace_hook=trace_hook)
+    transposition = Transposition(from_key, to_key)
+    tables = []
+    data = parser.parse_properties(input_path)
+    data['paragraphs'] = iter_transposed(parser.iter_paragraphs(input_path, tables), transposition, preserve_spaces)
+    data['tables'] = tables
+    rebuilder = DocRebuilder(trace_hook=trace_hook, backend=backend or REBUILD_BACKEND)
+    result = rebuilder.rebuild_docx(data, output)
+    metrics.count('chords', transposition.chord_count())
+    return result
+
+
+def rebuild_transposed(data: Dict[str, Any], from_key: str, to_key: str, output=None,
+                       preserve_spaces: bool = True):
+    """轉調並重建文檔，未指定 output 時返回文檔字節"""
+    rebuilder = DocRebuilder(trace_hook=_trace_hook, backend=REBUILD_BACKEND)
+    return rebuilder.rebuild_docx(transpose_ir(data, from_key, to_key, preserve_spaces), output)
+
+
+def patch_bytes(content, from_key: str, to_key: str) -> bytes:
+    """直接在原文檔（字節或路徑）上改寫和弦，返回新文檔字節"""
+    output = io.BytesIO()
+    DocPatcher().patch_docx(content, output, from_key, to_key)
+    return output.getvalue()
+
+
+def parse_keys(value: str) -> List[str]:
+    """解析以逗號或空白分隔的調號列表，為空或 all 時返回全部 12 個調"""
+    keys = [key for key in re.split(r'[,\s]+', value or '') if key]
+    if not keys or [key.lower() for key in keys] == ['all']:
+        return list(ChordTransposer.KEYS)
+    return list(dict.fromkeys(keys))
+
+
+def convert_many(pool: 'ConversionPool', input_path, from_key: str, to_keys: List[str],
+                 mode: str = 'rebuild', ir_cache_dir: str = None, waiting: bool = False) -> Iterator[Tuple[str, Any]]:
+    """解析一次，並行轉調到多個調號，input_path 也可以是文檔字節
+
+    rebuild 的解析立即執行，隊列已滿時直接拋出 QueueFullError，waiting 為 True 時改為等待空位；
+    patch 的各個任務直接讀取 input_path，返回的迭代器用完之前文件必須保留。
+    返回的迭代器按完成順序產出 (調號, 文檔字節)，單個調號失敗時產出 (調號, 異常)。
+    """
+    if mode not in MODES:
+        raise ValueError(f"不支持的轉換方式: {mode}")
+    if mode == 'patch':
+        # 文件路徑直接交給各個任務讀取，不整個讀入內存
+        payload = bytes(input_path) if isinstance(input_path, bytearray) else input_path
+        fn = patch_bytes
+    else:
+        submit = pool.submit_waiting if waiting else pool.submit
+        payload = submit(parse_file, input_path, ir_cache_dir).result()
+        fn = rebuild_transposed
+    return iter_jobs(pool, fn, [(key, (payload, from_key, key)) for key in to_keys])
+
+
+def iter_jobs(pool: 'ConversionPool', fn, jobs: Iterable[Tuple[Any, tuple]]) -> Iterator[Tuple[Any, Any]]:
+    """把 (標識, 參數) 逐個提交到進程池，按完成順序產出 (標識, 結果)，失敗時產出 (標識, 異常)"""
+    jobs = deque(jobs)
+    pending = {}
+    while jobs or pending:
+        # 盡量多提交；沒有空位時先等待自己已提交的任務完成，以免一個請求佔滿隊列
+        while jobs:
+            tag, args = jobs[0]
+            try:
+                future = pool.submit(fn, *args)
+            except QueueFullError:
+                if pending:
+                    break
+                future = pool.submit_waiting(fn, *args)
+            jobs.popleft()
+            pending[future] = tag
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            tag = pending.pop(future)
+            try:
+                yield tag, future.result()
+            except Exception as e:
+                yield tag, e
+
+
+class _ChunkWriter:
+    """收集 zipfile 寫出的數據，供流式響應分塊取出"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+
+def iter_zip(entries: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """將 (文件名, 內容) 逐個寫入 zip 並產出已生成的數據塊，無需先在內存或磁盤中拼出整個壓縮包"""
+    writer = _ChunkWriter()
+    # docx 本身已經壓縮，直接存儲即可
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            yield writer.drain()
+    yield writer.drain()
+
+
+class ConversionPool:
+    """有界的轉換進程池
+
+    workers 為 0 時不創建進程池，任務在調用線程中執行（仍受 queue_size 限制）。
+    queue_size 是同時在執行和排隊的任務總數上限。
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None,
+                 max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER, trace: bool = False,
+                 metrics_sink: metrics.Metrics = None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_size = queue_size or max(self.workers, 1) * 2
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.trace = trace
+        # 任務中記錄的階段耗時與計數合併到 metrics_sink
+        self.metrics_sink = metrics_sink
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_jobs = 0
+        if self.workers == 0 and trace:
+            # 在調用線程中執行時同樣開啟追踪
+            _init_worker(trace)
+
+    @classmethod
+    def from_env(cls, trace: bool = False, metrics_sink: metrics.Metrics = None) -> 'ConversionPool':
+        """從 DOCOP_POOL_WORKERS、DOCOP_QUEUE_SIZE、DOCOP_MAX_JOBS_PER_WORKER 讀取配置"""
+        workers = os.environ.get('DOCOP_POOL_WORKERS')
+        queue_size = os.environ.get('DOCOP_QUEUE_SIZE')
+        return cls(
+            workers=int(workers) if workers else None,
+            queue_size=int(queue_size) if queue_size else None,
+            max_jobs_per_worker=int(os.environ.get('DOCOP_MAX_JOBS_PER_WORKER', DEFAULT_MAX_JOBS_PER_WORKER)),
+            trace=trace,
+            metrics_sink=metrics_sink
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """延遲創建進程池，進程池損壞後重新創建
+
+        不支持 max_tasks_per_child 時，進程池累計處理 max_jobs_per_worker * workers 個任務後整體替換：
+        舊進程池不再接收任務，已提交的任務執行完後進程退出。
+        """
+        retired = None
+        with self._lock:
+            if (self._executor is not None and self.max_jobs_per_worker and not NATIVE_RECYCLING
+                    and self._executor_jobs >= self.max_jobs_per_worker * self.workers):
+                retired, self._executor = self._executor, None
+            if self._executor is None:
+                kwargs = {}
+                if self.max_jobs_per_worker and NATIVE_RECYCLING:
+                    kwargs['max_tasks_per_child'] = self.max_jobs_per_worker
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.trace,),
+                    **kwargs
+                )
+                self._executor_jobs = 0
+            self._executor_jobs += 1
+            executor = self._executor
+        if retired is not None:
+            retired.shutdown(wait=False)
+        return executor
+
+    def _reset_executor(self, executor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _run_inline(self, fn, args, kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """提交任務，等待中的任務已滿時拋出 QueueFullError"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"等待中的轉換任務已達上限 ({self.queue_size})")
+        return self._submit(fn, args, kwargs)
+
+    def submit_waiting(self, fn, *args, **kwargs) -> Future:
+        """提交任務，等待中的任務已滿時阻塞直到有空位"""
+        self._slots.acquire()
+        return self._submit(fn, args, kwargs)
+
+    def _submit(self, fn, args, kwargs) -> Future:
+        """在已取得名額的前提下提交任務，任務結束後釋放名額"""
+        # 任務在 run_recorded 中執行，連同階段耗時一起返回
+        job_args = (fn, args, kwargs)
+        try:
+            if self.workers == 0:
+                inner = self._run_inline(metrics.run_recorded, job_args, {})
+            else:
+                executor = self._get_executor()
+                try:
+                    inner = executor.submit(metrics.run_recorded, *job_args)
+                except BrokenProcessPool:
+                    # 工作進程異常退出後進程池不可再用，重建一次
+                    self._reset_executor(executor)
+                    inner = self._get_executor().submit(metrics.run_recorded, *job_args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        inner.add_done_callback(lambda done: self._finish(done, future))
+        return future
+
+    def _finish(self, inner: Future, future: Future) -> None:
+        """釋放名額，合併任務記錄並把結果交給調用方"""
+        self._slots.release()
+        try:
+            result, record = inner.result()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        if self.metrics_sink is not None:
+            self.metrics_sink.merge(record)
+        future.set_result(result)
+
+    def run(self, fn, *args, timeout: float = None, **kwargs):
+        """提交任務並等待結果"""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
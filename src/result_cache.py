@@ -0,0 +1,182 @@
+"""
+轉換結果緩存
+
+以上傳文件內容的 SHA-256、轉換方式、輸出代碼的版本和轉調半音數作為鍵，命中時直接返回之前的輸出，不再解析文檔。
+解析器、重建器或改寫器的版本遞增後，磁盤層中舊代碼生成的結果不再命中。
+分兩層：進程內按字節數限制的 LRU，以及按總大小淘汰的磁盤目錄（多個進程可共享，見 disk_lru）。
+磁盤層只是加速，讀寫失敗時當作未命中，不影響轉換結果。
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from src.chord_transposer import TRANSPOSER_VERSION, Transposition
+from src.doc_parser import PARSER_VERSION
+from src.doc_rebuilder import REBUILDER_VERSION
+from src.doc_patcher import PATCHER_VERSION
+from src.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+CACHE_SUFFIX = '.docx'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def transposition_key(from_key: str, to_key: str) -> str:
+    """規範化調號對：輸出只取決於半音數，例如 G->A 與 C->D 相同；缺少調號時不轉調"""
+    if not from_key or not to_key:
+        return 'none'
+    return str(Transposition(from_key, to_key, cache_size=0).semitones)
+
+
+def output_version(mode: str) -> str:
+    """生成該轉換方式輸出的代碼版本：rebuild 取決於解析器與重建器，patch 取決於改寫器，兩者都取決於轉調器"""
+    if mode == 'patch':
+        return f"x{PATCHER_VERSION}t{TRANSPOSER_VERSION}"
+    return f"p{PARSER_VERSION}r{REBUILDER_VERSION}t{TRANSPOSER_VERSION}"
+
+
+def content_digest(data) -> str:
+    """文檔內容的 SHA-256，data 可以是字節或文件路徑（按塊讀取，不整個讀入內存）"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(data, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def digest_key(digest: str, from_key: str, to_key: str, mode: str = 'rebuild') -> str:
+    """由內容哈希計算緩存鍵，同一文件轉到多個調號時只需計算一次哈希"""
+    return f"{digest}-{mode}-{output_version(mode)}-{transposition_key(from_key, to_key)}"
+
+
+def make_key(data, from_key: str, to_key: str, mode: str = 'rebuild') -> str:
+    """計算緩存鍵，data 可以是字節或文件路徑"""
+    return digest_key(content_digest(data), from_key, to_key, mode)
+
+
+class ResultCache:
+    """兩層轉換結果緩存
+
+    directory 為 None 或 disk_bytes 為 0 時只使用內存層。
+    """
+
+    def __init__(self, directory: str = None, memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 disk_bytes: int = DEFAULT_DISK_BYTES):
+        self.directory = directory if disk_bytes else None
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._disk = DiskLRU(self.directory, disk_bytes, CACHE_SUFFIX) if self.directory else None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        """從 DOCOP_CACHE_DIR、DOCOP_CACHE_MEMORY_MB、DOCOP_CACHE_DISK_MB 讀取配置"""
+        directory = os.environ.get('DOCOP_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'docop_cache')
+        memory_mb = float(os.environ.get('DOCOP_CACHE_MEMORY_MB', DEFAULT_MEMORY_BYTES / 1024 / 1024))
+        disk_mb = float(os.environ.get('DOCOP_CACHE_DISK_MB', DEFAULT_DISK_BYTES / 1024 / 1024))
+        return cls(directory, int(memory_mb * 1024 * 1024), int(disk_mb * 1024 * 1024))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """查找緩存，未命中返回 None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """寫入緩存；磁盤寫入失敗只記錄日誌，不影響已完成的轉換"""
+        with self._lock:
+            self._remember(key, data)
+        try:
+            self._write_disk(key, data)
+        except OSError as e:
+            logger.warning(f"寫入結果緩存失敗: {str(e)}")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        """寫入內存層並淘汰最久未使用的條目（調用方持有鎖）"""
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            self._disk.touch(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        if not self.directory or len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先寫臨時文件再原子替換，避免其他進程讀到寫了一半的文件
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self._disk.added(len(data))
+
+    def stats(self) -> dict:
+        """返回命中統計"""
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+            }
+
+    def clear(self) -> None:
+        """清空內存層（磁盤層保留）"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
@@ -0,0 +1,432 @@
+import zipfile
+from typing import Dict, Any, Iterator, Tuple
+from lxml import etree
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from docx.oxml.simpletypes import (
+    ST_HexColor, ST_HpsMeasure, ST_OnOff, ST_SignedTwipsMeasure, ST_TwipsMeasure
+)
+from docx.opc.coreprops import CoreProperties
+from docx.opc.parts.coreprops import CorePropertiesPart
+from docx.parts.styles import StylesPart
+from docx.styles.styles import Styles
+from docx.enum.section import WD_ORIENTATION, WD_SECTION_START
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_COLOR_INDEX, WD_LINE_SPACING, WD_UNDERLINE
+from docx.shared import Length, Pt
+
+DOCUMENT_PART = 'word/document.xml'
+STYLES_PART = 'word/styles.xml'
+CORE_PROPS_PART = 'docProps/core.xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+
+W_BODY = qn('w:body')
+W_P = qn('w:p')
+W_R = qn('w:r')
+W_TBL = qn('w:tbl')
+W_SECTPR = qn('w:sectPr')
+W_HYPERLINK = qn('w:hyperlink')
+W_BR = qn('w:br')
+W_VAL = qn('w:val')
+
+# run 内可转换为文本的子元素
+_RUN_TEXT_TAGS = {
+    qn('w:t'): None,
+    qn('w:tab'): '\t',
+    qn('w:ptab'): '\t',
+    qn('w:cr'): '\n',
+    qn('w:noBreakHyphen'): '-',
+    W_BR: None,
+}
+
+_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+class StreamParser:
+    """基于 lxml.etree.iterparse 的流式解析引擎，不经过 python-docx 的对象模型
+
+    输出结构与 DocParser 的 python-docx 引擎保持一致，每个 w:p 处理完成后立即释放。
+    """
+
+    def __init__(self, handler):
+        # handler 为 DocParser，用于共享和弦 run 合并逻辑与单位换算
+        self.handler = handler
+
+    def parse(self, file_path) -> Dict[str, Any]:
+        """流式解析 docx 文件并返回结构化数据"""
+        with zipfile.ZipFile(file_path) as package:
+            styles = self._load_styles(package)
+            sections = []
+            paragraphs = []
+            tables = []
+            with package.open(DOCUMENT_PART) as document_xml:
+                for kind, item in self._iter_body(document_xml, styles):
+                    if kind == 'paragraph':
+                        paragraphs.append(item)
+                    elif kind == 'table':
+                        tables.append(item)
+                    else:
+                        sections.append(item)
+            return {
+                "metadata": self._extract_metadata(package),
+                "sections": sections,
+                "paragraphs": paragraphs,
+                "tables": tables,
+                "images": self._extract_images(package),
+                "styles": self._extract_styles(styles)
+            }
+
+    def iter_paragraphs(self, file_path, tables: list = None) -> Iterator[Dict[str, Any]]:
+        """逐个产出正文段落，不保留已产出的段落；传入 tables 时，遇到的表格依次追加到其中"""
+        with zipfile.ZipFile(file_path) as package:
+            styles = self._load_styles(package)
+            with package.open(DOCUMENT_PART) as document_xml:
+                for kind, item in self._iter_body(document_xml, styles):
+                    if kind == 'paragraph':
+                        yield item
+                    elif kind == 'table' and tables is not None:
+                        tables.append(item)
+
+    def parse_properties(self, file_path) -> Dict[str, Any]:
+        """只解析元数据、图片和样式，不读取正文"""
+        with zipfile.ZipFile(file_path) as package:
+            return {
+                "metadata": self._extract_metadata(package),
+                "images": self._extract_images(package),
+                "styles": self._extract_styles(self._load_styles(package))
+            }
+
+    def _iter_body(self, source, styles: Styles) -> Iterator[Tuple[str, Any]]:
+        """逐个产出 w:body 下的段落、表格和节属性"""
+        style_names = _StyleNames(styles)
+        context = etree.iterparse(source, events=('end',), tag=(W_P, W_TBL, W_SECTPR))
+        for _, elem in context:
+            parent = elem.getparent()
+            if parent is None or parent.tag != W_BODY:
+                # 表格内的段落以及 pPr 中的 sectPr 由外层元素统一处理
+                continue
+
+            if elem.tag == W_P:
+                yield 'paragraph', self._parse_paragraph(elem, style_names)
+                pPr = elem.find(qn('w:pPr'))
+                sectPr = pPr.find(qn('w:sectPr')) if pPr is not None else None
+                if sectPr is not None:
+                    yield 'section', self._parse_section(sectPr)
+            elif elem.tag == W_TBL:
+                yield 'table', self._parse_table(elem)
+            else:
+                yield 'section', self._parse_section(elem)
+
+            # 释放已处理的元素及其之前的兄弟节点
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+        del context
+
+    def _parse_paragraph(self, p, style_names) -> Dict[str, Any]:
+        """解析段落元素，输出与 DocParser.parse_paragraph 相同的结构"""
+        pPr = p.find(qn('w:pPr'))
+        para_format = self._extract_paragraph_format(pPr)
+
+        runs = []
+        text_parts = []
+        for child in p:
+            if child.tag == W_R:
+                run_format = self._extract_run_formatting(child, style_names)
+                text_parts.append(run_format['text'])
+                runs.append(run_format)
+            elif child.tag == W_HYPERLINK:
+                text_parts.extend(_run_text(r) for r in child.iterchildren(W_R))
+        runs = self.handler.merge_chord_runs(runs)
+
+        style_id = _child_val(pPr, 'w:pStyle')
+        return {
+            'text': ''.join(text_parts),
+            'style': style_names.paragraph(style_id),
+            'format': para_format,
+            'runs': runs
+        }
+
+    def _extract_paragraph_format(self, pPr) -> Dict[str, Any]:
+        """提取段落格式，只保留非空的行距、段前段后间距与首行缩进"""
+        para_format = {}
+        if pPr is None:
+            return para_format
+
+        spacing = pPr.find(qn('w:spacing'))
+        if spacing is not None:
+            line = spacing.get(qn('w:line'))
+            if line is not None:
+                line = ST_SignedTwipsMeasure.convert_from_xml(line)
+                line_rule = spacing.get(qn('w:lineRule'))
+                line_rule = WD_LINE_SPACING.from_xml(line_rule) if line_rule else WD_LINE_SPACING.MULTIPLE
+                line_spacing = line / Pt(12) if line_rule == WD_LINE_SPACING.MULTIPLE else line
+                if line_spacing:
+                    para_format['line_spacing'] = line_spacing
+            for key, attr in (('space_before', 'w:before'), ('space_after', 'w:after')):
+                value = spacing.get(qn(attr))
+                if value is not None:
+                    value = ST_TwipsMeasure.convert_from_xml(value)
+                    if value:
+                        para_format[key] = value
+
+        ind = pPr.find(qn('w:ind'))
+        if ind is not None:
+            hanging = ind.get(qn('w:hanging'))
+            first_line = ind.get(qn('w:firstLine'))
+            if hanging is not None:
+                first_line_indent = Length(-ST_TwipsMeasure.convert_from_xml(hanging))
+            elif first_line is not None:
+                first_line_indent = ST_TwipsMeasure.convert_from_xml(first_line)
+            else:
+                first_line_indent = None
+            if first_line_indent:
+                para_format['first_line_indent'] = first_line_indent
+
+        return para_format
+
+    def _extract_run_formatting(self, r, style_names) -> Dict[str, Any]:
+        """直接从 w:r 元素提取格式信息"""
+        rPr = r.find(qn('w:rPr'))
+        vert_align = _child_val(rPr, 'w:vertAlign')
+        size = _child_val(rPr, 'w:sz')
+        run_format = {
+            "text": _run_text(r),
+            "bold": _on_off(rPr, 'w:b'),
+            "italic": _on_off(rPr, 'w:i'),
+            "underline": _underline(rPr),
+            "font_size": self.handler._convert_size_to_pt(
+                ST_HpsMeasure.convert_from_xml(size) if size is not None else None
+            ),
+            "font_name": None,
+            "style": style_names.character(_child_val(rPr, 'w:rStyle')),
+            "hyperlink": None,
+            "subscript": vert_align == 'subscript',
+            "superscript": vert_align == 'superscript'
+        }
+        if rPr is None:
+            return run_format
+
+        rFonts = rPr.find(qn('w:rFonts'))
+        if rFonts is not None:
+            run_format["font_name"] = rFonts.get(qn('w:ascii'))
+            run_format["font_ascii"] = rFonts.get(qn('w:ascii'))
+            run_format["font_east_asia"] = rFonts.get(qn('w:eastAsia'))
+            run_format["font_h_ansi"] = rFonts.get(qn('w:hAnsi'))
+            run_format["font_cs"] = rFonts.get(qn('w:cs'))
+            run_format["font_hint"] = rFonts.get(qn('w:hint'))
+
+        color = _child_val(rPr, 'w:color')
+        if color is not None:
+            run_format["color"] = ST_HexColor.convert_from_xml(color)
+
+        highlight = _child_val(rPr, 'w:highlight')
+        if highlight is not None:
+            run_format["highlight_color"] = WD_COLOR_INDEX.from_xml(highlight)
+
+        return run_format
+
+    def _parse_table(self, tbl) -> list:
+        """提取表格文本，按网格展开横向合并并沿用纵向合并的上方单元格"""
+        table_data = []
+        above = {}
+        for tr in tbl.iterchildren(qn('w:tr')):
+            row_data = []
+            current = {}
+            trPr = tr.find(qn('w:trPr'))
+            grid_offset = int(_child_val(trPr, 'w:gridBefore') or 0)
+            for tc in tr.iterchildren(qn('w:tc')):
+                tcPr = tc.find(qn('w:tcPr'))
+                span = int(_child_val(tcPr, 'w:gridSpan') or 1)
+                vmerge = tcPr.find(qn('w:vMerge')) if tcPr is not None else None
+                if vmerge is not None and vmerge.get(W_VAL, 'continue') == 'continue':
+                    cells = above.get(grid_offset, [])
+                else:
+                    text = '\n'.join(_paragraph_text(p) for p in tc.iterchildren(W_P))
+                    cells = [text] * span
+                row_data.extend(cells)
+                current[grid_offset] = cells
+                grid_offset += span
+            above = current
+            table_data.append(row_data)
+        return table_data
+
+    def _parse_section(self, sectPr) -> Dict[str, Any]:
+        """提取节属性，包括分栏设置"""
+        pgSz = sectPr.find(qn('w:pgSz'))
+        pgMar = sectPr.find(qn('w:pgMar'))
+        cols = sectPr.find(qn('w:cols'))
+        start_type = _child_val(sectPr, 'w:type')
+        orient = pgSz.get(qn('w:orient')) if pgSz is not None else None
+
+        cols_info = {
+            "count": "1",
+            "space": "0"
+        }
+        if cols is not None:
+            cols_info["count"] = cols.get(qn("w:num")) or "1"
+            cols_info["space"] = cols.get(qn("w:space")) or "0"
+
+        return {
+            "start_type": WD_SECTION_START.from_xml(start_type) if start_type else WD_SECTION_START.NEW_PAGE,
+            "page_height": _twips_pt(pgSz, 'w:h'),
+            "page_width": _twips_pt(pgSz, 'w:w'),
+            "left_margin": _twips_pt(pgMar, 'w:left'),
+            "right_margin": _twips_pt(pgMar, 'w:right'),
+            "top_margin": _twips_pt(pgMar, 'w:top', signed=True),
+            "bottom_margin": _twips_pt(pgMar, 'w:bottom', signed=True),
+            "header_distance": _twips_pt(pgMar, 'w:header'),
+            "footer_distance": _twips_pt(pgMar, 'w:footer'),
+            "orientation": WD_ORIENTATION.from_xml(orient) if orient else WD_ORIENTATION.PORTRAIT,
+            "columns": cols_info
+        }
+
+    def _load_styles(self, package: zipfile.ZipFile) -> Styles:
+        """加载样式表（样式部件很小，直接整体解析）"""
+        try:
+            xml = package.read(STYLES_PART)
+        except KeyError:
+            xml = StylesPart._default_styles_xml()
+        return Styles(parse_xml(xml))
+
+    def _extract_styles(self, styles: Styles) -> Dict[str, Any]:
+        """提取段落样式信息"""
+        result = {}
+        for style in styles:
+            if style.type == WD_STYLE_TYPE.PARAGRAPH:
+                result[style.name] = {
+                    "name": style.name,
+                    "font_name": style.font.name,
+                    "font_size": self.handler._convert_size_to_pt(style.font.size),
+                    "bold": style.font.bold,
+                    "italic": style.font.italic
+                }
+        return result
+
+    def _extract_metadata(self, package: zipfile.ZipFile) -> Dict[str, Any]:
+        """提取文档元数据"""
+        try:
+            core_properties = CoreProperties(parse_xml(package.read(CORE_PROPS_PART)))
+        except KeyError:
+            core_properties = CorePropertiesPart.default(None).core_properties
+        return {
+            "core_properties": {
+                "title": core_properties.title,
+                "author": core_properties.author,
+                "created": str(core_properties.created),
+                "modified": str(core_properties.modified)
+            }
+        }
+
+    def _extract_images(self, package: zipfile.ZipFile) -> list:
+        """从文档关系中提取图片信息"""
+        images = []
+        try:
+            rels = etree.fromstring(package.read(DOCUMENT_RELS_PART))
+        except KeyError:
+            return images
+        for rel in rels.iterchildren(_REL_NS + 'Relationship'):
+            target = rel.get('Target', '')
+            if "image" in target:
+                images.append({
+                    "id": rel.get('Id'),
+                    "type": target.split(".")[-1]
+                })
+        return images
+
+
+class _StyleNames:
+    """样式 id 到名称的缓存查找"""
+
+    def __init__(self, styles: Styles):
+        self._styles = styles
+        self._cache = {}
+
+    def paragraph(self, style_id):
+        return self._lookup(style_id, WD_STYLE_TYPE.PARAGRAPH)
+
+    def character(self, style_id):
+        return self._lookup(style_id, WD_STYLE_TYPE.CHARACTER)
+
+    def _lookup(self, style_id, style_type):
+        key = (style_id, style_type)
+        if key not in self._cache:
+            style = self._styles.get_by_id(style_id, style_type)
+            self._cache[key] = style.name if style is not None else None
+        return self._cache[key]
+
+
+def _child_val(parent, tag):
+    """返回子元素的 w:val 属性，不存在时返回 None"""
+    if parent is None:
+        return None
+    child = parent.find(qn(tag))
+    if child is None:
+        return None
+    return child.get(W_VAL)
+
+
+def _on_off(rPr, tag):
+    """解析 w:b、w:i 等开关属性，未设置返回 None"""
+    if rPr is None:
+        return None
+    child = rPr.find(qn(tag))
+    if child is None:
+        return None
+    val = child.get(W_VAL)
+    return True if val is None else ST_OnOff.convert_from_xml(val)
+
+
+def _underline(rPr):
+    """解析下划线，single/none 分别映射为 True/False"""
+    if rPr is None:
+        return None
+    u = rPr.find(qn('w:u'))
+    if u is None or u.get(W_VAL) is None:
+        return None
+    val = WD_UNDERLINE.from_xml(u.get(W_VAL))
+    if val == WD_UNDERLINE.SINGLE:
+        return True
+    if val == WD_UNDERLINE.NONE:
+        return False
+    return val
+
+
+def _run_text(r) -> str:
+    """拼接 run 的文本，换行、制表符等元素转换为对应字符"""
+    parts = []
+    for child in r:
+        if child.tag not in _RUN_TEXT_TAGS:
+            continue
+        text = _RUN_TEXT_TAGS[child.tag]
+        if text is not None:
+            parts.append(text)
+        elif child.tag == W_BR:
+            if child.get(qn('w:type'), 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        else:
+            parts.append(child.text or '')
+    return ''.join(parts)
+
+
+def _paragraph_text(p) -> str:
+    """段落文本，包含超链接中的文本"""
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child.iterchildren(W_R))
+    return ''.join(parts)
+
+
+def _twips_pt(element, attr, signed=False):
+    """读取以 twips 表示的长度并转换为磅值"""
+    if element is None:
+        return None
+    value = element.get(qn(attr))
+    if value is None:
+        return None
+    measure = ST_SignedTwipsMeasure if signed else ST_TwipsMeasure
+    return float(measure.convert_from_xml(value).pt)
+
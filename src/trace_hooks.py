@@ -0,0 +1,39 @@
+"""
+调试追踪钩子
+
+DocParser、DocRebuilder 和 ChordTransposer 在热点路径上只检查 trace_hook 是否为 None，
+默认不做任何格式化输出；需要调试时挂上这里的回调即可。
+回调签名为 hook(event: str, **fields)。
+"""
+import logging
+from typing import Callable, Optional
+
+TraceHook = Optional[Callable[..., None]]
+
+
+def format_event(event: str, fields: dict) -> str:
+    """将追踪事件格式化为一行文本"""
+    details = ', '.join(f"{key}={value!r}" for key, value in fields.items())
+    return f"[{event}] {details}"
+
+
+def print_hook(event: str, **fields) -> None:
+    """将追踪事件打印到标准输出"""
+    print(format_event(event, fields))
+
+
+def logging_hook(logger: logging.Logger = None, level: int = logging.DEBUG) -> Callable[..., None]:
+    """返回将追踪事件写入日志的回调"""
+    logger = logger or logging.getLogger('docOperation.trace')
+
+    def hook(event: str, **fields) -> None:
+        if logger.isEnabledFor(level):
+            logger.log(level, format_event(event, fields))
+    return hook
+
+
+def collect_hook(events: list) -> Callable[..., None]:
+    """返回将追踪事件收集到列表中的回调，便于测试"""
+    def hook(event: str, **fields) -> None:
+        events.append((event, fields))
+    return hook
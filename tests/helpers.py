@@ -0,0 +1,20 @@
+"""测试共用的辅助函数"""
+import io
+
+from docx import Document
+
+# 测试和弦谱的内容：一行和弦加一行歌词
+CHART_LINES = ('G   D/F#   Em7', 'Amazing grace')
+
+
+def build_chart(target=None):
+    """生成测试用和弦谱：target 为路径或缓冲区时写入其中，未指定时返回文档字节"""
+    doc = Document()
+    for line in CHART_LINES:
+        doc.add_paragraph(line)
+    if target is not None:
+        doc.save(target)
+        return None
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,145 @@
+import unittest
+import sys
+import os
+import io
+import asyncio
+import tempfile
+from unittest import mock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.pipeline import ConversionPool, convert_bytes
+from src.result_cache import ResultCache
+from tests.helpers import build_chart
+
+BOUNDARY = 'docop-test-boundary'
+
+
+def encode_form(fields, content):
+    """编码 multipart/form-data 请求体"""
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="chart.docx"\r\n'
+                 'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+    parts.append(f'--{BOUNDARY}--\r\n'.encode('utf-8'))
+    return b''.join(parts)
+
+
+def call(app, method, path, body=b'', chunk_size=7, content_type=f'multipart/form-data; boundary={BOUNDARY}'):
+    """以小块发送请求体调用 ASGI 应用，返回 (状态码, 响应头, 响应体块)"""
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]}
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    messages = []
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], headers, [message['body'] for message in messages[1:]]
+
+
+class TestAsgiConvert(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        import asgi
+        self.app_module = app_module
+        self.asgi = asgi.app
+        self.original = (app_module.POOL, app_module.CACHE)
+        app_module.POOL = ConversionPool(workers=0)
+        app_module.CACHE = ResultCache(disk_bytes=0)
+        self.content = build_chart()
+
+    def tearDown(self):
+        self.app_module.POOL, self.app_module.CACHE = self.original
+
+    def post(self, **fields):
+        return call(self.asgi, 'POST', '/api/convert', encode_form(fields, self.content))
+
+    def test_convert_streams_docx(self):
+        with mock.patch('asgi.CHUNK_SIZE', 1024):
+            status, headers, chunks = self.post(fromKey='G', toKey='A')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['x-cache'], 'MISS')
+        self.assertIn('filename=converted.docx', headers['content-disposition'])
+        body = b''.join(chunks)
+        self.assertEqual(int(headers['content-length']), len(body))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(Document(io.BytesIO(body)).paragraphs[0].text, 'A   E/G#   F#m7')
+
+        status, headers, second = self.post(fromKey='C', toKey='D')
+        self.assertEqual(headers['x-cache'], 'HIT')
+        self.assertEqual(b''.join(second), body)
+
+    def test_large_upload_passed_as_path(self):
+        # 超过内存上限的上传写入临时文件，转换直接读取该文件
+        with mock.patch.object(self.app_module, 'SPILL_BYTES', 0), \
+                mock.patch('asgi.convert_bytes', wraps=convert_bytes) as convert:
+            status, _, chunks = self.post(fromKey='G', toKey='A')
+        self.assertEqual(status, 200)
+        path = convert.call_args[0][0]
+        self.assertIsInstance(path, str)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Document(io.BytesIO(b''.join(chunks))).paragraphs[0].text, 'A   E/G#   F#m7')
+
+    def test_errors(self):
+        status, _, chunks = self.post(fromKey='G', toKey='A', mode='xslt')
+        self.assertEqual(status, 400)
+        self.assertIn('xslt', b''.join(chunks).decode('utf-8'))
+
+        # 等待队列已满时返回 503 与 Retry-After
+        self.app_module.POOL = ConversionPool(workers=0, queue_size=1)
+        self.app_module.POOL._slots.acquire()
+        status, headers, _ = self.post(fromKey='G', toKey='A')
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], str(self.app_module.RETRY_AFTER))
+
+        status, _, _ = call(self.asgi, 'POST', '/api/convert', b'{}', content_type='application/json')
+        self.assertEqual(status, 400)
+        self.assertEqual(call(self.asgi, 'GET', '/api/convert')[0], 405)
+
+    def test_lifespan_starts_jobs(self):
+        from src.job_queue import JobQueue
+        # 導入模塊不啟動異步任務的工作線程
+        self.assertEqual(self.app_module.JOBS._threads, [])
+        original = self.app_module.JOBS
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.app_module.JOBS = jobs = JobQueue(tmpdir, ConversionPool(workers=0), workers=1)
+            messages, sent = [{'type': 'lifespan.startup'}], []
+
+            async def receive():
+                if not messages:
+                    self.assertEqual(len(jobs._threads), 1)
+                    return {'type': 'lifespan.shutdown'}
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message['type'])
+
+            try:
+                asyncio.run(self.asgi({'type': 'lifespan'}, receive, send))
+            finally:
+                self.app_module.JOBS = original
+                jobs.stop()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(jobs._threads, [])
+
+    def test_index(self):
+        status, headers, chunks = call(self.asgi, 'GET', '/')
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['content-type'].startswith('text/html'))
+        with open(os.path.join(os.path.dirname(__file__), '..', 'templates', 'index.html'), 'rb') as f:
+            self.assertEqual(b''.join(chunks), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
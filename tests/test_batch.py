@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+import contextlib
+from types import SimpleNamespace
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.main import collect_inputs, run_batch
+from src.metrics import Metrics
+from tests.helpers import build_chart
+
+
+class TestBatchMode(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, 'charts')
+        self.output_dir = os.path.join(self.tmpdir.name, 'out')
+        os.makedirs(os.path.join(self.input_dir, 'hymns'))
+        for name in ('a.docx', os.path.join('hymns', 'b.docx')):
+            build_chart(os.path.join(self.input_dir, name))
+        with open(os.path.join(self.input_dir, 'broken.docx'), 'w') as f:
+            f.write('not a docx')
+        # Word 打开文档时留下的锁文件
+        open(os.path.join(self.input_dir, '~$a.docx'), 'w').close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_batch(self, pattern, preserve_spaces=True):
+        args = SimpleNamespace(input=pattern, output=self.output_dir, from_key='G', to_key='A',
+                               convert_mode='rebuild', ir_cache=None, jobs=0, trace=False,
+                               preserve_spaces=preserve_spaces)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            exit_code = run_batch(args, Metrics())
+        return exit_code, output.getvalue()
+
+    def test_collect_inputs(self):
+        names = [os.path.relpath(path, self.input_dir) for path in collect_inputs(self.input_dir)]
+        self.assertEqual(names, ['a.docx', 'broken.docx'])
+        pattern = os.path.join(self.input_dir, '**', '*.docx')
+        self.assertEqual(len(collect_inputs(pattern)), 3)
+
+    def test_continues_past_failures(self):
+        exit_code, output = self.run_batch(os.path.join(self.input_dir, '**', '*.docx'))
+        self.assertEqual(exit_code, 1)
+        self.assertIn('成功 2 個，失敗 1 個', output)
+        self.assertIn('broken.docx', output)
+        converted = Document(os.path.join(self.output_dir, 'hymns', 'b.docx'))
+        self.assertEqual(converted.paragraphs[0].text, 'A   E/G#   F#m7')
+
+    def test_preserve_spaces(self):
+        self.run_batch(self.input_dir, preserve_spaces=False)
+        converted = Document(os.path.join(self.output_dir, 'a.docx'))
+        self.assertEqual(converted.paragraphs[0].text, 'A E/G# F#m7')
+
+    def test_refuses_to_overwrite_inputs(self):
+        self.output_dir = self.input_dir
+        exit_code, _ = self.run_batch(self.input_dir)
+        self.assertEqual(exit_code, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.chord_transposer import ChordTransposer, Transposition
+
+CHORDS = ['G', 'D/F#', 'Em7', 'C##m', 'Bbmaj7', 'Abm7/Gb', 'F#sus4', 'Cadd9/E', 'B7b9', 'Ebb', 'G6/9', 'C6/9/E']
+TEXTS = [
+    'Em7    D/F#   G',
+    '  C / / / | Am7 / G/B / ',
+    'Verse 1',
+    'Gsus4  G',
+    'hallelujah  Dm7 ',
+]
+
+
+class TestTransposition(unittest.TestCase):
+    def test_matches_chord_transposer(self):
+        for from_key, to_key in [('G', 'A'), ('C', 'Eb'), ('E', 'C'), ('Bb', 'F#'), ('D', 'D')]:
+            transposition = Transposition(from_key, to_key)
+            for chord in CHORDS:
+                self.assertEqual(
+                    transposition.transpose_chord(chord),
+                    ChordTransposer.transpose_chord(chord, from_key, to_key),
+                    f"{chord} {from_key}->{to_key}"
+                )
+            for text in TEXTS:
+                for preserve_spaces in (True, False):
+                    self.assertEqual(
+                        transposition.transpose_text(text, preserve_spaces=preserve_spaces),
+                        ChordTransposer.transpose_text(text, from_key, to_key, preserve_spaces=preserve_spaces),
+                        f"{text!r} {from_key}->{to_key} preserve_spaces={preserve_spaces}"
+                    )
+
+    def test_pitch_map(self):
+        transposition = Transposition('C', 'D')
+        self.assertEqual(transposition.semitones, 2)
+        self.assertEqual(transposition.pitch_map[:3], ['D', 'D#', 'E'])
+        self.assertEqual(Transposition('A', 'G').semitones, 10)
+
+    def test_repeated_chords_are_memoized(self):
+        transposition = Transposition('G', 'A', cache_size=8)
+        for _ in range(10):
+            transposition.transpose_text('G  D/F#  Em7')
+        info = transposition.cache_info()
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.hits, 27)
+        self.assertEqual(info.maxsize, 8)
+
+
+class TestChordPattern(unittest.TestCase):
+    def test_iter_chords_offsets(self):
+        text = 'G  D/F# | Em7 C##m7b5/Bbb'
+        self.assertEqual(list(ChordTransposer.iter_chords(text)), [
+            (0, 1, 'G'), (3, 7, 'D/F#'), (10, 13, 'Em7'), (14, 25, 'C##m7b5/Bbb')
+        ])
+
+    def test_lyrics_are_not_chords(self):
+        for word in ['Every', 'Bless', 'CMS', 'Abba', 'Add', '(G)', 'Intro/Inter:', 'C/']:
+            self.assertFalse(ChordTransposer.is_chord(word), word)
+        for word in ['A', 'Bb', 'Gsus4', 'Cmaj7', 'C(add9)/E', 'Am7-5', 'E7#9', 'F#dim7']:
+            self.assertTrue(ChordTransposer.is_chord(word), word)
+
+    def test_split_chord(self):
+        self.assertEqual(ChordTransposer.split_chord('Bbm7/F'), ('Bb', 'm7', 'F'))
+        # 斜杠后的数字属于延伸音，不是低音
+        self.assertEqual(ChordTransposer.split_chord('G6/9'), ('G', '6/9', ''))
+        self.assertEqual(ChordTransposer.split_chord('C6/9/E'), ('C', '6/9', 'E'))
+        self.assertEqual(ChordTransposer.split_chord('Verse'), ('', '', ''))
+        self.assertEqual(Transposition('G', 'A').transpose_text('G6/9  C6/9/E'), 'A6/9  D6/9/F#')
+
+    def test_spaces(self):
+        transposition = Transposition('G', 'A')
+        self.assertEqual(transposition.transpose_text('  G   Em7 \tC '), '  A   F#m7 \tD ')
+        self.assertEqual(transposition.transpose_text('  G   Em7 \tC ', preserve_spaces=False), 'A F#m7 D')
+        self.assertEqual(transposition.transpose_text('   ', preserve_spaces=False), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.compact_ir import FormatTable, compact_ir, expand_ir, is_compact, resolve_run
+from src.doc_parser import DocParser
+
+
+class TestCompactIR(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'metadata': {},
+            'paragraphs': [
+                {'text': 'G#m', 'style': 'Normal', 'format': {}, 'runs': [
+                    {'text': 'G#', 'font_size': 12.0, 'bold': None,
+                     'accidentals': [{'text': '#', 'superscript': True, 'font_size': 8.0}]},
+                    {'text': 'm', 'font_size': 12.0, 'bold': None},
+                ]},
+                {'text': 'Amen', 'style': 'Normal', 'format': {}, 'runs': [
+                    {'text': 'Amen', 'font_size': 12.0, 'bold': True},
+                ]},
+            ]
+        }
+
+    def test_identical_formats_are_interned(self):
+        result = compact_ir(self.data)
+        self.assertTrue(is_compact(result))
+        self.assertFalse(is_compact(self.data), "compact_ir 不应修改原始数据")
+        self.assertEqual(result['formats'], [
+            {'font_size': 12.0, 'bold': None},
+            {'font_size': 12.0, 'bold': True},
+        ])
+        runs = result['paragraphs'][0]['runs']
+        self.assertEqual(runs[0]['format_id'], runs[1]['format_id'])
+        self.assertEqual(runs[0]['accidentals'], self.data['paragraphs'][0]['runs'][0]['accidentals'])
+
+    def test_round_trip(self):
+        self.assertEqual(expand_ir(compact_ir(self.data)), self.data)
+
+    def test_bool_and_int_are_distinct(self):
+        table = FormatTable()
+        self.assertNotEqual(table.intern({'bold': True}), table.intern({'bold': 1}))
+
+    def test_resolve_plain_run(self):
+        run = {'text': 'C', 'font_size': 12.0}
+        self.assertIs(resolve_run(run, None), run)
+
+    def test_json_round_trip(self):
+        parser = DocParser()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'compact.json')
+            parser.save_to_json(self.data, path, compact=True)
+            self.assertTrue(is_compact(parser.load_from_json(path)))
+            self.assertEqual(parser.load_from_json(path, expand=True), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
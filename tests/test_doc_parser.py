@@ -1,12 +1,28 @@
 import unittest
 import sys
 import os
+import io
+from concurrent.futures import ThreadPoolExecutor
 
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from docx import Document
 from src.doc_parser import DocParser
 
+
+def build_chord_sheet(paragraphs=10):
+    """生成和弦与升降号分开存放的文档，每段的内容各不相同"""
+    doc = Document()
+    for i in range(paragraphs):
+        paragraph = doc.add_paragraph()
+        for text in ('CDEFGAB'[i % 7], '#' if i % 2 else 'b', f'm{i % 9}   ', 'G', '#', f'   line {i}'):
+            run = paragraph.add_run(text)
+            run.font.superscript = text in ('#', 'b')
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
 class TestDocParser(unittest.TestCase):
     def setUp(self):
         self.parser = DocParser()
@@ -82,5 +98,17 @@ class TestDocParser(unittest.TestCase):
         result5 = self.parser.merge_chord_runs(test_case5)
         self.assertEqual(result5, expected5, "复杂和弦测试失败")
 
+
+class TestConcurrentParsing(unittest.TestCase):
+    def test_shared_parser_is_deterministic(self):
+        documents = [build_chord_sheet(10 + i) for i in range(4)]
+        for engine in DocParser.ENGINES:
+            parser = DocParser(engine=engine, compact=True)
+            expected = [parser.parse_docx(content) for content in documents]
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(parser.parse_docx, documents * 4))
+            for i, result in enumerate(results):
+                self.assertEqual(result, expected[i % len(documents)], f"{engine} 引擎并发解析结果不一致")
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import tempfile
+import zipfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.doc_patcher import DocPatcher
+
+
+class TestDocPatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, 'input.docx')
+        self.output_path = os.path.join(self.tmpdir.name, 'output.docx')
+
+        doc = Document()
+        doc.sections[0].header.paragraphs[0].text = 'G   D'
+        para = doc.add_paragraph()
+        for text in ['G', '#', 'm7   D/F', '#', '   Em7']:
+            run = para.add_run(text)
+            run.font.superscript = text == '#'
+        doc.add_paragraph('hallelujah amen')
+        doc.save(self.input_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_patch_chords(self):
+        count = DocPatcher().patch_docx(self.input_path, self.output_path, 'G', 'A')
+        # 正文 3 个和弦，页眉 2 个和弦
+        self.assertEqual(count, 5)
+
+        doc = Document(self.output_path)
+        para = doc.paragraphs[0]
+        self.assertEqual(para.text, 'A#m7   E/G#   F#m7')
+        # 升降号仍写在原来的上标 run 中
+        self.assertEqual([r.text for r in para.runs], ['A', '#', 'm7   E/G', '#', '   F#m7'])
+        self.assertTrue(para.runs[1].font.superscript)
+        self.assertEqual(doc.paragraphs[1].text, 'hallelujah amen')
+        self.assertEqual(doc.sections[0].header.paragraphs[0].text, 'A   E')
+
+    def test_untouched_parts_are_copied(self):
+        DocPatcher().patch_docx(self.input_path, self.output_path, 'G', 'A')
+        with zipfile.ZipFile(self.input_path) as zin, zipfile.ZipFile(self.output_path) as zout:
+            self.assertEqual(zin.namelist(), zout.namelist())
+            for name in zin.namelist():
+                if name in ('word/document.xml', 'word/header1.xml'):
+                    continue
+                self.assertEqual(zin.read(name), zout.read(name), name)
+
+    def test_same_key_is_noop(self):
+        self.assertEqual(DocPatcher().patch_docx(self.input_path, self.output_path, 'G', 'G'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
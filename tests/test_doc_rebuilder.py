@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+import io
+import zipfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from docx.enum.text import WD_COLOR_INDEX
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+from src.doc_template import build_base_document, new_document
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+class TestRunFormat(unittest.TestCase):
+    def setUp(self):
+        self.rebuilder = DocRebuilder()
+        self.doc = Document()
+
+    def rebuild(self, runs):
+        return self.rebuilder.rebuild_paragraph(self.doc, {'style': 'Normal', 'runs': runs})
+
+    def test_template_shared_per_format(self):
+        bold = {'bold': True, 'font_size': 12.0, 'font_ascii': 'Arial'}
+        paragraph = self.rebuild([dict(bold, text='G'), dict(bold, text=' lyric '), {'text': 'x', 'italic': True}])
+        # 和弦 G 与歌词格式相同，只构建两个模板
+        self.assertEqual(len(self.rebuilder._rpr_templates), 2)
+        first, second, third = paragraph.runs
+        self.assertIsNot(first._element.rPr, second._element.rPr)
+        self.assertEqual(first._element.rPr.xml, second._element.rPr.xml)
+        self.assertTrue(first.bold)
+        self.assertEqual(first.font.size.pt, 12.0)
+        self.assertEqual(first._element.rPr.rFonts.get(
+            '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}ascii'), 'Arial')
+        self.assertTrue(third.italic)
+
+        # 修改一个 run 的格式不影响模板和其他 run
+        first.italic = True
+        self.assertIsNone(second.italic)
+        self.assertIsNone(self.rebuild([dict(bold, text='D')]).runs[0].italic)
+
+    def test_accidentals_superscript(self):
+        runs = self.rebuild([{'text': 'F#m7', 'font_size': 12.0}]).runs
+        self.assertEqual([run.text for run in runs], ['F', '#', 'm7'])
+        self.assertEqual([run.font.superscript for run in runs], [None, True, None])
+
+    def test_highlight(self):
+        for value in (WD_COLOR_INDEX.YELLOW, int(WD_COLOR_INDEX.YELLOW)):
+            run = self.rebuild([{'text': 'x', 'highlight_color': value}]).runs[0]
+            self.assertEqual(run.font.highlight_color, WD_COLOR_INDEX.YELLOW)
+
+    def test_hyperlink_not_shared(self):
+        link = {'font_size': 12.0, 'hyperlink': {'url': 'https://example.com'}}
+        self.rebuild([dict(link, text='a'), dict(link, text='b')])
+        body = self.doc.element.body
+        hyperlinks = body.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}hyperlink')
+        self.assertEqual(len(hyperlinks), 2)
+        for hyperlink in hyperlinks:
+            self.assertEqual(len(hyperlink.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rStyle')), 1)
+
+
+class TestBackends(unittest.TestCase):
+    def document_xml(self, backend, data):
+        output = DocRebuilder(backend=backend).rebuild_docx(data)
+        return zipfile.ZipFile(io.BytesIO(output)).read('word/document.xml')
+
+    def test_xml_backend_matches_docx_backend(self):
+        bundled = DocParser().load_ir(os.path.join(ROOT, 'output.json'))
+        mixed = {'paragraphs': [
+            {'style': 'Heading 1', 'format': {'space_after': 6.0}, 'runs': [{'text': 'Title', 'bold': True}]},
+            {'style': 'Normal', 'runs': [
+                {'text': 'Bbm7/Ab', 'font_size': 14.0, 'color': 'FF0000'},
+                {'text': '  tab\there  ', 'highlight_color': int(WD_COLOR_INDEX.YELLOW)},
+                {'text': 'link', 'hyperlink': {'url': 'https://example.com'}},
+                {'text': ''},
+            ]},
+        ]}
+        for data in (bundled, mixed):
+            self.assertEqual(self.document_xml('xml', data), self.document_xml('docx', data))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            DocRebuilder(backend='sax')
+
+
+def package_parts(doc):
+    output = io.BytesIO()
+    doc.save(output)
+    archive = zipfile.ZipFile(output)
+    return {name: archive.read(name) for name in archive.namelist()}
+
+
+class TestTemplate(unittest.TestCase):
+    def test_clone_matches_base_document(self):
+        self.assertEqual(package_parts(new_document()), package_parts(build_base_document()))
+
+    def test_clones_are_independent(self):
+        first = new_document()
+        first.add_paragraph('changed')
+        first.styles['Normal'].font.name = 'Arial'
+        first.core_properties.title = 'changed'
+        second = new_document()
+        self.assertEqual(len(second.paragraphs), 0)
+        self.assertEqual(second.styles['Normal'].font.name, 'Calibri')
+        self.assertIn('Hyperlink', second.styles)
+        self.assertNotEqual(second.core_properties.title, 'changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
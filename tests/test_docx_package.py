@@ -0,0 +1,151 @@
+import unittest
+import sys
+import os
+import io
+import zipfile
+import struct
+import zlib
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.doc_patcher import DocPatcher
+from src.doc_template import clone_document, new_document
+from src.doc_parser import DocParser
+from src.docx_package import DocxPackage, PackageWriter, open_document, save_document
+
+
+def build_png(width, height):
+    """生成随机像素的 PNG"""
+    raw = b''.join(b'\x00' + os.urandom(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+class _Sink:
+    """只支持 write 的输出流"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+
+class TestPackageWriter(unittest.TestCase):
+    def test_round_trip_to_unseekable_sink(self):
+        source = io.BytesIO()
+        with zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('word/media/image1.bin', os.urandom(4096))
+            archive.writestr('stored.txt', b'plain', compress_type=zipfile.ZIP_STORED)
+
+        sink = _Sink()
+        with DocxPackage(source.getvalue()) as package, PackageWriter(sink) as writer:
+            for info in package.infolist():
+                writer.copy(package, info)
+            writer.write('word/文档.xml', '和弦 G#'.encode('utf-8'))
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(sink.chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['word/media/image1.bin', 'stored.txt', 'word/文档.xml'])
+            self.assertEqual(archive.getinfo('stored.txt').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.read('word/文档.xml').decode('utf-8'), '和弦 G#')
+            with zipfile.ZipFile(source) as original:
+                self.assertEqual(archive.read('word/media/image1.bin'), original.read('word/media/image1.bin'))
+
+    def test_save_document(self):
+        doc = new_document()
+        doc.add_paragraph('G   D/F#   Em7')
+        expected = io.BytesIO()
+        doc.save(expected)
+        output = io.BytesIO()
+        save_document(doc, output)
+        with zipfile.ZipFile(expected) as a, zipfile.ZipFile(output) as b:
+            self.assertEqual(a.namelist(), b.namelist())
+            for name in a.namelist():
+                self.assertEqual(a.read(name), b.read(name), name)
+        self.assertEqual(Document(output).paragraphs[0].text, 'G   D/F#   Em7')
+
+    def test_clone_document_with_image(self):
+        image = build_png(8, 8)
+        doc = Document()
+        doc.add_picture(io.BytesIO(image))
+        clone = clone_document(doc)
+        parts = [part for part in clone.part.package.iter_parts() if part.partname.startswith('/word/media/')]
+        self.assertEqual([type(part).__name__ for part in parts], ['ImagePart'])
+        self.assertEqual(parts[0].blob, image)
+        # 再次插入同一图片时复用已有的图片部件
+        clone.add_picture(io.BytesIO(image))
+        output = io.BytesIO()
+        clone.save(output)
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual([name for name in archive.namelist() if name.startswith('word/media/')],
+                             ['word/media/image1.png'])
+
+
+class TestPatchPassthrough(unittest.TestCase):
+    def test_media_copied_without_recompression(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            plain = os.path.join(tmpdir, 'plain.docx')
+            input_path = os.path.join(tmpdir, 'input.docx')
+            output_path = os.path.join(tmpdir, 'output.docx')
+            doc = Document()
+            doc.add_paragraph('G   D')
+            doc.save(plain)
+            # 加入一张（内容随机、无法压缩的）大图片
+            with zipfile.ZipFile(plain) as zin, zipfile.ZipFile(input_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    zout.writestr(info, zin.read(info))
+                zout.writestr('word/media/image1.png', os.urandom(1 << 20))
+
+            DocPatcher().patch_docx(input_path, output_path, 'G', 'A')
+
+            with DocxPackage(input_path) as before, DocxPackage(output_path) as after:
+                raw_before = {info.filename: before.read_raw(info) for info in before.infolist()}
+                raw_after = {info.filename: after.read_raw(info) for info in after.infolist()}
+            self.assertEqual(list(raw_before), list(raw_after))
+            for name in raw_before:
+                if name == 'word/document.xml':
+                    self.assertNotEqual(raw_before[name], raw_after[name])
+                else:
+                    self.assertEqual(raw_before[name], raw_after[name], name)
+            self.assertEqual(Document(output_path).paragraphs[0].text, 'A   E')
+
+
+class TestOpenDocument(unittest.TestCase):
+    def setUp(self):
+        self.image = build_png(64, 64)
+        doc = Document()
+        doc.core_properties.title = '测试'
+        doc.add_paragraph('G   D/F#', style='Heading 1')
+        doc.add_picture(io.BytesIO(self.image))
+        output = io.BytesIO()
+        doc.save(output)
+        self.content = output.getvalue()
+
+    def test_media_not_loaded(self):
+        doc = open_document(self.content)
+        self.assertEqual(doc.paragraphs[0].text, 'G   D/F#')
+        self.assertEqual(doc.paragraphs[0].style.name, 'Heading 1')
+        self.assertEqual(doc.core_properties.title, '测试')
+        image_parts = [rel.target_part for rel in doc.part.rels.values() if 'image' in rel.reltype]
+        self.assertEqual(len(image_parts), 1)
+        self.assertIsNone(image_parts[0]._blob)
+        # 访问时才读取
+        self.assertEqual(image_parts[0].blob, self.image)
+
+    def test_parser_output_unchanged(self):
+        expected = DocParser(engine='stream').parse_docx(self.content)
+        result = DocParser().parse_docx(self.content)
+        self.assertEqual(result, expected)
+        self.assertEqual(result['images'][0]['type'], 'png')
+
+
+if __name__ == '__main__':
+    unittest.main()
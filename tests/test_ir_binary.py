@@ -0,0 +1,79 @@
+import unittest
+import sys
+import os
+import io
+import json
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src import ir_binary
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+
+OUTPUT_JSON = os.path.join(os.path.dirname(__file__), '..', 'output.json')
+
+
+class TestIRBinary(unittest.TestCase):
+    def test_round_trip_values(self):
+        value = {
+            'text': 'G#m7 和弦', 'none': None, 'flags': [True, False],
+            'ints': [0, 1, -1, 127, 128, -129, 2 ** 40, 203200],
+            'floats': [12.0, 10.5, -0.35, 0.1 + 0.2, 1e-9, 1e300, float('inf')],
+            'nested': [{'text': 'G', 'font_size': 9.0}, {'text': 'G', 'font_size': 9.0}, {}],
+        }
+        decoded = ir_binary.loads(ir_binary.dumps(value))
+        self.assertEqual(decoded, value)
+        self.assertEqual([type(v) for v in decoded['floats']], [float] * 7)
+        self.assertEqual([type(v) for v in decoded['flags']], [bool, bool])
+
+    def test_strings_and_shapes_are_interned(self):
+        runs = [{'text': 'chorus', 'style': 'Default Paragraph Font'} for _ in range(100)]
+        # 每个 run 只写键序列编号和两个字符串编号
+        self.assertEqual(len(ir_binary.dumps(runs)), len(ir_binary.dumps(runs[:1])) + 99 * 6)
+
+    def test_bundled_ir(self):
+        with open(OUTPUT_JSON, encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(ir_binary.loads(ir_binary.dumps(data)), data)
+
+    def test_rejects_bad_input(self):
+        encoded = ir_binary.dumps({'text': 'G'})
+        with self.assertRaises(ir_binary.IRFormatError):
+            ir_binary.loads(b'{"text": "G"}')
+        with self.assertRaises(ir_binary.IRFormatError):
+            ir_binary.loads(encoded[:5] + bytes([ir_binary.FORMAT_VERSION + 1]) + encoded[6:])
+        with self.assertRaises(ir_binary.IRFormatError):
+            ir_binary.loads(encoded[:-1])
+        with self.assertRaises(TypeError):
+            ir_binary.dumps({'value': object()})
+
+
+class TestIRFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.parser = DocParser()
+        self.data = self.parser.load_from_json(OUTPUT_JSON)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmpdir.name, 'ir.docir')
+        self.parser.save_ir(self.data, path, compact=True)
+        self.assertIn('formats', self.parser.load_ir(path))
+        self.assertEqual(self.parser.load_ir(path, expand=True), self.data)
+        # load_ir 同样可以读取 JSON
+        self.assertEqual(self.parser.load_ir(OUTPUT_JSON), self.data)
+
+    def test_rebuild_from_bytes(self):
+        output = DocRebuilder().rebuild_docx(ir_binary.dumps(self.data))
+        expected = DocRebuilder().rebuild_docx(self.data)
+        self.assertEqual([p.text for p in Document(io.BytesIO(output)).paragraphs],
+                         [p.text for p in Document(io.BytesIO(expected)).paragraphs])
+
+
+if __name__ == '__main__':
+    unittest.main()
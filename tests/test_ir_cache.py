@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest import mock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from docx.shared import Pt
+from src.doc_parser import DocParser, PARSER_VERSION
+from src.ir_cache import IRCache
+from src.compact_ir import expand_ir
+
+
+class TestIRCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.input_path = os.path.join(self.tmpdir.name, 'input.docx')
+        doc = Document()
+        para = doc.add_paragraph()
+        for text in ['G', '#', 'm7   D/F', '#']:
+            run = para.add_run(text)
+            if text == '#':
+                run.font.superscript = True
+                run.font.size = Pt(8)
+        doc.add_paragraph('Amazing grace')
+        doc.save(self.input_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_second_parse_hits_cache(self):
+        for engine in DocParser.ENGINES:
+            parser = DocParser(engine=engine, cache_dir=self.cache_dir)
+            first = parser.parse_docx(self.input_path)
+            with mock.patch('src.doc_parser.open_document') as document, \
+                    mock.patch('src.stream_parser.StreamParser.parse') as stream_parse:
+                second = DocParser(engine=engine, cache_dir=self.cache_dir).parse_docx(self.input_path)
+                document.assert_not_called()
+                stream_parse.assert_not_called()
+            # 缓存中的 IR 经过 JSON 序列化，与首次解析的 JSON 形式一致
+            self.assertEqual(second, json.loads(json.dumps(first)))
+            self.assertEqual(parser.ir_cache.misses, 1)
+
+    def test_compact_and_full_share_entry(self):
+        compact = DocParser(compact=True, cache_dir=self.cache_dir).parse_docx(self.input_path)
+        parser = DocParser(cache_dir=self.cache_dir)
+        full = parser.parse_docx(self.input_path)
+        self.assertEqual(parser.ir_cache.hits, 1)
+        self.assertIn('formats', compact)
+        self.assertEqual(full, expand_ir(compact))
+
+    def test_version_change_invalidates(self):
+        stale = IRCache(self.cache_dir, '1')
+        stale.put('key', {'paragraphs': []})
+        # 缓存目录中与缓存无关的目录和文件不受影响
+        for name in ('venv', 'videos', 'v1'):
+            os.makedirs(os.path.join(self.cache_dir, name, 'keep'))
+        os.makedirs(os.path.join(stale.base, 'vendor'))
+        DocParser(cache_dir=self.cache_dir)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['docop-ir', 'v1', 'venv', 'videos'])
+        self.assertEqual(sorted(os.listdir(stale.base)), ['v' + PARSER_VERSION, 'vendor'])
+        for name in ('venv', 'videos', 'v1'):
+            self.assertTrue(os.path.isdir(os.path.join(self.cache_dir, name, 'keep')))
+
+    def test_size_limit(self):
+        cache = IRCache(self.cache_dir, PARSER_VERSION, max_bytes=100)
+        for i in range(5):
+            cache.put(f'k{i}', {'paragraphs': [{'text': 'x' * 30}]})
+            os.utime(cache._path(f'k{i}'), (i, i))
+        cache.put('k5', {'paragraphs': [{'text': 'x' * 30}]})
+        self.assertIsNone(cache.get('k0'))
+        self.assertIsNotNone(cache.get('k5'))
+        total = sum(entry.stat().st_size for entry in os.scandir(cache.root))
+        self.assertLessEqual(total, 100)
+
+    def test_write_failure_does_not_fail_parse(self):
+        parser = DocParser(cache_dir=self.cache_dir)
+        expected = DocParser().parse_docx(self.input_path)
+        with mock.patch('src.ir_cache.tempfile.mkstemp', side_effect=OSError('disk full')), \
+                self.assertLogs('src.ir_cache', 'WARNING'):
+            self.assertEqual(parser.parse_docx(self.input_path), expected)
+        with mock.patch('src.disk_lru.os.walk', side_effect=OSError('gone')), \
+                self.assertLogs('src.ir_cache', 'WARNING'):
+            self.assertEqual(parser.parse_docx(self.input_path), expected)
+
+    def test_corrupt_entry_is_reparsed(self):
+        parser = DocParser(cache_dir=self.cache_dir)
+        expected = parser.parse_docx(self.input_path)
+        for name in os.listdir(parser.ir_cache.root):
+            with open(os.path.join(parser.ir_cache.root, name), 'w') as f:
+                f.write('{')
+        self.assertEqual(parser.parse_docx(self.input_path), expected)
+        self.assertEqual(parser.ir_cache.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+import sys
+import os
+import io
+import time
+import zipfile
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.job_queue import SCHEMA, JobQueue
+from src.pipeline import ConversionPool, QueueFullError, convert_many
+from src.result_cache import ResultCache, content_digest, make_key
+from tests.helpers import build_chart
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = ConversionPool(workers=0)
+        self.content = build_chart()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def queue(self, **kwargs):
+        kwargs.setdefault('workers', 0)
+        return JobQueue(self.tmpdir.name, self.pool, **kwargs)
+
+    def read_result(self, queue, job_id):
+        with open(queue.result_path(job_id), 'rb') as f:
+            return f.read()
+
+    def test_single_key(self):
+        queue = self.queue()
+        job_id = queue.submit(self.content, 'G', ['A'])
+        self.assertEqual(queue.get(job_id)['status'], 'queued')
+        self.assertIsNone(queue.result_path(job_id))
+        self.assertTrue(queue.run_next())
+        self.assertFalse(queue.run_next())
+
+        job = queue.get(job_id)
+        self.assertEqual((job['status'], job['progress']), ('done', {'done': 1, 'total': 1}))
+        text = Document(io.BytesIO(self.read_result(queue, job_id))).paragraphs[0].text
+        self.assertEqual(text, 'A   E/G#   F#m7')
+        # 上传文件在任务结束后删除
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, f'{job_id}.input')))
+
+    def test_archive_and_cache(self):
+        cache = ResultCache(disk_bytes=0)
+        queue = self.queue(cache=cache)
+        first = queue.submit(self.content, 'G', ['A', 'C'], archive=True)
+        queue.run_next()
+        second = queue.submit(self.content, 'G', ['C', 'D'], archive=True)
+        queue.run_next()
+
+        archive = zipfile.ZipFile(io.BytesIO(self.read_result(queue, first)))
+        self.assertEqual(archive.namelist(), ['converted_A.docx', 'converted_C.docx'])
+        archive = zipfile.ZipFile(io.BytesIO(self.read_result(queue, second)))
+        self.assertEqual(archive.namelist(), ['converted_C.docx', 'converted_D.docx'])
+        self.assertEqual(queue.get(second)['progress'], {'done': 2, 'total': 2})
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+
+        failed = queue.submit(b'not a docx', 'G', ['A'])
+        queue.run_next()
+        job = queue.get(failed)
+        self.assertEqual(job['status'], 'failed')
+        self.assertTrue(job['error'])
+        self.assertIsNone(queue.result_path(failed))
+
+    def test_submitted_digest(self):
+        cache = ResultCache(disk_bytes=0)
+        queue = self.queue(cache=cache)
+        job_id = queue.submit(self.content, 'G', ['A'], digest=content_digest(self.content))
+        # 上傳時已算好哈希，執行任務時不再讀一遍文件
+        with mock.patch('src.job_queue.content_digest', side_effect=AssertionError('content_digest')):
+            queue.run_next()
+        self.assertEqual(queue.get(job_id)['status'], 'done')
+        self.assertEqual(cache.get(make_key(self.content, 'G', 'A')), self.read_result(queue, job_id))
+
+    def test_migrates_old_database(self):
+        db = sqlite3.connect(os.path.join(self.tmpdir.name, 'jobs.sqlite3'))
+        db.executescript(SCHEMA.replace('    digest TEXT,\n', ''))
+        db.close()
+        queue = self.queue(cache=ResultCache(disk_bytes=0))
+        job_id = queue.submit(self.content, 'G', ['A'])
+        queue.run_next()
+        self.assertEqual(queue.get(job_id)['status'], 'done')
+
+    def test_survives_restart(self):
+        job_id = self.queue().submit(self.content, 'G', ['A'])
+        # 领取后进程中断：租约过期前不会被重新领取
+        crashed = self.queue(lease=0.05)
+        self.assertIsNotNone(crashed._claim())
+        restarted = self.queue()
+        self.assertFalse(restarted.run_next())
+        time.sleep(0.1)
+        self.assertTrue(restarted.run_next())
+        job = restarted.get(job_id)
+        self.assertEqual(job['status'], 'done')
+
+    def test_heartbeat_keeps_lease(self):
+        queue = self.queue(lease=0.15)
+        job_id = queue.submit(self.content, 'G', ['A'])
+        started, release = threading.Event(), threading.Event()
+
+        def slow_convert(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return convert_many(*args, **kwargs)
+
+        with mock.patch('src.job_queue.convert_many', side_effect=slow_convert):
+            worker = threading.Thread(target=queue.run_next)
+            worker.start()
+            started.wait(10)
+            # 转换时间超过租约，心跳续约后其他进程仍不能领取
+            time.sleep(0.5)
+            self.assertIsNone(self.queue()._claim())
+            release.set()
+            worker.join()
+        self.assertEqual(queue.get(job_id)['status'], 'done')
+
+    def test_purge_while_busy(self):
+        queue = self.queue(workers=1, ttl=0)
+        job_ids = [queue.submit(self.content, 'G', ['A']) for _ in range(3)]
+        with mock.patch('src.job_queue.PURGE_INTERVAL', 0):
+            queue.start()
+            try:
+                deadline = time.time() + 30
+                while os.path.exists(queue.db_path) and time.time() < deadline:
+                    with queue._connect() as db:
+                        if not db.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]:
+                            break
+                    time.sleep(0.01)
+            finally:
+                queue.stop()
+        remaining = [name for name in os.listdir(self.tmpdir.name) if name.split('.')[0] in job_ids]
+        self.assertEqual(remaining, [])
+
+    def test_abandoned_after_max_attempts(self):
+        queue = self.queue(lease=0)
+        job_id = queue.submit(self.content, 'G', ['A'])
+        for _ in range(3):
+            self.assertIsNotNone(queue._claim())
+        self.assertFalse(queue.run_next())
+        self.assertEqual(queue.get(job_id)['status'], 'failed')
+
+    def test_ttl(self):
+        queue = self.queue(ttl=0)
+        job_id = queue.submit(self.content, 'G', ['A'])
+        queue.run_next()
+        self.assertIsNone(queue.get(job_id))
+        self.assertEqual(queue.purge(), 1)
+        self.assertEqual(os.listdir(self.tmpdir.name).count(f'{job_id}.result'), 0)
+
+    def test_queue_size(self):
+        queue = self.queue(queue_size=1)
+        queue.submit(self.content, 'G', ['A'])
+        with self.assertRaises(QueueFullError):
+            queue.submit(self.content, 'G', ['A'])
+        with self.assertRaises(ValueError):
+            queue.submit(self.content, 'G', ['A'], mode='xslt')
+
+    def test_worker_threads(self):
+        queue = self.queue(workers=1)
+        job_id = queue.submit(self.content, 'G', ['A'])
+        queue.start()
+        try:
+            deadline = time.time() + 30
+            while queue.get(job_id)['status'] != 'done' and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            queue.stop()
+        self.assertEqual(queue.get(job_id)['status'], 'done')
+
+
+class TestJobEndpoints(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.app_module = app_module
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = app_module.JOBS
+        app_module.JOBS = JobQueue(self.tmpdir.name, ConversionPool(workers=0), workers=0)
+        self.client = app_module.app.test_client()
+        self.content = build_chart()
+
+    def tearDown(self):
+        self.app_module.JOBS = self.original
+        self.tmpdir.cleanup()
+
+    def post(self, **fields):
+        fields['file'] = (io.BytesIO(self.content), 'chart.docx')
+        return self.client.post('/api/jobs', data=fields, content_type='multipart/form-data')
+
+    def test_job_lifecycle(self):
+        response = self.post(fromKey='G', toKey='A')
+        self.assertEqual(response.status_code, 202)
+        status_url = response.headers['Location']
+        self.assertEqual(self.client.get(status_url).get_json()['status'], 'queued')
+        result_url = status_url + '/result'
+        self.assertEqual(self.client.get(result_url).status_code, 409)
+
+        self.app_module.JOBS.run_next()
+        job = self.client.get(status_url).get_json()
+        self.assertEqual(job['status'], 'done')
+        result = self.client.get(job['result'])
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(Document(io.BytesIO(result.data)).paragraphs[0].text, 'A   E/G#   F#m7')
+        result.close()
+
+        response = self.post(fromKey='G', toKeys='A,C')
+        self.app_module.JOBS.run_next()
+        result = self.client.get(response.headers['Location'] + '/result')
+        self.assertEqual(result.mimetype, 'application/zip')
+        self.assertEqual(len(zipfile.ZipFile(io.BytesIO(result.data)).namelist()), 2)
+        result.close()
+
+        self.assertEqual(self.client.get('/api/jobs/unknown').status_code, 404)
+        self.assertEqual(self.post(fromKey='G', toKey='A', mode='xslt').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+import io
+import json
+import tempfile
+import contextlib
+from unittest import mock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src import main
+from src.chord_transposer import ChordTransposer
+from tests.helpers import build_chart
+
+
+class TestConvertMode(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, 'input.docx')
+        build_chart(self.input_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_main(self, *argv):
+        with mock.patch.object(sys, 'argv', ['main.py', *argv]), \
+                contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_matches_parse_then_rebuild(self):
+        self.run_main('--mode', 'convert', '--input', self.input_path, '--output', self.path('convert.docx'),
+                      '--from-key', 'G', '--to-key', 'A')
+        self.run_main('--mode', 'parse', '--input', self.input_path, '--output', self.path('ir.json'))
+        self.run_main('--mode', 'rebuild', '--input', self.path('ir.json'), '--output', self.path('rebuild.docx'),
+                      '--from-key', 'G', '--to-key', 'A')
+        converted = Document(self.path('convert.docx'))
+        rebuilt = Document(self.path('rebuild.docx'))
+        self.assertEqual(converted.paragraphs[0].text, 'A   E/G#   F#m7')
+        self.assertEqual([p.text for p in converted.paragraphs], [p.text for p in rebuilt.paragraphs])
+
+    def test_no_json_without_dump_ir(self):
+        with mock.patch('json.dump', side_effect=AssertionError('json.dump')):
+            self.run_main('--mode', 'convert', '--input', self.input_path, '--output', self.path('convert.docx'),
+                          '--from-key', 'G', '--to-key', 'A')
+        self.run_main('--mode', 'convert', '--input', self.input_path, '--output', self.path('convert.docx'),
+                      '--from-key', 'G', '--to-key', 'A', '--dump-ir', self.path('dump.json'))
+        with open(self.path('dump.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['paragraphs'][0]['runs'][0]['text'], 'A   E/G#   F#m7')
+
+    def test_streaming_options(self):
+        args = ['--mode', 'convert', '--streaming', '--input', self.input_path, '--output', self.path('stream.docx'),
+                '--from-key', 'G', '--to-key', 'A']
+        self.addCleanup(ChordTransposer.set_trace_hook, None)
+        with mock.patch('src.main.convert_streaming') as convert:
+            self.run_main(*args, '--backend', 'xml', '--trace')
+        self.assertEqual(convert.call_args[1]['backend'], 'xml')
+        self.assertTrue(convert.call_args[1]['preserve_spaces'])
+        self.assertIsNotNone(convert.call_args[1]['trace_hook'])
+
+        self.run_main(*args, '--backend', 'xml')
+        self.assertEqual(Document(self.path('stream.docx')).paragraphs[0].text, 'A   E/G#   F#m7')
+        # 流式轉換不經過解析結果緩存，明確拒絕而不是忽略
+        with self.assertRaises(SystemExit):
+            self.run_main(*args, '--ir-cache', self.path('cache'))
+
+
+if __name__ == '__main__':
+    unittest.main()
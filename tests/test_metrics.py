@@ -0,0 +1,75 @@
+import unittest
+import sys
+import os
+import io
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import metrics
+from src.metrics import Metrics
+from src.pipeline import ConversionPool, convert_bytes
+from src.result_cache import ResultCache
+from tests.helpers import build_chart
+
+
+class TestMetrics(unittest.TestCase):
+    def test_no_recording_is_noop(self):
+        self.assertIsNone(metrics.current_record())
+        with metrics.stage('parse'):
+            metrics.count('chords', 3)
+        self.assertIsNone(metrics.current_record())
+
+    def test_histogram_buckets(self):
+        stats = Metrics()
+        for seconds in (0.004, 0.005, 0.2, 100):
+            stats.observe('parse', seconds)
+        text = stats.render_prometheus()
+        self.assertIn('docop_stage_duration_seconds_bucket{stage="parse",le="0.005"} 2', text)
+        self.assertIn('docop_stage_duration_seconds_bucket{stage="parse",le="0.25"} 3', text)
+        self.assertIn('docop_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 4', text)
+        self.assertIn('docop_stage_duration_seconds_count{stage="parse"} 4', text)
+
+    def test_pool_merges_job_records(self):
+        content = build_chart()
+        for workers in (0, 1):
+            stats = Metrics()
+            pool = ConversionPool(workers=workers, metrics_sink=stats)
+            try:
+                pool.run(convert_bytes, content, 'G', 'A', timeout=60)
+                pool.run(convert_bytes, content, 'G', 'A', 'patch', timeout=60)
+            finally:
+                pool.shutdown()
+            snapshot = stats.snapshot()
+            for stage_name in ('parse', 'transpose', 'rebuild', 'save', 'patch'):
+                self.assertEqual(snapshot['stages'][stage_name]['count'], 1, stage_name)
+            self.assertEqual(snapshot['counters'], {'documents': 2, 'paragraphs': 2, 'runs': 2, 'chords': 6})
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.app_module = app_module
+        self.original = (app_module.POOL, app_module.CACHE, app_module.METRICS)
+        app_module.METRICS = Metrics()
+        app_module.POOL = ConversionPool(workers=0, metrics_sink=app_module.METRICS)
+        app_module.CACHE = ResultCache(disk_bytes=0)
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        self.app_module.POOL, self.app_module.CACHE, self.app_module.METRICS = self.original
+
+    def test_metrics_after_convert(self):
+        response = self.client.post('/api/convert', data={
+            'file': (io.BytesIO(build_chart()), 'chart.docx'), 'fromKey': 'G', 'toKey': 'A'
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('docop_stage_duration_seconds_count{stage="upload"} 1', text)
+        self.assertIn('docop_stage_duration_seconds_count{stage="rebuild"} 1', text)
+        self.assertIn('docop_chords_total 3', text)
+        self.assertIn('docop_result_cache_misses_total 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import unittest
+import sys
+import os
+import io
+import time
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+import zipfile
+from unittest import mock
+from src.pipeline import (ConversionPool, QueueFullError, convert_bytes, convert_file, convert_many,
+                          convert_streaming, iter_zip, parse_file, parse_keys, patch_bytes, transpose_ir)
+from src.result_cache import ResultCache
+from tests.helpers import build_chart
+
+
+class TestConversionPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, 'input.docx')
+        self.output_path = os.path.join(self.tmpdir.name, 'output.docx')
+        build_chart(self.input_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_convert_file_modes(self):
+        for mode in ('rebuild', 'patch'):
+            convert_file(self.input_path, self.output_path, 'G', 'A', mode)
+            self.assertEqual(Document(self.output_path).paragraphs[0].text, 'A   E/G#   F#m7')
+        with self.assertRaises(ValueError):
+            convert_file(self.input_path, self.output_path, 'G', 'A', 'unknown')
+
+    def test_convert_bytes(self):
+        with open(self.input_path, 'rb') as f:
+            content = f.read()
+        for mode in ('rebuild', 'patch'):
+            output = convert_bytes(content, 'G', 'A', mode)
+            self.assertEqual(Document(io.BytesIO(output)).paragraphs[0].text, 'A   E/G#   F#m7')
+
+    def test_convert_streaming(self):
+        for engine in ('docx', 'stream'):
+            convert_streaming(self.input_path, self.output_path, 'G', 'A', engine=engine)
+            self.assertEqual([p.text for p in Document(self.output_path).paragraphs],
+                             ['A   E/G#   F#m7', 'Amazing grace'])
+        with open(self.input_path, 'rb') as f:
+            output = convert_streaming(f.read(), None, 'G', 'A')
+        self.assertEqual(Document(io.BytesIO(output)).paragraphs[0].text, 'A   E/G#   F#m7')
+
+    def test_process_pool(self):
+        pool = ConversionPool(workers=1, queue_size=2, max_jobs_per_worker=1)
+        try:
+            # 每個工作進程只處理一個任務，第二個任務由新進程執行
+            for _ in range(2):
+                pool.run(convert_file, self.input_path, self.output_path, 'G', 'Bb', timeout=60)
+                self.assertEqual(Document(self.output_path).paragraphs[0].text, 'A#   F/A   Gm7')
+        finally:
+            pool.shutdown()
+
+    def test_manual_recycling(self):
+        # 不支持 max_tasks_per_child 的 Python 版本上整體替換進程池
+        with mock.patch('src.pipeline.NATIVE_RECYCLING', False):
+            pool = ConversionPool(workers=1, queue_size=2, max_jobs_per_worker=2)
+            try:
+                pids = [pool.run(os.getpid, timeout=60) for _ in range(4)]
+            finally:
+                pool.shutdown()
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_queue_full(self):
+        pool = ConversionPool(workers=1, queue_size=1)
+        try:
+            future = pool.submit(time.sleep, 0.5)
+            with self.assertRaises(QueueFullError):
+                pool.submit(time.sleep, 0)
+            future.result(timeout=60)
+            # 任務完成後釋放名額
+            pool.run(time.sleep, 0, timeout=60)
+        finally:
+            pool.shutdown()
+
+    def test_inline_errors_release_slot(self):
+        pool = ConversionPool(workers=0, queue_size=1)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                pool.run(convert_file, self.input_path, self.output_path, 'G', 'A', 'unknown')
+
+
+class TestMultiKey(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, 'input.docx')
+        build_chart(self.input_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse_keys(self):
+        self.assertEqual(len(parse_keys('')), 12)
+        self.assertEqual(len(parse_keys('ALL')), 12)
+        self.assertEqual(parse_keys('A, Bb  A,C#'), ['A', 'Bb', 'C#'])
+
+    def test_transpose_ir_keeps_source(self):
+        data = parse_file(self.input_path)
+        transposed = transpose_ir(data, 'G', 'A')
+        self.assertEqual(data['paragraphs'][0]['runs'][0]['text'], 'G   D/F#   Em7')
+        self.assertEqual(transposed['paragraphs'][0]['runs'][0]['text'], 'A   E/G#   F#m7')
+
+    def test_convert_many(self):
+        for mode in ('rebuild', 'patch'):
+            pool = ConversionPool(workers=0, queue_size=1)
+            results = dict(convert_many(pool, self.input_path, 'G', ['A', 'C'], mode))
+            self.assertEqual(Document(io.BytesIO(results['A'])).paragraphs[0].text, 'A   E/G#   F#m7')
+            self.assertEqual(Document(io.BytesIO(results['C'])).paragraphs[0].text, 'C   G/B   Am7')
+
+    def test_iter_zip(self):
+        entries = [('a.txt', b'first'), ('b.txt', b'second')]
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(iter_zip(iter(entries)))))
+        self.assertEqual([(name, archive.read(name)) for name in archive.namelist()], entries)
+
+
+class TestConvertEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.app_module = app_module
+        self.original = (app_module.POOL, app_module.CACHE)
+        # 使用空緩存，確保請求進入轉換流程
+        app_module.CACHE = ResultCache(disk_bytes=0)
+        self.client = app_module.app.test_client()
+        self.buffer = io.BytesIO()
+        Document().save(self.buffer)
+
+    def tearDown(self):
+        self.app_module.POOL, self.app_module.CACHE = self.original
+
+    def post(self):
+        self.buffer.seek(0)
+        return self.client.post('/api/convert', data={
+            'file': (self.buffer, 'chart.docx'), 'fromKey': 'G', 'toKey': 'A'
+        }, content_type='multipart/form-data')
+
+    def test_backpressure(self):
+        pool = ConversionPool(workers=1, queue_size=1)
+        self.app_module.POOL = pool
+        try:
+            future = pool.submit(time.sleep, 0.5)
+            response = self.post()
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+            future.result(timeout=60)
+        finally:
+            pool.shutdown()
+
+    def test_multi(self):
+        self.app_module.POOL = ConversionPool(workers=0)
+        self.buffer = io.BytesIO()
+        build_chart(self.buffer)
+        self.buffer.seek(0)
+        response = self.client.post('/api/convert/multi', data={
+            'file': (self.buffer, 'chart.docx'), 'fromKey': 'G', 'toKeys': 'A,C'
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(sorted(archive.namelist()), ['converted_A.docx', 'converted_C.docx'])
+        text = Document(io.BytesIO(archive.read('converted_C.docx'))).paragraphs[0].text
+        self.assertEqual(text, 'C   G/B   Am7')
+
+    def test_large_upload_passed_as_path(self):
+        self.app_module.POOL = ConversionPool(workers=0)
+        self.buffer = io.BytesIO()
+        build_chart(self.buffer)
+        # 超過內存上限的上傳留在臨時文件中，只把路徑交給轉換，不再讀回內存
+        with mock.patch.object(self.app_module, 'SPILL_BYTES', 0), \
+                mock.patch('app.convert_bytes', wraps=convert_bytes) as convert:
+            response = self.post()
+        self.assertEqual(response.status_code, 200)
+        path = convert.call_args[0][0]
+        self.assertIsInstance(path, str)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(Document(io.BytesIO(response.data)).paragraphs[0].text, 'A   E/G#   F#m7')
+
+    def test_large_upload_patch_multi(self):
+        self.app_module.POOL = ConversionPool(workers=0)
+        self.buffer = io.BytesIO()
+        build_chart(self.buffer)
+        self.buffer.seek(0)
+        # patch 在返回響應時才讀取上傳，直接傳遞臨時文件路徑，響應發送完畢後才刪除
+        with mock.patch.object(self.app_module, 'SPILL_BYTES', 0), \
+                mock.patch('src.pipeline.patch_bytes', wraps=patch_bytes) as patch:
+            response = self.client.post('/api/convert/multi', data={
+                'file': (self.buffer, 'chart.docx'), 'fromKey': 'G', 'toKeys': 'A,C', 'mode': 'patch'
+            }, content_type='multipart/form-data')
+            archive = zipfile.ZipFile(io.BytesIO(response.data))
+            path = patch.call_args[0][0]
+            self.assertIsInstance(path, str)
+            response.close()
+        self.assertFalse(os.path.exists(path))
+        text = Document(io.BytesIO(archive.read('converted_C.docx'))).paragraphs[0].text
+        self.assertEqual(text, 'C   G/B   Am7')
+
+    def test_inline_pool(self):
+        self.app_module.POOL = ConversionPool(workers=0)
+        # 上傳、轉換和返回都在內存中完成，不創建臨時文件
+        with mock.patch('tempfile.NamedTemporaryFile', side_effect=AssertionError('temp file')), \
+                mock.patch('tempfile.TemporaryFile', side_effect=AssertionError('temp file')):
+            response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Document(io.BytesIO(response.data)).paragraphs, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+from unittest import mock
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.result_cache import ResultCache, make_key, transposition_key
+from tests.helpers import build_chart
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_normalization(self):
+        self.assertEqual(transposition_key('G', 'A'), transposition_key('C', 'D'))
+        self.assertEqual(transposition_key('Gb', 'A'), transposition_key('F#', 'A'))
+        self.assertNotEqual(transposition_key('G', 'A'), transposition_key('G', 'B'))
+        self.assertEqual(transposition_key('', 'A'), 'none')
+        self.assertNotEqual(make_key(b'a', 'G', 'A'), make_key(b'b', 'G', 'A'))
+        self.assertNotEqual(make_key(b'a', 'G', 'A'), make_key(b'a', 'G', 'A', 'patch'))
+
+    def test_version_bump_misses(self):
+        cache = ResultCache(self.tmpdir.name, disk_bytes=1024)
+        rebuild, patch = make_key(b'a', 'G', 'A'), make_key(b'a', 'G', 'A', 'patch')
+        cache.put(rebuild, b'old rebuild')
+        cache.put(patch, b'old patch')
+        for name in ('PARSER_VERSION', 'REBUILDER_VERSION'):
+            with mock.patch(f'src.result_cache.{name}', 'next'):
+                # 新進程只有磁盤層
+                restarted = ResultCache(self.tmpdir.name, disk_bytes=1024)
+                self.assertIsNone(restarted.get(make_key(b'a', 'G', 'A')))
+                self.assertEqual(restarted.get(make_key(b'a', 'G', 'A', 'patch')), b'old patch')
+        with mock.patch('src.result_cache.PATCHER_VERSION', 'next'):
+            self.assertIsNone(cache.get(make_key(b'a', 'G', 'A', 'patch')))
+            self.assertEqual(cache.get(make_key(b'a', 'G', 'A')), b'old rebuild')
+        with mock.patch('src.result_cache.TRANSPOSER_VERSION', 'next'):
+            self.assertIsNone(cache.get(make_key(b'a', 'G', 'A')))
+            self.assertIsNone(cache.get(make_key(b'a', 'G', 'A', 'patch')))
+
+    def test_memory_lru(self):
+        cache = ResultCache(memory_bytes=10, disk_bytes=0)
+        cache.put('a', b'12345')
+        cache.put('b', b'12345')
+        self.assertEqual(cache.get('a'), b'12345')
+        cache.put('c', b'12345')
+        # b 最久未使用，被淘汰
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'12345')
+        self.assertEqual(cache.stats()['memory_hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_disk_tier(self):
+        cache = ResultCache(self.tmpdir.name, memory_bytes=1024, disk_bytes=1024)
+        cache.put('ab1', b'x' * 100)
+        # 新實例（例如另一個進程）從磁盤讀取並提升到內存
+        other = ResultCache(self.tmpdir.name, memory_bytes=1024, disk_bytes=1024)
+        self.assertEqual(other.get('ab1'), b'x' * 100)
+        self.assertEqual(other.get('ab1'), b'x' * 100)
+        self.assertEqual(other.stats()['disk_hits'], 1)
+        self.assertEqual(other.stats()['memory_hits'], 1)
+
+    def test_disk_eviction(self):
+        cache = ResultCache(self.tmpdir.name, memory_bytes=0, disk_bytes=250)
+        for i, key in enumerate(['k1', 'k2', 'k3']):
+            cache.put(key, b'x' * 100)
+            path = cache._path(key)
+            os.utime(path, (i, i))
+        cache._disk.evict()
+        self.assertIsNone(cache.get('k1'))
+        self.assertIsNotNone(cache.get('k3'))
+
+    def test_disk_scanned_only_when_needed(self):
+        cache = ResultCache(self.tmpdir.name, memory_bytes=0, disk_bytes=250)
+        with mock.patch('src.disk_lru.os.walk', wraps=os.walk) as walk:
+            cache.put('k1', b'x' * 100)
+            cache.put('k2', b'x' * 100)
+            # 首次寫入時掃描一次，之後只累計大小
+            self.assertEqual(walk.call_count, 1)
+            cache.put('k3', b'x' * 100)
+            self.assertEqual(walk.call_count, 2)
+        remaining = [key for key in ('k1', 'k2', 'k3') if os.path.exists(cache._path(key))]
+        self.assertEqual(len(remaining), 2)
+        self.assertIn('k3', remaining)
+
+    def test_disk_write_failure_ignored(self):
+        cache = ResultCache(self.tmpdir.name, memory_bytes=1024, disk_bytes=1024)
+        with mock.patch('src.result_cache.tempfile.mkstemp', side_effect=OSError('disk full')):
+            with self.assertLogs('src.result_cache', 'WARNING'):
+                cache.put('k1', b'data')
+        # 內存層仍然可用
+        self.assertEqual(cache.get('k1'), b'data')
+
+
+class TestConvertCache(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        from src.pipeline import ConversionPool
+        self.app_module = app_module
+        self.original = (app_module.POOL, app_module.CACHE)
+        app_module.POOL = ConversionPool(workers=0)
+        app_module.CACHE = ResultCache(disk_bytes=0)
+        self.client = app_module.app.test_client()
+        self.buffer = io.BytesIO()
+        build_chart(self.buffer)
+
+    def tearDown(self):
+        self.app_module.POOL, self.app_module.CACHE = self.original
+
+    def post(self, from_key, to_key):
+        return self.client.post('/api/convert', data={
+            'file': (io.BytesIO(self.buffer.getvalue()), 'chart.docx'), 'fromKey': from_key, 'toKey': to_key
+        }, content_type='multipart/form-data')
+
+    def test_hit_skips_conversion(self):
+        first = self.post('G', 'A')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        # 同樣的半音數命中緩存
+        second = self.post('C', 'D')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(Document(io.BytesIO(second.data)).paragraphs[0].text, 'A   E/G#   F#m7')
+        stats = self.client.get('/api/cache/stats').get_json()
+        self.assertEqual((stats['memory_hits'], stats['misses']), (1, 1))
+        # 緩存鍵使用接收上傳時算出的哈希，與按內容計算的相同
+        self.assertEqual(self.app_module.CACHE.get(make_key(self.buffer.getvalue(), 'G', 'A')), first.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
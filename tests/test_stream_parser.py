@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.enum.text import WD_BREAK, WD_COLOR_INDEX, WD_UNDERLINE
+from docx.shared import Pt, RGBColor
+from src.doc_parser import DocParser
+
+
+def build_sample_docx(path):
+    """生成包含和弦、表格、分节等元素的测试文档"""
+    doc = Document()
+    doc.add_heading('Amazing Grace', level=1)
+
+    para = doc.add_paragraph()
+    para.paragraph_format.line_spacing = 1.5
+    para.paragraph_format.space_before = Pt(6)
+    para.paragraph_format.first_line_indent = Pt(-12)
+    for text in ['G', '#', 'm7', ' ', 'D', 'b', '/', 'F', '#', '  Em7']:
+        run = para.add_run(text)
+        if text in ('#', 'b'):
+            run.font.superscript = True
+            run.font.size = Pt(8)
+    para.add_run('lyric').bold = True
+    para.add_run('x').italic = False
+
+    para = doc.add_paragraph('plain text without rPr')
+    run = para.add_run('red')
+    run.font.color.rgb = RGBColor(0xFF, 0, 0)
+    run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+    run.font.underline = WD_UNDERLINE.DOUBLE
+    run.font.name = 'Arial'
+    run = para.add_run('tab\tbreak')
+    run.add_break()
+    run.add_break(WD_BREAK.PAGE)
+    run.add_text('end')
+    para.add_run('sub').font.subscript = True
+    para.add_run('line').underline = True
+
+    table = doc.add_table(rows=3, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 1))
+    table.cell(1, 2).merge(table.cell(2, 2))
+    for i, row in enumerate(table.rows):
+        for j, cell in enumerate(row.cells):
+            if not cell.text:
+                cell.text = f'C{i}{j}'
+
+    doc.add_section(WD_SECTION.CONTINUOUS)
+    doc.add_paragraph('Second section', style='Quote')
+    doc.core_properties.title = '测试'
+    doc.core_properties.author = 'tester'
+    doc.save(path)
+
+
+class TestStreamParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, 'sample.docx')
+        build_sample_docx(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_stream_engine_matches_docx_engine(self):
+        expected = DocParser().parse_docx(self.path)
+        result = DocParser(engine='stream').parse_docx(self.path)
+        for key in expected:
+            self.assertEqual(result[key], expected[key], f"{key} 与 python-docx 引擎结果不一致")
+
+    def test_bundled_document(self):
+        path = os.path.join(os.path.dirname(__file__), '..', 'converted.docx')
+        expected = DocParser().parse_docx(path)
+        result = DocParser(engine='stream').parse_docx(path)
+        self.assertEqual(result, expected)
+
+    def test_in_memory_sources(self):
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        for engine in DocParser.ENGINES:
+            expected = DocParser(engine=engine).parse_docx(self.path)
+            self.assertEqual(DocParser(engine=engine).parse_docx(content), expected)
+            self.assertEqual(DocParser(engine=engine).parse_docx(io.BytesIO(content)), expected)
+
+    def test_iter_paragraphs(self):
+        for engine in DocParser.ENGINES:
+            parser = DocParser(engine=engine)
+            expected = parser.parse_docx(self.path)
+            tables = []
+            paragraphs = parser.iter_paragraphs(self.path, tables)
+            self.assertNotIsInstance(paragraphs, list)
+            self.assertEqual(list(paragraphs), expected['paragraphs'])
+            self.assertEqual(tables, expected['tables'])
+            properties = parser.parse_properties(self.path)
+            self.assertEqual(properties, {key: expected[key] for key in ('metadata', 'images', 'styles')})
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            DocParser(engine='sax')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from docx import Document
+from src.chord_transposer import ChordTransposer, Transposition
+from src.doc_parser import DocParser
+from src.doc_rebuilder import DocRebuilder
+from src.trace_hooks import collect_hook, print_hook
+
+
+class TestTraceHooks(unittest.TestCase):
+    def tearDown(self):
+        ChordTransposer.set_trace_hook(None)
+
+    def test_silent_by_default(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            ChordTransposer.transpose_text('G  D/F#', 'G', 'A')
+            DocParser().merge_chord_runs([{'text': 'G'}, {'text': '#'}])
+        self.assertEqual(output.getvalue(), '')
+
+    def test_transposer_events(self):
+        events = []
+        ChordTransposer.set_trace_hook(collect_hook(events))
+        ChordTransposer.transpose_text('G  D/F#', 'G', 'A')
+        names = [event for event, _ in events]
+        self.assertIn('transpose_chord', names)
+        self.assertEqual(events[-1], ('transpose_text', {
+            'text': 'G  D/F#', 'from_key': 'G', 'to_key': 'A', 'preserve_spaces': True, 'result': 'A  E/G#'
+        }))
+
+    def test_transposition_inherits_hook(self):
+        events = []
+        ChordTransposer.set_trace_hook(collect_hook(events))
+        transposition = Transposition('G', 'A')
+        events.clear()
+        transposition.transpose_text('G G G')
+        # 重复的和弦命中缓存，只追踪一次
+        self.assertEqual([event for event, _ in events], ['transpose_chord'])
+
+    def test_parser_and_rebuilder_events(self):
+        events = []
+        parser = DocParser(trace_hook=collect_hook(events))
+        runs = parser.merge_chord_runs([{'text': 'G'}, {'text': '#', 'superscript': True}])
+        self.assertEqual(runs[0]['text'], 'G#')
+        self.assertEqual(events[0][0], 'merge_accidental')
+
+        events.clear()
+        rebuilder = DocRebuilder(trace_hook=collect_hook(events))
+        rebuilder.rebuild_paragraph(Document(), {'style': 'Normal', 'runs': [{'text': 'Em7'}]})
+        self.assertEqual([event for event, _ in events], ['rebuild_paragraph', 'rebuild_run'])
+
+    def test_print_hook(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            print_hook('transpose_chord', chord='G', result='A')
+        self.assertEqual(output.getvalue(), "[transpose_chord] chord='G', result='A'\n")
+
+
+if __name__ == '__main__':
+    unittest.main()